@@ -4,28 +4,127 @@
 Enables Cypress <-> Redwood direct communication with conversation logging.
 """
 
-from flask import Flask, request, jsonify, render_template_string, send_from_directory
+from flask import Flask, Response, g, request, jsonify, redirect, render_template_string, send_file, stream_with_context
 from flask_cors import CORS
 from datetime import datetime
+import atexit
+import base64
+import gzip
+import hashlib
 import json
+import mimetypes
 import os
+import re
 import requests
 import threading
-import uuid
+import time
 from werkzeug.utils import secure_filename
+from dispatcher import WakeDispatcher
+from archive import Archive
+from metrics import REGISTRY, Counter, Gauge, Histogram
+from retention import RetentionPolicy
+from storage import open_store
+from thumbnails import Thumbnailer
+from tracing import TraceLog, breakdown, new_trace_id
+from uploads import BlobStore, UploadError
+
+try:
+    from flask_sock import Sock
+except ImportError:  # WebSocket push is optional; bridges fall back to long-polling
+    Sock = None
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
 
 app = Flask(__name__)
-CORS(app)
+CORS(app, expose_headers=["X-Next-Cursor"])
+app.config['SOCK_SERVER_OPTIONS'] = {'ping_interval': 25}
+sock = Sock(app) if Sock else None
 print("=== FOREST CHAT V2 CODE LOADED === delivered_to ACTIVE ===", flush=True)
 
 # Configuration
 DATA_DIR = os.path.expanduser("~/.forest-chat")
-MESSAGES_FILE = os.path.join(DATA_DIR, "messages.json")
+MESSAGES_FILE = os.path.join(DATA_DIR, "messages.json")  # legacy whole-file store, imported once
+MESSAGES_LOG = os.path.join(DATA_DIR, "messages.jsonl")
+MESSAGES_DB = os.path.join(DATA_DIR, "messages.db")
 UPLOADS_DIR = os.path.join(DATA_DIR, "uploads")
+THUMBS_DIR = os.path.join(UPLOADS_DIR, "thumbs")
+ARCHIVE_DIR = os.path.join(DATA_DIR, "archive")
+TRACE_LOG = os.path.join(DATA_DIR, "traces.jsonl")  # spans of each message's trip (see tracing.py)
+
+# HTTP listen port (dev server and serve.py; gunicorn.conf.py reads the same variable)
+HUB_PORT = int(os.environ.get("FOREST_PORT", "5001"))
+
+# Message storage backend: "jsonl" (in-memory + append-only log) or "sqlite".
+# Only sqlite can be shared by several worker processes (see gunicorn.conf.py).
+STORAGE_BACKEND = os.environ.get("FOREST_STORAGE", "jsonl")
+
+# Write-behind persistence for the message store: "always" fsyncs before a
+# send/read returns, "batch" fsyncs once per flush, "none" leaves it to the OS.
+STORAGE_DURABILITY = os.environ.get("FOREST_DURABILITY", "batch")
+STORAGE_FLUSH_INTERVAL = float(os.environ.get("FOREST_FLUSH_INTERVAL", "0.2"))  # seconds
+
+# How long a new hub process waits for an exiting one to release the jsonl
+# log (gunicorn reloads overlap them); keep it below gunicorn's timeout.
+STORAGE_LOCK_WAIT = float(os.environ.get("FOREST_LOCK_WAIT", "20"))  # seconds
+
+# Page size for paginated /api/messages queries (default / maximum)
+PAGE_DEFAULT_LIMIT = 100
+PAGE_MAX_LIMIT = 1000
+
+# /api/search page size
+SEARCH_DEFAULT_LIMIT = 20
+SEARCH_MAX_LIMIT = 100
+
+# JSON responses at least this large (bytes) are compressed when the client accepts it
+COMPRESS_MIN_SIZE = 1024
+
+# Longest a /api/read?wait=N long-poll may hold the request open (seconds)
+READ_MAX_WAIT = 60
+
+# Seconds between keep-alive comments on idle /api/stream connections
+STREAM_HEARTBEAT = 15
 
 # Max upload size: 25MB
 MAX_UPLOAD_SIZE = 25 * 1024 * 1024
 
+# Retention: messages older than FOREST_RETENTION_DAYS, or beyond the newest
+# FOREST_RETENTION_MAX, move to the compressed archive (0 = keep forever).
+# Each run also deletes uploads no live message references, once older than
+# FOREST_UPLOAD_GC_GRACE seconds. Runs every FOREST_RETENTION_INTERVAL seconds.
+RETENTION_DAYS = int(os.environ.get("FOREST_RETENTION_DAYS", "0"))
+RETENTION_MAX_MESSAGES = int(os.environ.get("FOREST_RETENTION_MAX", "0"))
+RETENTION_INTERVAL = float(os.environ.get("FOREST_RETENTION_INTERVAL", "3600"))
+UPLOAD_GC_GRACE = float(os.environ.get("FOREST_UPLOAD_GC_GRACE", str(24 * 3600)))
+
+# Image previews (needs Pillow): longest edge in pixels, and worker threads
+# generating them. Images already this small are shown as-is.
+THUMB_MAX_SIZE = 480
+THUMB_WORKERS = int(os.environ.get("FOREST_THUMB_WORKERS", "2"))
+
+# Uploaded files never change under a given name (new content gets a new
+# name), so clients may cache them for a year without revalidating.
+FILE_CACHE_MAX_AGE = 365 * 24 * 3600
+
+# Let a front proxy send file bytes instead of Python:
+#   ""                 - serve files from the hub (default)
+#   "x-sendfile"       - X-Sendfile header with the file path (Apache mod_xsendfile, lighttpd)
+#   "x-accel-redirect" - X-Accel-Redirect to FILE_ACCEL_PREFIX + path under uploads/ (nginx)
+FILE_SENDFILE = os.environ.get("FOREST_SENDFILE", "")
+FILE_ACCEL_PREFIX = os.environ.get("FOREST_ACCEL_PREFIX", "/_forest_uploads/")
+
+# Trace ids accepted from clients (e.g. a bridge posting a reply in the same trace)
+TRACE_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+# Most spans one POST /api/trace may report
+TRACE_MAX_SPANS = 500
+
+# Allowance for multipart boundaries and headers on top of MAX_UPLOAD_SIZE
+# when rejecting oversized form uploads from Content-Length alone
+MULTIPART_OVERHEAD = 64 * 1024
+
 # Webhook endpoints for waking up each bot
 WEBHOOKS = {
     "cypress": {
@@ -39,29 +138,69 @@ WEBHOOKS = {
         "token": None  # Will need to be set
     }
 }
+# FOREST_WEBHOOK_<BOT> overrides a bot's webhook URL (e.g. a local stub for benchmarks)
+for _bot, _hook in WEBHOOKS.items():
+    _hook["url"] = os.environ.get(f"FOREST_WEBHOOK_{_bot.upper()}", _hook["url"])
+
+# Wake-up webhook dispatch: bounded worker pool, per-target coalescing window
+# (seconds) and retries with exponential backoff (seconds, doubling).
+WAKE_WORKERS = int(os.environ.get("FOREST_WAKE_WORKERS", "4"))
+WAKE_COALESCE_WINDOW = float(os.environ.get("FOREST_WAKE_COALESCE", "0.5"))
+WAKE_MAX_RETRIES = int(os.environ.get("FOREST_WAKE_RETRIES", "3"))
+WAKE_RETRY_BACKOFF = float(os.environ.get("FOREST_WAKE_BACKOFF", "1.0"))
+
+# Seconds a message pushed on /ws/bridge may stay unacked before it is pushed
+# again on the same socket (bridges skip messages they are still handling).
+WS_ACK_TIMEOUT = float(os.environ.get("FOREST_WS_ACK_TIMEOUT", "300"))
 
 # Ensure data directories exist
 os.makedirs(DATA_DIR, exist_ok=True)
 os.makedirs(UPLOADS_DIR, exist_ok=True)
 
+store = open_store(
+    STORAGE_BACKEND, DATA_DIR,
+    durability=STORAGE_DURABILITY,
+    flush_interval=STORAGE_FLUSH_INTERVAL,
+    lock_wait=STORAGE_LOCK_WAIT,
+)
+atexit.register(store.close)
+
+app.config['USE_X_SENDFILE'] = FILE_SENDFILE == "x-sendfile"
+
+tracer = TraceLog(TRACE_LOG, "hub")
+atexit.register(tracer.close)
+
+blobs = BlobStore(UPLOADS_DIR, max_size=MAX_UPLOAD_SIZE)
+thumbnailer = Thumbnailer(UPLOADS_DIR, THUMBS_DIR, max_size=THUMB_MAX_SIZE, workers=THUMB_WORKERS)
+atexit.register(thumbnailer.shutdown)
+
+archive = Archive(ARCHIVE_DIR)
+retention = RetentionPolicy(
+    store, archive, UPLOADS_DIR, thumbs_dir=THUMBS_DIR,
+    max_age_days=RETENTION_DAYS,
+    max_messages=RETENTION_MAX_MESSAGES,
+    upload_grace=UPLOAD_GC_GRACE,
+    interval=RETENTION_INTERVAL,
+    lock_path=os.path.join(DATA_DIR, "retention.lock"),
+)
+if retention.enabled:
+    retention.start()
+    atexit.register(retention.stop)
+
 def load_messages():
     """Load conversation history."""
-    if os.path.exists(MESSAGES_FILE):
-        with open(MESSAGES_FILE, 'r') as f:
-            return json.load(f)
-    return []
-
-def save_messages(messages):
-    """Save conversation history."""
-    with open(MESSAGES_FILE, 'w') as f:
-        json.dump(messages, f, indent=2)
+    return store.all()
 
-def wake_bot(target, message_preview):
+def wake_bot(target, message_preview, session=None, trace_ids=()):
     """Send webhook to wake up target bot.
 
     For OpenClaw, prefer /hooks/agent over /hooks/wake so the bot can
-    immediately run an isolated turn to fetch & respond.
+    immediately run an isolated turn to fetch & respond. `session` is the
+    dispatcher's keep-alive session for the webhook host. The trace ids
+    of the messages being announced go into the payload, and the call is
+    logged as a "hub.wake" span in each of their traces.
     """
+    http = session or requests
     if target not in WEBHOOKS:
         return False
 
@@ -69,6 +208,10 @@ def wake_bot(target, message_preview):
     if not config["url"]:
         return False
 
+    started = time.perf_counter()
+    wall_started = time.time()
+    ok = False
+    trace_note = f" (trace {', '.join(trace_ids)})" if trace_ids else ""
     try:
         params = {}
         if config["token"]:
@@ -85,7 +228,8 @@ def wake_bot(target, message_preview):
                 "message": (
                     f"You have new Forest Chat message(s).\n\n"
                     f"Target bot: {target}\n"
-                    f"Message preview: {message_preview[:200]}\n\n"
+                    f"Message preview: {message_preview[:200]}\n"
+                    f"Trace: {', '.join(trace_ids) or '-'}\n\n"
                     f"Do the following:\n"
                     f"1) GET http://127.0.0.1:5002/api/read?for={target} to read unread messages\n"
                     f"2) Reply back into Forest Chat via POST http://127.0.0.1:5002/api/send with JSON: "
@@ -93,128 +237,493 @@ def wake_bot(target, message_preview):
                     f"Keep replies short and actionable."
                 ),
             }
-            resp = requests.post(config["url"], params=params, json=payload, timeout=10)
-            return resp.ok
+            resp = http.post(config["url"], params=params, json=payload, timeout=10)
+            ok = resp.ok
+            return ok
 
         # Fallback: legacy /hooks/wake
-        resp = requests.post(
+        resp = http.post(
             config["url"],
             params=params,
-            json={"text": f"[FOREST-CHAT] New message: {message_preview[:100]}", "mode": "now"},
+            json={"text": f"[FOREST-CHAT] New message: {message_preview[:100]}{trace_note}", "mode": "now"},
             timeout=5,
         )
-        return resp.ok
+        ok = resp.ok
+        return ok
     except Exception as e:
         print(f"Failed to wake {target}: {e}")
         return False
+    finally:
+        WAKE_CALLS.inc(target=target, result="ok" if ok else "failed")
+        WAKE_SECONDS.observe(time.perf_counter() - started, target=target)
+        tracer.record(trace_ids, "hub.wake", wall_started, time.time(), target=target, ok=ok,
+                      messages=len(trace_ids))
+
+wake_dispatcher = WakeDispatcher(
+    wake_bot,
+    url_for=lambda target: WEBHOOKS.get(target, {}).get("url"),
+    workers=WAKE_WORKERS,
+    coalesce_window=WAKE_COALESCE_WINDOW,
+    max_retries=WAKE_MAX_RETRIES,
+    retry_backoff=WAKE_RETRY_BACKOFF,
+)
+atexit.register(wake_dispatcher.shutdown)
+
+# ============ Metrics ============
+
+HTTP_REQUESTS = Counter("forest_http_requests_total", "HTTP requests by route and status",
+                        ["method", "route", "status"])
+HTTP_SECONDS = Histogram("forest_http_request_duration_seconds",
+                         "Time to produce a response (streams: until the first byte)", ["method", "route"])
+WAKE_CALLS = Counter("forest_wake_total", "Wake-up webhook calls by target and outcome", ["target", "result"])
+WAKE_SECONDS = Histogram("forest_wake_duration_seconds", "Wake-up webhook call latency", ["target"])
+UPLOADS = Counter("forest_uploads_total", "Completed uploads (deduplicated = content already stored)", ["result"])
+UPLOAD_BYTES = Counter("forest_upload_bytes_total", "Bytes received in completed uploads")
+Gauge("forest_messages", "Messages in the live store", collect=lambda: len(store))
+Gauge("forest_unread_messages", "Messages waiting for each bot's next /api/read", ["bot"],
+      collect=lambda: {(bot,): store.unread_count(bot) for bot in WEBHOOKS})
+Gauge("forest_wake_queued", "Wake-ups waiting for each target's next webhook", ["target"],
+      collect=lambda: {(t,): s["queued"] for t, s in wake_dispatcher.stats()["targets"].items()})
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_metrics(resp):
+    route = request.url_rule.rule if request.url_rule else "unmatched"  # templates keep label sets small
+    HTTP_REQUESTS.inc(method=request.method, route=route, status=resp.status_code)
+    started = g.get('request_started')
+    if started is not None:
+        HTTP_SECONDS.observe(time.perf_counter() - started, method=request.method, route=route)
+    return resp
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus metrics for this hub process."""
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+# ============ Conditional GET & compression ============
+
+COMPRESSORS = {
+    "br": lambda data: brotli.compress(data, quality=5),
+    "gzip": lambda data: gzip.compress(data, compresslevel=6),
+}
+
+def store_etag():
+    """Strong ETag for the current request: the store's change token plus the query.
+
+    Read it *before* building the response, so a change that races with
+    the read yields a stale tag (a harmless extra 200), never a stale 304.
+    """
+    key = hashlib.sha1(request.full_path.encode()).hexdigest()[:12]
+    return f"{store.version()}-{key}"
+
+def preferred_encoding():
+    """The compression compress_response() would use for this request, or None."""
+    accepted = request.accept_encodings
+    return next((e for e in ("br", "gzip") if accepted[e] and (e != "br" or brotli)), None)
+
+def not_modified(etag):
+    """304 response if the client already holds `etag`, else None.
+
+    Only the representation this request would get counts (compressed
+    with its preferred encoding, or uncompressed), and the 304 carries the
+    same ETag - with the encoding suffix - that the 200 had.
+    """
+    encoding = preferred_encoding()
+    for tag in ([f"{etag}-{encoding}"] if encoding else []) + [etag]:
+        if request.if_none_match.contains(tag):
+            resp = app.response_class(status=304)
+            resp.set_etag(tag)
+            resp.vary.add('Accept-Encoding')
+            return resp
+    return None
+
+@app.after_request
+def compress_response(resp):
+    """gzip/brotli-compress large JSON bodies for clients that accept it."""
+    if (resp.status_code != 200 or resp.mimetype != 'application/json' or resp.direct_passthrough
+            or resp.is_streamed or 'Content-Encoding' in resp.headers):
+        return resp
+    data = resp.get_data()
+    if len(data) < COMPRESS_MIN_SIZE:
+        return resp
+    encoding = preferred_encoding()
+    if encoding is None:
+        return resp
+    resp.set_data(COMPRESSORS[encoding](data))
+    resp.headers['Content-Encoding'] = encoding
+    resp.vary.add('Accept-Encoding')
+    # A strong validator must differ per representation
+    etag, weak = resp.get_etag()
+    if etag and not weak:
+        resp.set_etag(f"{etag}-{encoding}")
+    return resp
 
 # ============ API Endpoints ============
 
+PAGE_PARAMS = ('cursor', 'before_id', 'after_id', 'from', 'to', 'start', 'end', 'archive')
+
+def encode_cursor(state):
+    """Opaque page cursor: direction, boundary id and the active filters."""
+    return base64.urlsafe_b64encode(json.dumps(state, separators=(',', ':')).encode()).decode().rstrip('=')
+
+def decode_cursor(token):
+    try:
+        state = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+    except ValueError:
+        raise ValueError("Invalid cursor")
+    if (not isinstance(state, dict) or state.get('dir') not in ('before', 'after')
+            or not isinstance(state.get('id'), int) or isinstance(state['id'], bool)
+            or not all(isinstance(state.get(k), (str, type(None))) for k in ('from', 'to', 'start', 'end'))
+            or not (state.get('archive') is None or state['archive'] is True)):
+        raise ValueError("Invalid cursor")
+    return state
+
+def _iso_arg(value, name):
+    """Normalize a start/end bound to the naive local time messages are stamped with."""
+    if not value:
+        return None
+    try:
+        when = datetime.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"'{name}' must be an ISO 8601 timestamp")
+    if when.tzinfo is not None:
+        when = when.astimezone().replace(tzinfo=None)
+    return when.isoformat()
+
+def _page_request(args):
+    """Turn query args (or the cursor they carry) into store.page() arguments."""
+    if args.get('cursor'):
+        state = decode_cursor(args['cursor'])
+        filters = {k: state.get(k) for k in ('from', 'to', 'start', 'end', 'archive')}
+        before_id = state['id'] if state['dir'] == 'before' else None
+        after_id = state['id'] if state['dir'] == 'after' else None
+    else:
+        filters = {
+            'from': args.get('from') or None,
+            'to': args.get('to') or None,
+            'start': _iso_arg(args.get('start'), 'start'),
+            'end': _iso_arg(args.get('end'), 'end'),
+            'archive': args.get('archive', '').lower() in ('1', 'true') or None,
+        }
+        before_id = args.get('before_id', type=int)
+        after_id = args.get('after_id', type=int)
+        if after_id is None:
+            after_id = args.get('since', type=int)
+    return before_id, after_id, filters
+
+def history_page(before_id, after_id, filters, limit):
+    """store.page() - extended into the archive when filters['archive'] is set.
+
+    Archived ids all precede live ones, so paging forward reads the
+    archive and then the store, and paging back the other way round.
+    Live messages already copied to the archive (a retention run in
+    progress) are only returned from the archive.
+    """
+    query = dict(sender=filters['from'], recipient=filters['to'], start=filters['start'], end=filters['end'])
+    if not filters.get('archive'):
+        return store.page(before_id=before_id, after_id=after_id, limit=limit, **query)
+    
+    archived_through = archive.last_id()
+    if after_id is not None:
+        older = []
+        if after_id < archived_through:
+            older, more = archive.page(after_id=after_id, limit=limit, **query)
+            if more:
+                return older, True
+        live, more = store.page(after_id=max(after_id, archived_through), limit=limit - len(older), **query)
+        return older + live, more
+    
+    live, more = store.page(before_id=before_id, limit=limit, **query)
+    live = [m for m in live if m['id'] > archived_through]
+    if len(live) == limit:
+        if not more:
+            _, more = archive.page(before_id=live[0]['id'], limit=0, **query)
+        return live, more
+    below = live[0]['id'] if live else before_id
+    older, more = archive.page(before_id=below, limit=limit - len(live), **query)
+    return older + live, more
+
 @app.route('/api/messages', methods=['GET'])
 def get_messages():
-    """Get all messages, optionally filtered."""
-    messages = load_messages()
+    """Get messages, optionally filtered and paginated.
+
+    Without paging parameters this keeps the original since/limit
+    behaviour. With before_id/after_id, from/to/start/end or a cursor it
+    returns one page, oldest first, and - if more match - an opaque
+    X-Next-Cursor header that continues in the same direction with the
+    same filters. archive=true pages on into archived history.
+    """
     limit = request.args.get('limit', type=int)
     since_id = request.args.get('since', type=int)
     
-    if since_id:
-        messages = [m for m in messages if m.get('id', 0) > since_id]
-    if limit:
-        messages = messages[-limit:]
+    etag = store_etag()
+    cached = not_modified(etag)
+    if cached:
+        return cached
+    
+    if not any(k in request.args for k in PAGE_PARAMS):
+        resp = jsonify(store.query(since=since_id, limit=limit))
+        resp.set_etag(etag)
+        return resp
+    
+    try:
+        before_id, after_id, filters = _page_request(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    limit = min(max(limit or PAGE_DEFAULT_LIMIT, 1), PAGE_MAX_LIMIT)
+    
+    page, has_more = history_page(before_id, after_id, filters, limit)
+    resp = jsonify(page)
+    resp.set_etag(etag)
+    if has_more and page:
+        if after_id is not None:
+            state = {'dir': 'after', 'id': page[-1]['id']}
+        else:
+            state = {'dir': 'before', 'id': page[0]['id']}
+        resp.headers['X-Next-Cursor'] = encode_cursor({**state, **filters})
+    return resp
+
+@app.route('/api/search', methods=['GET'])
+def search_messages():
+    """Full-text search over message text, sender, recipient and attachment names.
+
+    Every word of `q` must match. Hits are ranked best first and paged
+    with offset/limit; `next_offset` is null on the last page.
+    """
+    query = request.args.get('q', '').strip()
+    if not query:
+        return jsonify({"error": "Query parameter 'q' required"}), 400
+    limit = min(max(request.args.get('limit', SEARCH_DEFAULT_LIMIT, type=int), 1), SEARCH_MAX_LIMIT)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    
+    etag = store_etag()
+    cached = not_modified(etag)
+    if cached:
+        return cached
     
-    return jsonify(messages)
+    hits, total = store.search(query, limit=limit, offset=offset)
+    resp = jsonify({
+        "query": query,
+        "total": total,
+        "results": [dict(m, score=round(score, 3)) for m, score in hits],
+        "next_offset": offset + len(hits) if offset + len(hits) < total else None,
+    })
+    resp.set_etag(etag)
+    return resp
 
 @app.route('/api/send', methods=['POST'])
 def send_message():
-    """Send a message from one bot to another."""
+    """Send a message from one bot to another.
+
+    Each message joins a trace: the client's `trace_id` if it passes one
+    (a bridge posting a reply), otherwise a new one.
+    """
+    started = time.time()
     data = request.json or {}
     
     sender = data.get('from', 'unknown')
     recipient = data.get('to', 'all')
     content = data.get('message', '')
     attachments = data.get('attachments', [])
+    trace_id = data.get('trace_id')
+    if not (isinstance(trace_id, str) and TRACE_ID_RE.match(trace_id)):
+        trace_id = new_trace_id()
     
     if not content and not attachments:
         return jsonify({"error": "Message content or attachments required"}), 400
     
-    messages = load_messages()
-    
-    # Create message object
+    # Create message object (the store assigns its id)
     msg = {
-        "id": len(messages) + 1,
         "from": sender,
         "to": recipient,
         "message": content,
         "timestamp": datetime.now().isoformat(),
         "delivered_to": {},
-        "attachments": attachments
+        "attachments": attachments,
+        "trace_id": trace_id,
     }
     
-    messages.append(msg)
-    save_messages(messages)
+    new_messages = [msg]
     
     # Optional: mirror bot messages to matthew so he can always see bot-to-bot convo
     # (CC style). This only mirrors messages sent by bots, and avoids mirroring
     # messages already addressed to matthew/all to prevent spam/loops.
     if sender in ("cypress", "redwood") and recipient not in ("matthew", "all"):
         mirror = {
-            "id": len(messages) + 1,
             "from": sender,
             "to": "matthew",
             "message": f"[CC:{recipient}] {content}",
             "timestamp": datetime.now().isoformat(),
             "delivered_to": {},
+            "trace_id": trace_id,
         }
-        messages.append(mirror)
-        save_messages(messages)
+        new_messages.append(mirror)
+
+    # Message and CC mirror are stored together with consecutive ids
+    msg = store.append(*new_messages)[0]
+    tracer.record(trace_id, "hub.send", started, time.time(), message_id=msg['id'], sender=sender, to=recipient)
 
-    # Wake up recipient bot (async to not block response)
-    if recipient != 'all' and recipient in WEBHOOKS:
-        threading.Thread(target=wake_bot, args=(recipient, content)).start()
-        msg["wake_sent"] = True
+    # Wake up recipient bot (queued on the dispatcher so the response isn't blocked)
+    if recipient != 'all' and recipient in WEBHOOKS and wake_dispatcher.submit(recipient, content, trace_id):
+        msg = dict(msg, wake_sent=True)  # response only - the stored copy stays clean
     
     return jsonify({"status": "sent", "message": msg})
 
 @app.route('/api/read', methods=['GET'])
 def read_messages():
-    """Read undelivered messages for a specific bot (per-bot delivery tracking)."""
+    """Read undelivered messages for a specific bot (per-bot delivery tracking).
+
+    With wait=<seconds> this is a long-poll: if nothing is unread, the
+    request is held open until a message arrives or the timeout expires.
+    """
     reader = request.args.get('for', '')
     mark_read = request.args.get('mark_read', 'true').lower() == 'true'
+    wait = min(max(request.args.get('wait', 0, type=float), 0), READ_MAX_WAIT)
     
     if not reader:
         return jsonify({"error": "Specify 'for' parameter"}), 400
     
-    messages = load_messages()
-    unread = []
+    # Long-poll: returns at once if something is already unread
+    if wait:
+        store.wait_unread(reader, wait)
     
-    for m in messages:
-        # Skip messages FROM this reader (don't echo back your own)
-        if m.get('from') == reader:
-            continue
-        
-        # Check if addressed to this reader or to "all"
-        if m['to'] != reader and m['to'] != 'all':
-            continue
-        
-        # Per-bot delivery tracking (backwards-compatible with old boolean)
-        delivered_to = m.get('delivered_to', {})
-        if isinstance(delivered_to, bool) or not isinstance(delivered_to, dict):
-            # Old format had global boolean â€” treat as empty dict
-            delivered_to = {}
-        if delivered_to.get(reader):
-            continue
-        
-        unread.append(m)
+    # A peek doesn't change anything, so it can be answered conditionally
+    etag = None
+    if not mark_read:
+        etag = store_etag()
+        cached = not_modified(etag)
+        if cached:
+            return cached
     
-    if mark_read and unread:
-        for m in messages:
-            if m['id'] in [u['id'] for u in unread]:
-                if 'delivered_to' not in m or not isinstance(m.get('delivered_to'), dict):
-                    m['delivered_to'] = {}
-                m['delivered_to'][reader] = True
-        save_messages(messages)
+    # Per-bot delivery tracking, served from the store's unread index
+    unread = store.unread(reader, mark_read=mark_read)
     
-    return jsonify(unread)
+    resp = jsonify(unread)
+    if etag:
+        resp.set_etag(etag)
+    return resp
+
+@app.route('/api/stream', methods=['GET'])
+def stream_messages():
+    """Server-Sent Events stream of new messages.
+
+    Resumes after the Last-Event-ID header (sent automatically by
+    EventSource on reconnect) or ?since=<id>; otherwise starts with the
+    next message. ?for=<name> limits the stream to messages addressed to
+    that name or to "all". Streaming never marks messages delivered.
+    """
+    recipient = request.args.get('for', '')
+    last_id = request.headers.get('Last-Event-ID', type=int)
+    if last_id is None:
+        last_id = request.args.get('since', type=int)
+    if last_id is None:
+        last_id = store.last_id()
+
+    def events(last_id):
+        yield "retry: 3000\n\n"
+        while True:
+            batch = store.query(since=last_id)
+            for m in batch:
+                last_id = m['id']
+                if recipient and m.get('to') not in (recipient, 'all'):
+                    continue
+                yield f"id: {m['id']}\nevent: message\ndata: {json.dumps(m)}\n\n"
+            if not batch and not store.wait_newer(last_id, STREAM_HEARTBEAT):
+                yield ": keep-alive\n\n"
+
+    return Response(
+        stream_with_context(events(last_id)),
+        mimetype='text/event-stream',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def _bridge_frame(raw):
+    """A bridge's frame as a dict, or None if it isn't a JSON object."""
+    try:
+        frame = json.loads(raw)
+    except (TypeError, ValueError):
+        return None
+    return frame if isinstance(frame, dict) else None
+
+def _reject_bridge(ws, error):
+    """Tell the bridge what was wrong with its frame, then hang up."""
+    try:
+        ws.send(json.dumps({"type": "error", "error": error}))
+        ws.close(reason=1008, message=error)
+    except Exception:
+        pass  # already gone
+
+def bridge_socket(ws):
+    """WebSocket push channel for bridges, with ack-based delivery.
+
+    Protocol (JSON text frames):
+      bridge -> {"type": "subscribe", "bot": "cypress"}
+      hub    -> {"type": "message", "message": {...}}   for each undelivered message
+      bridge -> {"type": "ack", "id": 42}              once the message is processed
+      hub    -> {"type": "error", "error": "..."}      before closing on a malformed frame
+
+    delivered_to is only set when the ack arrives. Anything still unacked
+    WS_ACK_TIMEOUT seconds after it was pushed, or when the socket drops,
+    is sent again, so delivery is at-least-once.
+    """
+    hello = _bridge_frame(ws.receive(timeout=10) or '{}')
+    bot = hello.get('bot') if hello else None
+    if hello is None or hello.get('type') != 'subscribe' or not isinstance(bot, str) or not bot:
+        _reject_bridge(ws, "send a subscribe frame first")
+        return
+    print(f"[WS] {bot} subscribed", flush=True)
+
+    errors = []
+    sent = {}  # id -> monotonic time pushed; dropped on ack
+    sent_lock = threading.Lock()  # keeps an ack from landing between unread() and the check
+
+    def receive_acks():
+        try:
+            while True:
+                frame = _bridge_frame(ws.receive())
+                if frame is None:
+                    errors.append("frames must be JSON objects")
+                    return
+                if frame.get('type') == 'ack':
+                    ids = frame['ids'] if 'ids' in frame else [frame.get('id')]
+                    if not isinstance(ids, list) or not all(isinstance(i, int) for i in ids):
+                        errors.append("an ack needs an integer 'id' or a list of integer 'ids'")
+                        return
+                    with sent_lock:
+                        store.mark_delivered(bot, ids)
+                        for i in ids:
+                            sent.pop(i, None)
+        except Exception:
+            pass  # connection closed - the push loop notices
+
+    acks = threading.Thread(target=receive_acks, daemon=True)
+    acks.start()
+
+    while acks.is_alive():
+        # Read the high-water mark first so nothing appended meanwhile is missed.
+        high = store.last_id()
+        now = time.monotonic()
+        with sent_lock:
+            unread = store.unread(bot)
+            due = [m for m in unread
+                   if m['id'] not in sent or now - sent[m['id']] >= WS_ACK_TIMEOUT]
+            # Forget ids delivered some other way (e.g. a long-poll of the same bot)
+            for i in sent.keys() - {m['id'] for m in unread}:
+                del sent[i]
+            sent.update((m['id'], now) for m in due)
+        for m in due:
+            ws.send(json.dumps({"type": "message", "message": m}))
+        store.wait_newer(high, 1.0)
+    if errors:
+        print(f"[WS] {bot} sent a bad frame: {errors[0]}", flush=True)
+        _reject_bridge(ws, errors[0])
+    print(f"[WS] {bot} disconnected", flush=True)
+
+if sock:
+    sock.route('/ws/bridge')(bridge_socket)
 
 @app.route('/api/config', methods=['GET', 'POST'])
 def config():
@@ -238,46 +747,188 @@ def config():
     
     return jsonify({"error": "Invalid target"}), 400
 
+@app.route('/api/retention', methods=['GET', 'POST'])
+def retention_status():
+    """Retention policy, archive size and the last run. POST runs the policy now."""
+    if request.method == 'POST':
+        if not retention.enabled:
+            return jsonify({"error": "No retention policy configured"}), 400
+        retention.run_once()
+    return jsonify(retention.stats())
+
+@app.route('/api/trace', methods=['POST'])
+def report_spans():
+    """Record spans measured elsewhere (a bridge's share of a message's trip)."""
+    spans = (request.get_json(silent=True) or {}).get('spans')
+    if not isinstance(spans, list) or len(spans) > TRACE_MAX_SPANS:
+        return jsonify({"error": f"'spans' must be a list of at most {TRACE_MAX_SPANS} spans"}), 400
+    accepted = []
+    for s in spans:
+        if not (isinstance(s, dict) and isinstance(s.get('trace_id'), str) and TRACE_ID_RE.match(s['trace_id'])
+                and isinstance(s.get('name'), str) and isinstance(s.get('start'), (int, float))
+                and isinstance(s.get('duration_ms'), (int, float))):
+            return jsonify({"error": "Each span needs trace_id, name, start and duration_ms"}), 400
+        accepted.append({**s, "service": str(s.get('service') or 'unknown')})
+    tracer.add(accepted)
+    return jsonify({"status": "recorded", "spans": len(accepted)})
+
+@app.route('/api/trace/<trace_id>', methods=['GET'])
+def get_trace(trace_id):
+    """End-to-end latency of one message's trip, broken down by hop."""
+    spans = tracer.spans(trace_id) if TRACE_ID_RE.match(trace_id) else []
+    if not spans:
+        return jsonify({"error": "Unknown trace"}), 404
+    return jsonify(breakdown(trace_id, spans))
+
+@app.route('/api/wake-stats', methods=['GET'])
+def wake_stats():
+    """Webhook dispatcher queue depth, delivery counters and latency."""
+    return jsonify(wake_dispatcher.stats())
+
 # ============ File Upload ============
 
+def upload_record(record):
+    """Response body for a stored upload: the blob record plus its content-addressed URL.
+
+    Images also get width/height, and - if larger than THUMB_MAX_SIZE -
+    a thumb_url whose thumbnail is generated in the background.
+    """
+    name = record['filename']
+    UPLOADS.inc(result="deduplicated" if record.get('deduplicated') else "stored")
+    UPLOAD_BYTES.inc(record['size'])
+    resp = {"status": "uploaded", **record, "url": f"/api/files/{name}"}
+    dims = thumbnailer.probe(name)
+    if dims:
+        resp['width'], resp['height'] = dims
+        if max(dims) > THUMB_MAX_SIZE:
+            thumbnailer.submit(name)
+            resp['thumb_url'] = f"/api/thumbs/{name}"
+    return resp
+
+def upload_error(e):
+    return jsonify({"error": str(e), **e.details}), e.status
+
 @app.route('/api/upload', methods=['POST'])
 def upload_file():
-    """Upload a file. Returns filename for use in attachments."""
-    if 'file' not in request.files:
-        return jsonify({"error": "No file provided"}), 400
-    
-    f = request.files['file']
-    if not f.filename:
-        return jsonify({"error": "Empty filename"}), 400
-    
-    # Check size
-    f.seek(0, 2)
-    size = f.tell()
-    f.seek(0)
-    if size > MAX_UPLOAD_SIZE:
+    """Upload a file. Returns filename for use in attachments.
+
+    Either a multipart form with a `file` field, or the raw file as the
+    request body with ?filename=. The body is streamed to disk while it
+    is hashed and stored once per content (see uploads.BlobStore); an
+    optional ?sha256= is verified. Oversized requests are refused from
+    Content-Length before any of the body is read.
+    """
+    multipart = request.mimetype == 'multipart/form-data'
+    limit = MAX_UPLOAD_SIZE + (MULTIPART_OVERHEAD if multipart else 0)
+    if request.content_length is not None and request.content_length > limit:
         return jsonify({"error": f"File too large (max {MAX_UPLOAD_SIZE // 1024 // 1024}MB)"}), 413
+    expected = request.args.get('sha256')
     
-    # Generate unique filename to avoid collisions
-    original = secure_filename(f.filename)
-    name, ext = os.path.splitext(original)
-    unique_name = f"{name}_{uuid.uuid4().hex[:8]}{ext}"
+    try:
+        if multipart:
+            if 'file' not in request.files:
+                return jsonify({"error": "No file provided"}), 400
+            f = request.files['file']
+            if not f.filename:
+                return jsonify({"error": "Empty filename"}), 400
+            record = blobs.save_stream(f.stream, f.filename, expected_sha256=expected)
+        else:
+            filename = request.args.get('filename', '')
+            if not filename:
+                return jsonify({"error": "Query parameter 'filename' required"}), 400
+            record = blobs.save_stream(request.stream, filename, expected_sha256=expected)
+    except UploadError as e:
+        return upload_error(e)
     
-    filepath = os.path.join(UPLOADS_DIR, unique_name)
-    f.save(filepath)
+    return jsonify(upload_record(record))
+
+@app.route('/api/uploads', methods=['POST'])
+def create_upload():
+    """Start a resumable chunked upload: {"filename", "size", "sha256"?}."""
+    data = request.json or {}
+    if not data.get('filename'):
+        return jsonify({"error": "filename required"}), 400
+    try:
+        session = blobs.create_session(data['filename'], data.get('size'), sha256=data.get('sha256'))
+    except UploadError as e:
+        return upload_error(e)
+    return jsonify(session), 201
+
+@app.route('/api/uploads/<upload_id>', methods=['GET', 'PATCH'])
+def upload_chunk(upload_id):
+    """GET: the offset to resume from. PATCH ?offset=N: append the body as the next chunk.
+
+    The chunk that completes the file stores it and returns the upload
+    record (as /api/upload does) under "upload".
+    """
+    try:
+        if request.method == 'GET':
+            return jsonify(blobs.session_status(upload_id))
+        offset = request.args.get('offset', type=int)
+        if offset is None:
+            return jsonify({"error": "Query parameter 'offset' required"}), 400
+        status = blobs.append_chunk(upload_id, offset, request.stream, length=request.content_length)
+    except UploadError as e:
+        return upload_error(e)
+    if 'upload' in status:
+        status['upload'] = upload_record(status['upload'])
+    return jsonify(status)
+
+CONTENT_ADDRESSED_RE = re.compile(r"^[0-9a-f]{32}$")
+
+def send_upload(relpath, thumbnail=False):
+    """Send a file under UPLOADS_DIR with immutable caching, ETag and Range support.
+
+    Content-addressed files use their hash as a strong ETag; a thumbnail
+    shares its original's hash, so it gets "<hash>-thumb-<bytes>". When a
+    proxy sends the bytes (FILE_SENDFILE), the hub still answers
+    If-None-Match with 304 and leaves Range handling to the proxy.
+    """
+    path = os.path.join(UPLOADS_DIR, relpath)
+    if not os.path.isfile(path):
+        return jsonify({"error": "Not found"}), 404
+    stem = os.path.splitext(os.path.basename(relpath))[0]
+    etag = stem if CONTENT_ADDRESSED_RE.match(stem) else True
+    if thumbnail and etag is not True:
+        etag = f"{stem}-thumb-{os.path.getsize(path)}"
     
-    return jsonify({
-        "status": "uploaded",
-        "filename": unique_name,
-        "original_name": f.filename,
-        "size": size,
-        "url": f"/api/files/{unique_name}"
-    })
+    if FILE_SENDFILE == "x-accel-redirect":
+        stat = os.stat(path)
+        resp = app.response_class(mimetype=mimetypes.guess_type(path)[0] or 'application/octet-stream')
+        resp.headers['X-Accel-Redirect'] = FILE_ACCEL_PREFIX + relpath
+        resp.set_etag(etag if etag is not True else f"{stat.st_mtime}-{stat.st_size}")
+        resp.last_modified = stat.st_mtime
+    else:
+        resp = send_file(path, etag=etag, max_age=FILE_CACHE_MAX_AGE, conditional=not FILE_SENDFILE)
+    if FILE_SENDFILE:
+        resp = resp.make_conditional(request)
+        if resp.status_code == 304:
+            resp.headers.pop('X-Accel-Redirect', None)
+            resp.headers.pop('X-Sendfile', None)
+    resp.cache_control.public = True
+    resp.cache_control.max_age = FILE_CACHE_MAX_AGE
+    resp.cache_control.immutable = True
+    resp.cache_control.no_cache = None
+    return resp
 
 @app.route('/api/files/<filename>')
 def serve_file(filename):
     """Serve an uploaded file."""
+    return send_upload(secure_filename(filename))
+
+@app.route('/api/thumbs/<filename>')
+def serve_thumbnail(filename):
+    """Serve the thumbnail of an uploaded image, waiting briefly if it is still being made.
+
+    Falls back to the original if no thumbnail can be produced.
+    """
     safe_name = secure_filename(filename)
-    return send_from_directory(UPLOADS_DIR, safe_name)
+    if not os.path.exists(os.path.join(UPLOADS_DIR, safe_name)):
+        return jsonify({"error": "Not found"}), 404
+    path = thumbnailer.path_for(safe_name)
+    if path is None:
+        return redirect(f"/api/files/{safe_name}")
+    return send_upload(os.path.relpath(path, UPLOADS_DIR), thumbnail=True)
 
 # ============ UI ============
 
@@ -346,6 +997,60 @@ CHAT_UI = """
             background: var(--accent);
             box-shadow: 0 0 6px rgba(74, 222, 128, 0.4);
         }
+        .header-right { display: flex; align-items: center; gap: 12px; }
+
+        /* Search */
+        .search-input {
+            width: 220px;
+            padding: 6px 10px;
+            background: var(--bg-input);
+            border: 1px solid var(--border);
+            border-radius: 8px;
+            color: var(--text-primary);
+            font-size: 0.85rem;
+            outline: none;
+        }
+        .search-input:focus { background: var(--bg-input-focus); border-color: var(--border-light); }
+        .search-panel {
+            position: relative;
+            flex-shrink: 0;
+        }
+        .search-results {
+            position: absolute;
+            top: 0; right: 20px;
+            width: min(520px, calc(100vw - 40px));
+            max-height: 60vh;
+            overflow-y: auto;
+            background: var(--bg-secondary);
+            border: 1px solid var(--border);
+            border-radius: 10px;
+            box-shadow: 0 8px 24px rgba(0, 0, 0, 0.4);
+            z-index: 10;
+        }
+        .search-summary {
+            padding: 8px 12px;
+            font-size: 0.75rem;
+            color: var(--text-muted);
+            border-bottom: 1px solid var(--border);
+        }
+        .search-hit {
+            padding: 8px 12px;
+            border-bottom: 1px solid var(--border);
+            font-size: 0.85rem;
+        }
+        .search-hit-meta { font-size: 0.72rem; color: var(--text-muted); margin-bottom: 3px; }
+        .search-hit-text { white-space: pre-wrap; word-wrap: break-word; color: var(--text-secondary); }
+        .search-hit mark { background: rgba(74, 222, 128, 0.25); color: var(--text-primary); border-radius: 2px; }
+        .search-more {
+            display: block;
+            width: 100%;
+            padding: 8px;
+            background: none;
+            border: none;
+            color: var(--accent);
+            cursor: pointer;
+            font-size: 0.8rem;
+        }
 
         /* Messages area */
         .messages-wrapper {
@@ -366,7 +1071,11 @@ CHAT_UI = """
         }
 
         /* Message groups */
-        .msg-group { margin-bottom: 20px; }
+        .msg-group {
+            margin-bottom: 20px;
+            content-visibility: auto;
+            contain-intrinsic-size: auto 120px;
+        }
         .msg-group-label {
             display: flex;
             align-items: center;
@@ -605,7 +1314,13 @@ CHAT_UI = """
                 <div class="header-subtitle">Cypress Â· Redwood Â· Matthew</div>
             </div>
         </div>
-        <div class="header-subtitle" id="msg-count"></div>
+        <div class="header-right">
+            <input type="search" class="search-input" id="search" placeholder="Search messages" autocomplete="off">
+            <div class="header-subtitle" id="msg-count"></div>
+        </div>
+    </div>
+    <div class="search-panel">
+        <div class="search-results" id="search-results" hidden></div>
     </div>
 
     <div class="messages-wrapper" id="messages-wrapper">
@@ -657,7 +1372,7 @@ CHAT_UI = """
 
     <script>
         let lastId = 0;
-        let allMessages = [];
+        let messageCount = 0;
         let pendingFiles = [];
         const wrapper = document.getElementById('messages-wrapper');
         const chat = document.getElementById('chat');
@@ -720,12 +1435,14 @@ CHAT_UI = """
         async function uploadFiles() {
             const results = [];
             for (const f of pendingFiles) {
-                const fd = new FormData();
-                fd.append('file', f);
-                const resp = await fetch('/api/upload', { method: 'POST', body: fd });
+                // Raw body, so the hub can stream it straight to disk
+                const resp = await fetch('/api/upload?filename=' + encodeURIComponent(f.name), { method: 'POST', body: f });
                 if (resp.ok) {
                     const data = await resp.json();
-                    results.push({ filename: data.filename, original_name: data.original_name, url: data.url, size: data.size });
+                    const att = { filename: data.filename, original_name: data.original_name, url: data.url, size: data.size };
+                    if (data.width) { att.width = data.width; att.height = data.height; }
+                    if (data.thumb_url) att.thumb_url = data.thumb_url;
+                    results.push(att);
                 }
             }
             pendingFiles = [];
@@ -743,121 +1460,258 @@ CHAT_UI = """
             return (bytes/1024/1024).toFixed(1) + ' MB';
         }
 
-        function renderMessages() {
-            if (allMessages.length === 0) {
-                emptyEl.style.display = 'flex';
-                return;
+        // Messages are appended to the DOM as they arrive; existing nodes are
+        // never rebuilt. At most MAX_RENDERED messages are kept in the DOM: the
+        // newest while following the conversation, a window around the reader
+        // while scrolling through history. Off-screen groups skip layout via
+        // content-visibility, so render cost stays constant.
+        const MAX_RENDERED = 300;
+        let renderedCount = 0;
+        let lastGroup = null;   // {from, to, el, timeEl} for the bottom-most group
+        let firstId = 0;        // oldest message id in the DOM
+        let lastRenderedId = 0; // newest message id in the DOM
+        let hasOlder = true;    // more history above it on the server
+        let hasNewer = false;   // messages up to lastId were trimmed off the bottom
+        let loadingOlder = false;
+        let loadingNewer = false;
+
+        function buildBubble(m) {
+            const bubble = document.createElement('div');
+            bubble.className = 'msg-bubble ' + m.from;
+            bubble.textContent = m.message;
+
+            // Render attachments
+            const atts = m.attachments || [];
+            if (atts.length) {
+                const attDiv = document.createElement('div');
+                attDiv.className = 'msg-attachments';
+                atts.forEach(a => {
+                    if (isImage(a.original_name || a.filename)) {
+                        const img = document.createElement('img');
+                        img.className = 'msg-img-preview';
+                        // The thumbnail, fetched only when scrolled near; the original opens on click
+                        img.src = a.thumb_url || a.url;
+                        img.loading = 'lazy';
+                        img.decoding = 'async';
+                        if (a.width && a.height) {
+                            // Reserve the preview's box (max 300x200) so lazy loads don't shift the layout
+                            const scale = Math.min(1, 300 / a.width, 200 / a.height);
+                            img.width = Math.round(a.width * scale);
+                            img.height = Math.round(a.height * scale);
+                        }
+                        img.alt = a.original_name || a.filename;
+                        img.onclick = () => window.open(a.url, '_blank');
+                        attDiv.appendChild(img);
+                    } else {
+                        const link = document.createElement('a');
+                        link.className = 'msg-attachment';
+                        link.href = a.url;
+                        link.target = '_blank';
+                        link.innerHTML = '<svg viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2"><path d="M14 2H6a2 2 0 00-2 2v16a2 2 0 002 2h12a2 2 0 002-2V8z"/><polyline points="14 2 14 8 20 8"/></svg> ' + (a.original_name || a.filename);
+                        if (a.size) link.innerHTML += ' <span style="opacity:0.5">' + formatSize(a.size) + '</span>';
+                        attDiv.appendChild(link);
+                    }
+                });
+                bubble.appendChild(attDiv);
             }
-            emptyEl.style.display = 'none';
-            countEl.textContent = allMessages.length + ' messages';
-
-            const scroll = shouldAutoScroll();
-            chat.innerHTML = '';
-            chat.appendChild(emptyEl);
-
-            let lastSender = null;
-            let lastTo = null;
-
-            allMessages.forEach((m, i) => {
-                const newGroup = m.from !== lastSender || m.to !== lastTo;
-                lastSender = m.from;
-                lastTo = m.to;
+            return bubble;
+        }
 
-                if (newGroup) {
-                    const group = document.createElement('div');
-                    group.className = 'msg-group';
+        function buildActions(m) {
+            const actions = document.createElement('div');
+            actions.className = 'msg-actions';
+            const copyBtn = document.createElement('button');
+            copyBtn.className = 'copy-btn';
+            copyBtn.textContent = 'Copy';
+            copyBtn.onclick = () => {
+                navigator.clipboard.writeText(m.message).then(() => {
+                    copyBtn.textContent = 'Copied!';
+                    copyBtn.classList.add('copied');
+                    setTimeout(() => { copyBtn.textContent = 'Copy'; copyBtn.classList.remove('copied'); }, 1500);
+                });
+            };
+            actions.appendChild(copyBtn);
+            return actions;
+        }
 
-                    const label = document.createElement('div');
-                    label.className = 'msg-group-label';
+        function startGroup(m) {
+            const group = document.createElement('div');
+            group.className = 'msg-group';
+            group.dataset.firstId = m.id;
+            group.dataset.from = m.from;
+            group.dataset.to = m.to;
+
+            const label = document.createElement('div');
+            label.className = 'msg-group-label';
+
+            const avatar = document.createElement('div');
+            avatar.className = 'msg-avatar ' + m.from;
+            avatar.textContent = getInitials(m.from);
+
+            const sender = document.createElement('div');
+            sender.className = 'msg-sender';
+            const toLabel = m.to === 'all' ? 'everyone' : m.to;
+            sender.innerHTML = m.from + ' <span class="arrow">â†’</span> <span class="target">' + toLabel + '</span>';
+
+            label.appendChild(avatar);
+            label.appendChild(sender);
+            group.appendChild(label);
+            return { from: m.from, to: m.to, el: group, timeEl: null };
+        }
 
-                    const avatar = document.createElement('div');
-                    avatar.className = 'msg-avatar ' + m.from;
-                    avatar.textContent = getInitials(m.from);
+        function addToGroup(group, m) {
+            group.el.appendChild(buildBubble(m));
+            group.el.appendChild(buildActions(m));
 
-                    const sender = document.createElement('div');
-                    sender.className = 'msg-sender';
-                    const toLabel = m.to === 'all' ? 'everyone' : m.to;
-                    sender.innerHTML = m.from + ' <span class="arrow">â†’</span> <span class="target">' + toLabel + '</span>';
+            // Time is shown once, under the newest message of the group
+            if (!group.timeEl) {
+                group.timeEl = document.createElement('div');
+                group.timeEl.className = 'msg-time';
+            }
+            group.timeEl.textContent = formatTime(m.timestamp);
+            group.el.appendChild(group.timeEl);
+            group.el.dataset.count = (+group.el.dataset.count || 0) + 1;
+            group.el.dataset.lastId = m.id;
+            renderedCount++;
+        }
 
-                    label.appendChild(avatar);
-                    label.appendChild(sender);
-                    group.appendChild(label);
-                    chat.appendChild(group);
-                }
+        function appendMessage(m) {
+            if (!lastGroup || m.from !== lastGroup.from || m.to !== lastGroup.to) {
+                lastGroup = startGroup(m);
+                chat.appendChild(lastGroup.el);
+            }
+            addToGroup(lastGroup, m);
+            if (!firstId) firstId = m.id;
+            lastRenderedId = m.id;
+        }
 
-                const bubble = document.createElement('div');
-                bubble.className = 'msg-bubble ' + m.from;
-                bubble.textContent = m.message;
-
-                // Render attachments
-                const atts = m.attachments || [];
-                if (atts.length) {
-                    const attDiv = document.createElement('div');
-                    attDiv.className = 'msg-attachments';
-                    atts.forEach(a => {
-                        if (isImage(a.original_name || a.filename)) {
-                            const img = document.createElement('img');
-                            img.className = 'msg-img-preview';
-                            img.src = a.url;
-                            img.alt = a.original_name || a.filename;
-                            img.onclick = () => window.open(a.url, '_blank');
-                            attDiv.appendChild(img);
-                        } else {
-                            const link = document.createElement('a');
-                            link.className = 'msg-attachment';
-                            link.href = a.url;
-                            link.target = '_blank';
-                            link.innerHTML = '<svg viewBox="0 0 24 24" fill="none" stroke="currentColor" stroke-width="2"><path d="M14 2H6a2 2 0 00-2 2v16a2 2 0 002 2h12a2 2 0 002-2V8z"/><polyline points="14 2 14 8 20 8"/></svg> ' + (a.original_name || a.filename);
-                            if (a.size) link.innerHTML += ' <span style="opacity:0.5">' + formatSize(a.size) + '</span>';
-                            attDiv.appendChild(link);
+        // Infinite scroll up: prepend the page of history before firstId
+        async function loadOlder() {
+            if (loadingOlder || !hasOlder || !firstId) return;
+            loadingOlder = true;
+            try {
+                const resp = await fetch('/api/messages?limit=100&archive=true&before_id=' + firstId);
+                const older = await resp.json();
+                if (older.length) {
+                    const frag = document.createDocumentFragment();
+                    let group = null;
+                    older.forEach(m => {
+                        if (!group || m.from !== group.from || m.to !== group.to) {
+                            group = startGroup(m);
+                            frag.appendChild(group.el);
                         }
+                        addToGroup(group, m);
                     });
-                    bubble.appendChild(attDiv);
+                    // Keep the visible messages in place while content grows above them
+                    const height = wrapper.scrollHeight;
+                    wrapper.style.scrollBehavior = 'auto';
+                    chat.insertBefore(frag, emptyEl.nextSibling);
+                    wrapper.scrollTop += wrapper.scrollHeight - height;
+                    wrapper.style.scrollBehavior = '';
+                    firstId = older[0].id;
+                    trimBottom();
                 }
+                hasOlder = resp.headers.has('X-Next-Cursor');
+            } catch (e) { /* silent */ }
+            loadingOlder = false;
+        }
 
-                chat.lastElementChild.appendChild(bubble);
-
-                const actions = document.createElement('div');
-                actions.className = 'msg-actions';
-                const copyBtn = document.createElement('button');
-                copyBtn.className = 'copy-btn';
-                copyBtn.textContent = 'Copy';
-                copyBtn.onclick = () => {
-                    navigator.clipboard.writeText(m.message).then(() => {
-                        copyBtn.textContent = 'Copied!';
-                        copyBtn.classList.add('copied');
-                        setTimeout(() => { copyBtn.textContent = 'Copy'; copyBtn.classList.remove('copied'); }, 1500);
-                    });
-                };
-                actions.appendChild(copyBtn);
-                chat.lastElementChild.appendChild(actions);
-
-                // Show time on last message or before a group change
-                const next = allMessages[i + 1];
-                if (!next || next.from !== m.from || next.to !== m.to) {
-                    const time = document.createElement('div');
-                    time.className = 'msg-time';
-                    time.textContent = formatTime(m.timestamp);
-                    chat.lastElementChild.appendChild(time);
-                }
-            });
+        // Scrolling back down after trimBottom(): append the next page after
+        // lastRenderedId until the DOM reaches the newest message again
+        async function loadNewer() {
+            if (loadingNewer || !hasNewer) return;
+            loadingNewer = true;
+            try {
+                const resp = await fetch('/api/messages?limit=100&archive=true&after_id=' + lastRenderedId);
+                const newer = (await resp.json()).filter(m => m.id <= lastId);
+                newer.forEach(appendMessage);
+                // Keep the visible messages in place while groups leave the top
+                const height = wrapper.scrollHeight;
+                wrapper.style.scrollBehavior = 'auto';
+                trimRendered();
+                wrapper.scrollTop -= height - wrapper.scrollHeight;
+                wrapper.style.scrollBehavior = '';
+                hasNewer = newer.length > 0 && lastRenderedId < lastId;
+            } catch (e) { /* silent */ }
+            loadingNewer = false;
+            // Still short of the newest and no scroll left to trigger the next page
+            if (hasNewer && shouldAutoScroll()) loadNewer();
+        }
+
+        wrapper.addEventListener('scroll', () => {
+            if (wrapper.scrollTop < 200) loadOlder();
+            if (hasNewer && wrapper.scrollHeight - wrapper.scrollTop - wrapper.clientHeight < 200) loadNewer();
+        });
+
+        function trimBottom() {
+            // Drop whole groups from the bottom while reading history, never the top one
+            let last = chat.lastElementChild;
+            while (renderedCount > MAX_RENDERED && last && last !== emptyEl.nextElementSibling) {
+                const prev = last.previousElementSibling;
+                renderedCount -= +last.dataset.count || 0;
+                last.remove();
+                last = prev;
+                hasNewer = true;
+            }
+            if (hasNewer) {
+                lastGroup = { from: last.dataset.from, to: last.dataset.to, el: last, timeEl: last.querySelector('.msg-time') };
+                lastRenderedId = +last.dataset.lastId;
+            }
+        }
+
+        function trimRendered() {
+            // Drop whole groups from the top, never the group being appended to
+            let first = emptyEl.nextElementSibling;
+            while (renderedCount > MAX_RENDERED && first && first !== lastGroup.el) {
+                const next = first.nextElementSibling;
+                renderedCount -= +first.dataset.count || 0;
+                first.remove();
+                first = next;
+                firstId = +first.dataset.firstId;
+                hasOlder = true;
+            }
+        }
+
+        function renderNew(messages) {
+            messages = messages.filter(m => m.id > lastId);
+            if (!messages.length) return;
+            emptyEl.style.display = 'none';
+            lastId = messages[messages.length - 1].id;
+            messageCount += messages.length;
+            countEl.textContent = messageCount + ' messages';
+            // The bottom of the DOM is trimmed away; loadNewer() brings these in
+            if (hasNewer) return;
+
+            const scroll = shouldAutoScroll();
+            messages.forEach(appendMessage);
 
+            // Only trim while following the bottom, so reading history never jumps
             if (scroll) {
+                trimRendered();
                 wrapper.scrollTop = wrapper.scrollHeight;
             }
         }
 
         async function loadMessages() {
             try {
-                const resp = await fetch('/api/messages?limit=500');
-                const messages = await resp.json();
-                if (messages.length !== allMessages.length) {
-                    allMessages = messages;
-                    renderMessages();
-                }
+                const url = lastId ? '/api/messages?since=' + lastId : '/api/messages?limit=500';
+                const resp = await fetch(url);
+                renderNew(await resp.json());
             } catch (e) { /* silent */ }
         }
 
+        // Push new messages over Server-Sent Events; the browser reconnects
+        // on its own and resumes from the last event id it saw.
+        let stream = null;
+        function startStream() {
+            if (!window.EventSource) {
+                setInterval(loadMessages, 3000);
+                return;
+            }
+            stream = new EventSource('/api/stream?since=' + lastId);
+            stream.addEventListener('message', (e) => renderNew([JSON.parse(e.data)]));
+        }
+
         async function sendMessage() {
             const sender = document.getElementById('sender').value;
             const recipient = document.getElementById('recipient').value;
@@ -878,11 +1732,87 @@ CHAT_UI = """
                 headers: {'Content-Type': 'application/json'},
                 body: JSON.stringify({from: sender, to: recipient, message: message, attachments: attachments})
             });
-            loadMessages();
+            if (!stream) loadMessages();
+        }
+
+        // Search box: debounced queries against /api/search, listed over the chat
+        const searchInput = document.getElementById('search');
+        const searchResults = document.getElementById('search-results');
+        let searchTimer = null;
+        let searchSeq = 0;
+
+        function escapeHtml(text) {
+            const div = document.createElement('div');
+            div.textContent = text;
+            return div.innerHTML;
+        }
+
+        function highlight(text, query) {
+            const terms = query.match(/[\\p{L}\\p{N}]+/gu);
+            if (!terms) return escapeHtml(text);
+            // Split on the terms (kept by the capture group), so odd parts are matches
+            const parts = text.split(new RegExp('(' + terms.join('|') + ')', 'giu'));
+            return parts.map((part, i) => i % 2 ? '<mark>' + escapeHtml(part) + '</mark>' : escapeHtml(part)).join('');
+        }
+
+        function buildSearchHit(m, query) {
+            const hit = document.createElement('div');
+            hit.className = 'search-hit';
+            const meta = document.createElement('div');
+            meta.className = 'search-hit-meta';
+            meta.textContent = m.from + ' \\u2192 ' + (m.to === 'all' ? 'everyone' : m.to) + ' \\u00b7 ' + new Date(m.timestamp).toLocaleString();
+            const text = document.createElement('div');
+            text.className = 'search-hit-text';
+            const names = (m.attachments || []).map(a => a.original_name || a.filename).join(', ');
+            text.innerHTML = highlight(m.message + (names ? '\\nAttachments: ' + names : ''), query);
+            hit.appendChild(meta);
+            hit.appendChild(text);
+            return hit;
+        }
+
+        async function runSearch(offset) {
+            const query = searchInput.value.trim();
+            const seq = ++searchSeq;
+            if (!query) {
+                searchResults.hidden = true;
+                return;
+            }
+            try {
+                const resp = await fetch('/api/search?limit=20&offset=' + offset + '&q=' + encodeURIComponent(query));
+                const data = await resp.json();
+                if (seq !== searchSeq) return;  // a newer query is already on its way
+                if (!offset) {
+                    searchResults.innerHTML = '';
+                    const summary = document.createElement('div');
+                    summary.className = 'search-summary';
+                    summary.textContent = data.total ? data.total + ' matches' : 'No matches';
+                    searchResults.appendChild(summary);
+                }
+                searchResults.querySelector('.search-more')?.remove();
+                (data.results || []).forEach(m => searchResults.appendChild(buildSearchHit(m, query)));
+                if (data.next_offset !== null && data.next_offset !== undefined) {
+                    const more = document.createElement('button');
+                    more.className = 'search-more';
+                    more.textContent = 'More results';
+                    more.onclick = () => runSearch(data.next_offset);
+                    searchResults.appendChild(more);
+                }
+                searchResults.hidden = false;
+            } catch (e) { /* silent */ }
         }
 
-        loadMessages();
-        setInterval(loadMessages, 3000);
+        searchInput.addEventListener('input', () => {
+            clearTimeout(searchTimer);
+            searchTimer = setTimeout(() => runSearch(0), 250);
+        });
+        searchInput.addEventListener('keydown', (e) => {
+            if (e.key === 'Escape') {
+                searchInput.value = '';
+                runSearch(0);
+            }
+        });
+
+        loadMessages().then(startStream);
         textarea.focus();
     </script>
 </body>
@@ -899,7 +1829,7 @@ def health():
     return jsonify({"status": "ok", "service": "forest-chat"})
 
 if __name__ == '__main__':
-    print("ðŸŒ² Forest Chat starting on port 5001...")
-    print(f"   Messages stored in: {MESSAGES_FILE}")
-    print(f"   UI available at: http://localhost:5001")
-    app.run(host='0.0.0.0', port=5001, debug=False)
+    print(f"ðŸŒ² Forest Chat starting on port {HUB_PORT} (development server - use serve.py in production)...")
+    print(f"   Messages stored in: {MESSAGES_DB if STORAGE_BACKEND == 'sqlite' else MESSAGES_LOG}")
+    print(f"   UI available at: http://localhost:{HUB_PORT}")
+    app.run(host='0.0.0.0', port=HUB_PORT, debug=False, threaded=True)
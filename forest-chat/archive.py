@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+"""
+🌲 Forest Chat Archive - Compressed, date-partitioned segments of old history
+Messages moved out of the live store by the retention policy are written
+to immutable gzip JSON-lines segments, one per day per archival run. A
+segment's name carries its date and id range, so a query opens only the
+segments that can hold matches.
+"""
+
+import gzip
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from storage import attachment_files
+
+# Decompressed segments kept in memory for repeated queries (e.g. scrolling back)
+SEGMENT_CACHE_SIZE = 8
+
+_SEGMENT_RE = re.compile(r"^(\d{4}-\d{2}-\d{2})_(\d{12})-(\d{12})\.jsonl\.gz$")
+
+
+class Segment:
+    def __init__(self, path, date, first_id, last_id):
+        self.path = path
+        self.date = date
+        self.first_id = first_id
+        self.last_id = last_id
+
+
+class Archive:
+    """Read/append access to the archive segments in `directory`.
+
+    Segments are written to a temp file and renamed into place, and are
+    never modified afterwards. An archival run skips ids already covered
+    by a segment, so re-running after a crash between archiving and
+    evicting doesn't duplicate messages.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()   # path -> list of messages
+        self._attachments = {}        # path -> upload names the segment references
+        self._scanned = None          # directory mtime at the last scan
+        self._segments = []
+        self._refresh()
+
+    def _refresh(self):
+        """Rescan if the directory changed (e.g. another hub process archived)."""
+        mtime = os.stat(self.directory).st_mtime_ns
+        if mtime != self._scanned:
+            segments = self._scan()
+            with self._lock:
+                self._segments = segments
+                self._scanned = mtime
+
+    def _scan(self):
+        segments = []
+        for name in os.listdir(self.directory):
+            match = _SEGMENT_RE.match(name)
+            if match:
+                segments.append(Segment(os.path.join(self.directory, name), match.group(1),
+                                        int(match.group(2)), int(match.group(3))))
+        segments.sort(key=lambda seg: seg.first_id)
+        return segments
+
+    def last_id(self):
+        """Highest archived message id (0 if the archive is empty)."""
+        self._refresh()
+        with self._lock:
+            return self._segments[-1].last_id if self._segments else 0
+
+    def stats(self):
+        self._refresh()
+        with self._lock:
+            return {
+                "segments": len(self._segments),
+                "bytes": sum(os.path.getsize(seg.path) for seg in self._segments),
+                "first_id": self._segments[0].first_id if self._segments else None,
+                "last_id": self._segments[-1].last_id if self._segments else None,
+            }
+
+    def append(self, messages):
+        """Archive messages (oldest first), one new segment per calendar day.
+
+        Messages at or below last_id() are skipped. Returns the number archived.
+        """
+        messages = [m for m in messages if m['id'] > self.last_id()]
+        days = OrderedDict()
+        for m in messages:
+            days.setdefault((m.get('timestamp') or '')[:10] or '0000-00-00', []).append(m)
+        for date, batch in days.items():
+            name = f"{date}_{batch[0]['id']:012d}-{batch[-1]['id']:012d}.jsonl.gz"
+            path = os.path.join(self.directory, name)
+            tmp = path + ".tmp"
+            with gzip.open(tmp, 'wt', encoding='utf-8') as f:
+                for m in batch:
+                    f.write(json.dumps(m, separators=(',', ':')) + '\n')
+            with open(tmp, 'rb') as f:
+                os.fsync(f.fileno())
+            os.replace(tmp, path)
+        self._refresh()
+        return len(messages)
+
+    def attachment_names(self):
+        """Names of the upload files referenced by archived messages.
+
+        Segments never change, so each one is read once per process.
+        """
+        self._refresh()
+        with self._lock:
+            segments = list(self._segments)
+        names = set()
+        for seg in segments:
+            found = self._attachments.get(seg.path)
+            if found is None:
+                with gzip.open(seg.path, 'rt', encoding='utf-8') as f:
+                    found = frozenset(name for line in f if line.strip()
+                                      for name in attachment_files(json.loads(line)))
+                with self._lock:
+                    self._attachments[seg.path] = found
+            names |= found
+        return names
+
+    def _read(self, seg):
+        with self._lock:
+            cached = self._cache.get(seg.path)
+            if cached is not None:
+                self._cache.move_to_end(seg.path)
+                return cached
+        with gzip.open(seg.path, 'rt', encoding='utf-8') as f:
+            messages = [json.loads(line) for line in f if line.strip()]
+        with self._lock:
+            self._cache[seg.path] = messages
+            while len(self._cache) > SEGMENT_CACHE_SIZE:
+                self._cache.popitem(last=False)
+        return messages
+
+    def page(self, before_id=None, after_id=None, sender=None, recipient=None,
+             start=None, end=None, limit=100):
+        """One page of archived messages matching the filters, oldest first.
+
+        Same semantics as MessageStore.page. Segments outside the id and
+        date bounds are skipped by name. Returns (messages, has_more).
+        """
+        forward = after_id is not None
+        self._refresh()
+        with self._lock:
+            segments = [
+                seg for seg in self._segments
+                if (after_id is None or seg.last_id > after_id)
+                and (before_id is None or seg.first_id < before_id)
+                and (not start or seg.date >= start[:10])
+                and (not end or seg.date <= end[:10])
+            ]
+        if not forward:
+            segments.reverse()
+
+        found = []
+        for seg in segments:
+            messages = self._read(seg)
+            for m in (messages if forward else reversed(messages)):
+                if after_id is not None and m['id'] <= after_id:
+                    continue
+                if before_id is not None and m['id'] >= before_id:
+                    continue
+                if sender is not None and m.get('from') != sender:
+                    continue
+                if recipient is not None and m.get('to') != recipient:
+                    continue
+                ts = m.get('timestamp', '')
+                if (start and ts < start) or (end and ts >= end):
+                    continue
+                found.append(m)
+                if len(found) > limit:
+                    break
+            if len(found) > limit:
+                break
+        has_more = len(found) > limit
+        found = found[:limit]
+        if not forward:
+            found.reverse()
+        return found, has_more
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+🌲 Forest Chat Benchmark - Hub throughput per serving mode
+Starts the hub in each serving mode against a throwaway data directory,
+seeds some history, then has concurrent clients hammer it with the mix a
+busy hub sees: UI history fetches, bot reads and sends. Prints one JSON
+line per mode with requests/second and latency percentiles, so the
+development server can be compared with serve.py and gunicorn.
+
+Usage:
+    python bench/load.py
+    python bench/load.py --modes dev waitress gunicorn --concurrency 32 --duration 20
+    python bench/load.py --modes gunicorn --workers 4     # gunicorn always uses sqlite
+"""
+
+import argparse
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from multiprocessing import Pool
+
+import requests
+
+HUB_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# (weight, method, path) - roughly what the UI and two bridges generate
+WORKLOAD = [
+    (6, "GET", "/api/messages?limit=50"),
+    (2, "GET", "/api/read?for=cypress"),
+    (2, "POST", "/api/send"),
+]
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_hub(mode, port, data_home, storage, workers, threads, extra_env=None, timeout=30):
+    """Start the hub in `mode` with ~/.forest-chat under `data_home`; returns once it answers /health."""
+    env = dict(os.environ, HOME=data_home, USERPROFILE=data_home, FOREST_PORT=str(port),
+               FOREST_STORAGE=storage, FOREST_WORKERS=str(workers), FOREST_THREADS=str(threads),
+               **(extra_env or {}))
+    if mode == "dev":
+        cmd = [sys.executable, "app.py"]
+    elif mode == "waitress":
+        cmd = [sys.executable, "serve.py", "--threads", str(threads)]
+    elif mode == "gunicorn":
+        cmd = [sys.executable, "-m", "gunicorn", "-c", "gunicorn.conf.py", "app:app"]
+    else:
+        raise ValueError(f"Unknown mode {mode!r}")
+    proc = subprocess.Popen(cmd, cwd=HUB_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"{mode} hub exited with {proc.returncode}")
+        try:
+            requests.get(f"http://127.0.0.1:{port}/health", timeout=1)
+            return proc
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    proc.kill()
+    raise RuntimeError(f"{mode} hub did not come up on port {port}")
+
+
+def client(args):
+    """One client process: issue requests until `until`; returns (latencies_ms, errors)."""
+    base, until, seed = args
+    rng = random.Random(seed)
+    choices = [(method, path) for weight, method, path in WORKLOAD for _ in range(weight)]
+    session = requests.Session()
+    latencies, errors = [], 0
+    while time.time() < until:
+        method, path = rng.choice(choices)
+        t0 = time.perf_counter()
+        try:
+            if method == "POST":
+                resp = session.post(base + path, json={"from": "matthew", "to": "all",
+                                                       "message": f"load test {rng.random()}"}, timeout=30)
+            else:
+                resp = session.get(base + path, timeout=30)
+            if resp.status_code >= 400:
+                errors += 1
+        except requests.RequestException:
+            errors += 1
+            continue
+        latencies.append((time.perf_counter() - t0) * 1000)
+    return latencies, errors
+
+
+def bench_mode(mode, args):
+    storage = "sqlite" if mode == "gunicorn" else args.storage
+    workers = args.workers if mode == "gunicorn" else 1
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    with tempfile.TemporaryDirectory() as data_home:
+        proc = start_hub(mode, port, data_home, storage, workers, args.threads)
+        try:
+            session = requests.Session()
+            for i in range(args.seed):
+                session.post(base + "/api/send", json={"from": "redwood", "to": "all", "message": f"seed {i}"})
+
+            until = time.time() + args.duration
+            with Pool(args.concurrency) as pool:
+                results = pool.map(client, [(base, until, n) for n in range(args.concurrency)])
+        finally:
+            proc.terminate()
+            try:
+                proc.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+
+    latencies = [ms for lat, _ in results for ms in lat]
+    return {
+        "mode": mode,
+        "storage": storage,
+        "workers": workers,
+        "concurrency": args.concurrency,
+        "requests": len(latencies),
+        "errors": sum(err for _, err in results),
+        "rps": round(len(latencies) / args.duration, 1),
+        "p50_ms": round(percentile(latencies, 50), 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 99), 2) if latencies else None,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the hub under each serving mode")
+    parser.add_argument("--modes", nargs="+", default=["dev", "waitress", "gunicorn"],
+                        choices=["dev", "waitress", "gunicorn"])
+    parser.add_argument("--storage", default="jsonl", choices=["jsonl", "sqlite"],
+                        help="store for the single-process modes")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="gunicorn worker processes")
+    parser.add_argument("--threads", type=int, default=32, help="request threads per server process")
+    parser.add_argument("--concurrency", type=int, default=16, help="client processes")
+    parser.add_argument("--duration", type=float, default=10, help="seconds of load per mode")
+    parser.add_argument("--seed", type=int, default=500, help="messages stored before the run")
+    args = parser.parse_args()
+
+    for mode in args.modes:
+        print(f"Benchmarking {mode}...", file=sys.stderr, flush=True)
+        print(json.dumps(bench_mode(mode, args)), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+🌲 Forest Chat Benchmark - API latency and throughput suite
+Seeds a throwaway data directory with a synthetic history, starts the hub
+on it with every bot's webhook pointed at a local fake server, then runs
+simulated bots and UI tabs against it for a fixed time:
+
+  bots  - poll /api/read for their own name and answer part of what they get
+  tabs  - refresh /api/messages, send to the bots (waking them) and upload files
+
+The report is one JSON document: p50/p95/p99 latency, throughput and
+errors per endpoint, plus how many wake-ups reached the fake webhook
+server and how long after the oldest message they announce. Clients tag
+each send with their own trace id and note when they sent it; the hub
+passes the ids on in the webhook payload. Save it with --output and pass it back
+with --compare on the next version to see what moved.
+
+Usage:
+    python bench/suite.py
+    python bench/suite.py --history 100000 --tabs 8 --bots 2 --duration 30 --output before.json
+    python bench/suite.py --history 100000 --tabs 8 --bots 2 --duration 30 --compare before.json
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import Pool
+
+import requests
+
+from load import HUB_DIR, free_port, percentile, start_hub
+
+# Bots with webhooks in app.WEBHOOKS; further simulated bots are named bench-bot-N
+BOTS = ["cypress", "redwood"]
+SENDERS = ["matthew", "bigc", "cypress", "redwood"]
+WORDS = ("crane schedule lumber delivery invoice permit site survey estimate pour concrete roof "
+         "framing inspection drywall trench excavator forecast rain safety meeting budget").split()
+
+# UI tab request mix: (weight, endpoint)
+TAB_MIX = [(6, "messages"), (3, "send"), (1, "upload")]
+
+# Trace ids in a wake-up: "(trace a, b)" in /hooks/wake text, "Trace: a, b" in /hooks/agent prompts
+_TRACE_RE = re.compile(r"(?:\(trace |Trace: )([A-Za-z0-9_-]+(?:, [A-Za-z0-9_-]+)*)")
+
+
+def synthetic_message(rng, msg_id, when):
+    sender = rng.choice(SENDERS)
+    msg = {
+        "id": msg_id,
+        "from": sender,
+        "to": rng.choice([b for b in BOTS + ["matthew", "all"] if b != sender]),
+        "message": " ".join(rng.choice(WORDS) for _ in range(rng.randint(3, 30))),
+        "timestamp": when.isoformat(),
+        "delivered_to": {bot: True for bot in BOTS},  # bots start with an empty inbox
+    }
+    if rng.random() < 0.05:
+        msg["attachments"] = [{"filename": f"{msg_id:032x}.pdf", "original_name": f"{rng.choice(WORDS)}.pdf",
+                               "url": f"/api/files/{msg_id:032x}.pdf", "size": 1024}]
+    return msg
+
+
+def seed_history(data_dir, size, seed=0):
+    """Write `size` messages spread over the last 30 days as a messages.jsonl log.
+
+    The sqlite backend imports the log on first start, so one seed serves both stores.
+    """
+    rng = random.Random(seed)
+    os.makedirs(data_dir, exist_ok=True)
+    start = datetime.now() - timedelta(days=30)
+    step = timedelta(days=30) / max(size, 1)
+    with open(os.path.join(data_dir, "messages.jsonl"), 'w', encoding='utf-8') as f:
+        f.write(json.dumps({"op": "seq", "next_id": size + 1}) + '\n')
+        for i in range(1, size + 1):
+            msg = synthetic_message(rng, i, start + step * i)
+            f.write(json.dumps({"op": "msg", "msg": msg}, separators=(',', ':')) + '\n')
+
+
+class FakeWebhooks:
+    """Local stand-in for the bots' OpenClaw webhooks; records when each wake-up
+    arrived and which messages (trace ids) it announced.
+    """
+
+    def __init__(self):
+        self.wakes = []  # (received, [trace ids])
+        self.calls = 0
+        self._lock = threading.Lock()
+        hooks = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+                received = time.time()
+                match = _TRACE_RE.search(body.decode('utf-8', 'replace'))
+                with hooks._lock:
+                    hooks.calls += 1
+                    hooks.wakes.append((received, match.group(1).split(", ") if match else []))
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', '2')
+                self.end_headers()
+                self.wfile.write(b'{}')
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.server.server_address[1]}/hooks/wake"
+        threading.Thread(target=self.server.serve_forever, name="fake-webhooks", daemon=True).start()
+
+    def delays(self, sent_at):
+        """Wake-up delays in ms, each from the oldest message in its batch
+        (`sent_at` maps trace id -> send time), and the number of wake-ups
+        that carried no trace id the clients sent.
+        """
+        delays_ms, untimed = [], 0
+        with self._lock:
+            wakes = list(self.wakes)
+        for received, trace_ids in wakes:
+            times = [sent_at[t] for t in trace_ids if t in sent_at]
+            if times:
+                delays_ms.append((received - min(times)) * 1000)
+            else:
+                untimed += 1
+        return delays_ms, untimed
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def _timed(results, endpoint, call):
+    t0 = time.perf_counter()
+    try:
+        resp = call()
+        ok = resp.status_code < 400
+    except requests.RequestException:
+        ok = False
+    stats = results.setdefault(endpoint, {"latencies": [], "errors": 0})
+    if ok:
+        stats["latencies"].append((time.perf_counter() - t0) * 1000)
+    else:
+        stats["errors"] += 1
+    return resp if ok else None
+
+
+def _send(session, base, results, sent_at, endpoint, payload):
+    """POST /api/send with a fresh trace id, noting when it was sent."""
+    trace_id = uuid.uuid4().hex[:16]
+    sent_at[trace_id] = time.time()
+    return _timed(results, endpoint, lambda: session.post(
+        f"{base}/api/send", json={**payload, "trace_id": trace_id}, timeout=30))
+
+
+def run_bot(base, name, until, seed, think, reply_rate):
+    """Poll like a bridge, and answer a share of what arrives.
+
+    Returns ({endpoint: stats}, {trace id: send time}).
+    """
+    rng = random.Random(seed)
+    session = requests.Session()
+    results, sent_at = {}, {}
+    while time.time() < until:
+        resp = _timed(results, "read", lambda: session.get(f"{base}/api/read", params={"for": name}, timeout=30))
+        for msg in (resp.json() if resp is not None else []):
+            if time.time() < until and rng.random() < reply_rate:
+                _send(session, base, results, sent_at, "send",
+                      {"from": name, "to": msg['from'], "message": f"ack {msg['id']}"})
+        time.sleep(think)
+    return results, sent_at
+
+
+def run_tab(base, until, seed, think, bots, upload_size):
+    """Refresh, send and upload like a busy web UI.
+
+    Returns ({endpoint: stats}, {trace id: send time}).
+    """
+    rng = random.Random(seed)
+    session = requests.Session()
+    choices = [endpoint for weight, endpoint in TAB_MIX for _ in range(weight)]
+    results, sent_at = {}, {}
+    while time.time() < until:
+        endpoint = rng.choice(choices)
+        if endpoint == "messages":
+            _timed(results, endpoint, lambda: session.get(f"{base}/api/messages", params={"limit": 50}, timeout=30))
+        elif endpoint == "send":
+            _send(session, base, results, sent_at, endpoint,
+                  {"from": "matthew", "to": rng.choice(bots), "message": " ".join(rng.choice(WORDS) for _ in range(8))})
+        else:
+            data = rng.randbytes(upload_size)
+            _timed(results, endpoint, lambda: session.post(
+                f"{base}/api/upload", params={"filename": "bench.bin"}, data=data,
+                headers={"Content-Type": "application/octet-stream"}, timeout=30))
+        time.sleep(think)
+    return results, sent_at
+
+
+def _client(job):
+    role, args = job
+    return run_bot(*args) if role == "bot" else run_tab(*args)
+
+
+def summarize(samples, errors, duration):
+    return {
+        "requests": len(samples),
+        "errors": errors,
+        "rps": round(len(samples) / duration, 1),
+        "p50_ms": round(percentile(samples, 50), 2) if samples else None,
+        "p95_ms": round(percentile(samples, 95), 2) if samples else None,
+        "p99_ms": round(percentile(samples, 99), 2) if samples else None,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=HUB_DIR, capture_output=True,
+                              text=True, timeout=5).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def run_suite(args):
+    bots = [BOTS[i] if i < len(BOTS) else f"bench-bot-{i + 1}" for i in range(args.bots)]
+    storage = "sqlite" if args.mode == "gunicorn" else args.storage
+    port = free_port()
+    base = f"http://127.0.0.1:{port}"
+    hooks = FakeWebhooks()
+    env = {f"FOREST_WEBHOOK_{bot.upper()}": hooks.url for bot in BOTS}
+    with tempfile.TemporaryDirectory() as data_home:
+        print(f"Seeding {args.history:,} messages...", file=sys.stderr, flush=True)
+        seed_history(os.path.join(data_home, ".forest-chat"), args.history)
+        proc = start_hub(args.mode, port, data_home, storage, args.workers, args.threads,
+                         extra_env=env, timeout=args.startup_timeout)
+        try:
+            print(f"Running {args.bots} bots and {args.tabs} tabs for {args.duration}s ({args.mode}, {storage})...",
+                  file=sys.stderr, flush=True)
+            until = time.time() + args.duration
+            jobs = [("bot", (base, bot, until, n, args.bot_think, args.reply_rate)) for n, bot in enumerate(bots)]
+            jobs += [("tab", (base, until, 1000 + n, args.tab_think, bots, args.upload_size)) for n in range(args.tabs)]
+            with Pool(len(jobs)) as pool:
+                results = pool.map(_client, jobs)
+            time.sleep(1)  # let wake-ups still in the coalescing window arrive
+        finally:
+            proc.terminate()
+            try:
+                proc.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+            hooks.close()
+
+    merged, sent_at = {}, {}
+    for result, sent in results:
+        sent_at.update(sent)
+        for endpoint, stats in result.items():
+            m = merged.setdefault(endpoint, {"latencies": [], "errors": 0})
+            m["latencies"].extend(stats["latencies"])
+            m["errors"] += stats["errors"]
+    all_samples = [ms for m in merged.values() for ms in m["latencies"]]
+    delays_ms, untimed = hooks.delays(sent_at)
+    return {
+        "version": git_revision(),
+        "config": {
+            "mode": args.mode, "storage": storage, "workers": args.workers if args.mode == "gunicorn" else 1,
+            "history": args.history, "bots": args.bots, "tabs": args.tabs, "duration": args.duration,
+            "upload_size": args.upload_size,
+        },
+        "endpoints": {endpoint: summarize(m["latencies"], m["errors"], args.duration)
+                      for endpoint, m in sorted(merged.items())},
+        "total": summarize(all_samples, sum(m["errors"] for m in merged.values()), args.duration),
+        "webhooks": {
+            "calls": hooks.calls,
+            "untimed": untimed,  # wake-ups carrying no known trace id
+            "p50_ms": round(percentile(delays_ms, 50), 2) if delays_ms else None,
+            "p99_ms": round(percentile(delays_ms, 99), 2) if delays_ms else None,
+        },
+    }
+
+
+def compare(report, baseline):
+    """Print rps and p95 changes per endpoint against an earlier report."""
+    print(f"Compared with {baseline.get('version') or 'baseline'}:", file=sys.stderr)
+    for endpoint, now in list(report["endpoints"].items()) + [("total", report["total"])]:
+        before = baseline.get("endpoints", {}).get(endpoint) if endpoint != "total" else baseline.get("total")
+        if not before or not before.get("rps") or not before.get("p95_ms") or now["p95_ms"] is None:
+            continue
+        rps = (now["rps"] - before["rps"]) / before["rps"] * 100
+        p95 = (now["p95_ms"] - before["p95_ms"]) / before["p95_ms"] * 100
+        print(f"  {endpoint:10} rps {before['rps']:>8} -> {now['rps']:<8} ({rps:+6.1f}%)   "
+              f"p95 {before['p95_ms']:>8.2f} ms -> {now['p95_ms']:<8.2f} ms ({p95:+6.1f}%)", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the hub API with simulated bots and UI tabs")
+    parser.add_argument("--history", type=int, default=10_000, help="messages seeded before the run")
+    parser.add_argument("--bots", type=int, default=2, help="simulated bots (the first two get webhooks)")
+    parser.add_argument("--tabs", type=int, default=4, help="simulated UI tabs")
+    parser.add_argument("--duration", type=float, default=15, help="seconds of traffic")
+    parser.add_argument("--bot-think", type=float, default=0.05, help="seconds a bot waits between polls")
+    parser.add_argument("--tab-think", type=float, default=0.0, help="seconds a tab waits between requests")
+    parser.add_argument("--reply-rate", type=float, default=0.5, help="share of received messages a bot answers")
+    parser.add_argument("--upload-size", type=int, default=64 * 1024, help="bytes per uploaded file")
+    parser.add_argument("--mode", default="waitress", choices=["dev", "waitress", "gunicorn"])
+    parser.add_argument("--storage", default="jsonl", choices=["jsonl", "sqlite"],
+                        help="store for the single-process modes (gunicorn always uses sqlite)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="gunicorn worker processes")
+    parser.add_argument("--threads", type=int, default=32, help="request threads per server process")
+    parser.add_argument("--startup-timeout", type=float, default=300, help="seconds to wait for the seeded hub")
+    parser.add_argument("--output", help="also write the JSON report to this file")
+    parser.add_argument("--compare", help="earlier JSON report to compare against")
+    args = parser.parse_args()
+
+    report = run_suite(args)
+    text = json.dumps(report, indent=2)
+    print(text, flush=True)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+🌲 Forest Chat Benchmark - /api/read latency vs history size
+Seeds a message log with N already-delivered messages, then times the
+unread lookup a bridge does on every poll: a few fresh messages arrive,
+the bot reads and marks them. With the per-reader unread index the
+latency should stay flat as N grows; the old full scan is shown alongside.
+
+Usage:
+    python bench/unread_index.py
+    python bench/unread_index.py --sizes 10000 100000 1000000 --rounds 200
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from storage import MessageLog, MessageStore  # noqa: E402
+
+READER = "cypress"
+
+
+def seed_log(path, size):
+    """Write `size` messages, all already delivered to READER, straight to a log file."""
+    with open(path, 'w', encoding='utf-8') as f:
+        for i in range(1, size + 1):
+            msg = {
+                "id": i,
+                "from": "redwood" if i % 2 else "matthew",
+                "to": READER if i % 3 else "all",
+                "message": f"synthetic message {i}",
+                "timestamp": "2026-01-01T00:00:00",
+                "delivered_to": {READER: True},
+            }
+            f.write(json.dumps({"op": "msg", "msg": msg}, separators=(',', ':')) + '\n')
+
+
+def full_scan_unread(messages, reader):
+    """The pre-index /api/read algorithm, for comparison."""
+    unread = []
+    for m in messages:
+        if m.get('from') == reader:
+            continue
+        if m['to'] != reader and m['to'] != 'all':
+            continue
+        if m.get('delivered_to', {}).get(reader):
+            continue
+        unread.append(m)
+    return unread
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def bench_size(size, rounds, batch):
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "messages.jsonl")
+        seed_log(path, size)
+        store = MessageStore(MessageLog(path), durability="none", flush_interval=1.0)
+        store.unread(READER)  # build the index once, as the first poll after startup would
+
+        next_id = size + 1
+        index_ms, scan_ms = [], []
+        for _ in range(rounds):
+            fresh = []
+            for _ in range(batch):
+                fresh.append({"id": next_id, "from": "redwood", "to": READER, "message": "ping",
+                              "timestamp": "2026-01-01T00:00:00", "delivered_to": {}})
+                next_id += 1
+            store.append(*fresh)
+
+            t0 = time.perf_counter()
+            full_scan_unread(store.all(), READER)
+            scan_ms.append((time.perf_counter() - t0) * 1000)
+
+            t0 = time.perf_counter()
+            got = store.unread(READER, mark_read=True)
+            index_ms.append((time.perf_counter() - t0) * 1000)
+            assert len(got) == batch, f"expected {batch} unread, got {len(got)}"
+        store.close()
+
+    return {
+        "messages": size,
+        "index_p50_ms": round(percentile(index_ms, 50), 4),
+        "index_p99_ms": round(percentile(index_ms, 99), 4),
+        "scan_p50_ms": round(percentile(scan_ms, 50), 4),
+        "scan_p99_ms": round(percentile(scan_ms, 99), 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark unread lookups against history size")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--rounds", type=int, default=50, help="read cycles per size")
+    parser.add_argument("--batch", type=int, default=3, help="new messages per read cycle")
+    args = parser.parse_args()
+
+    results = []
+    for size in args.sizes:
+        print(f"Seeding {size:,} messages...", file=sys.stderr, flush=True)
+        results.append(bench_size(size, args.rounds, args.batch))
+        print(json.dumps(results[-1]), flush=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,29 +1,82 @@
 #!/usr/bin/env python3
 """
-🌲 Forest Chat Bridge - Polls for messages and wakes OpenClaw
+🌲 Forest Chat Bridge - Receives messages from the hub and wakes OpenClaw
 Run this alongside forest-chat to automatically inject messages.
+
+Messages arrive over the hub's WebSocket push channel and are acked only
+after OpenClaw has handled them; without simple-websocket, or against a
+hub without /ws/bridge, the bridge long-polls /api/read instead.
+
+Up to FOREST_BRIDGE_WORKERS messages are handled at once, each with its
+own outbox file (reply-<message id>.json), so a slow reply only holds up
+its own message. With FOREST_BATCH set, a burst of messages is collected
+for FOREST_BATCH_WINDOW seconds and handed to OpenClaw as one turn.
+
+Received messages and unsent replies are journaled in a local SQLite
+queue (workqueue.py) until they are done, so a crash, reboot or hub
+outage loses neither; they are replayed on restart and retried with
+backoff.
 """
 
+import atexit
 import requests
 import subprocess
+import threading
 import time
 import os
 import sys
 import json
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from outbox import OutboxWatcher
+from tracing import TraceLog
+from workqueue import WorkQueue
+
+try:
+    from simple_websocket import Client as WebSocketClient
+except ImportError:
+    WebSocketClient = None
 
 # Configuration
 BOT_NAME = os.environ.get("FOREST_BOT_NAME", "redwood")  # default to redwood on this machine
 FOREST_CHAT_URL = os.environ.get("FOREST_CHAT_URL", "http://localhost:5001")
-POLL_INTERVAL = int(os.environ.get("POLL_INTERVAL", "5"))  # seconds
+POLL_INTERVAL = int(os.environ.get("POLL_INTERVAL", "5"))  # seconds; retry delay / fallback polling
+POLL_WAIT = int(os.environ.get("POLL_WAIT", "25"))  # seconds the hub holds /api/read open; 0 = plain polling
 TELEGRAM_GROUP = os.environ.get("TELEGRAM_GROUP", "")  # optional: mirror to telegram
+# "ws" (push + ack, default when simple-websocket is installed) or "poll"
+TRANSPORT = os.environ.get("FOREST_TRANSPORT", "ws" if WebSocketClient else "poll")
+# Messages handed to OpenClaw at the same time; more wait (unacked) at the hub
+WORKERS = int(os.environ.get("FOREST_BRIDGE_WORKERS", "4"))
+# "off", "sender" (one OpenClaw turn per sender's burst) or "window" (one turn per burst)
+BATCH_MODE = os.environ.get("FOREST_BATCH", "off")
+BATCH_WINDOW = float(os.environ.get("FOREST_BATCH_WINDOW", "2"))  # seconds to collect a batch
+BATCH_MAX = int(os.environ.get("FOREST_BATCH_MAX", "20"))  # messages per batch
+# Local span log; each message's spans are also reported to the hub's /api/trace
+TRACE_LOG = os.environ.get("FOREST_TRACE_LOG",
+                           os.path.expanduser(f"~/.forest-chat/bridge-{BOT_NAME}-traces.jsonl"))
+
+# Journal of messages being handled and replies not yet accepted by the hub
+QUEUE_PATH = os.environ.get("FOREST_BRIDGE_QUEUE",
+                            os.path.expanduser(f"~/.forest-chat/bridge-{BOT_NAME}-queue.db"))
+DRAIN_INTERVAL = 1.0  # seconds between checks for queued work that has come due
+
+TRACER = TraceLog(TRACE_LOG, f"bridge:{BOT_NAME}")
+atexit.register(TRACER.close)
+QUEUE = WorkQueue(QUEUE_PATH)
 
 def check_messages():
-    """Check for new messages addressed to this bot."""
+    """Check for new messages addressed to this bot.
+
+    Long-polls: the hub answers as soon as a message arrives, or with an
+    empty list after POLL_WAIT seconds.
+    """
     try:
         resp = requests.get(
             f"{FOREST_CHAT_URL}/api/read",
-            params={"for": BOT_NAME, "mark_read": "true"},
-            timeout=5
+            params={"for": BOT_NAME, "mark_read": "true", "wait": POLL_WAIT},
+            timeout=POLL_WAIT + 5
         )
         if resp.ok:
             return resp.json()
@@ -31,12 +84,15 @@ def check_messages():
         print(f"Error checking messages: {e}")
     return []
 
-def send_response(to, message):
-    """Send a response via Forest Chat."""
+def send_response(to, message, trace_id=None):
+    """Send a response via Forest Chat (in the trace of the message it answers)."""
+    payload = {"from": BOT_NAME, "to": to, "message": message}
+    if trace_id:
+        payload["trace_id"] = trace_id
     try:
         resp = requests.post(
             f"{FOREST_CHAT_URL}/api/send",
-            json={"from": BOT_NAME, "to": to, "message": message},
+            json=payload,
             timeout=5
         )
         return resp.ok
@@ -44,50 +100,195 @@ def send_response(to, message):
         print(f"Error sending response: {e}")
         return False
 
+def report_trace(trace_id):
+    """Send this bridge's spans for `trace_id` that the hub doesn't have yet (best effort)."""
+    spans = TRACER.unreported(trace_id)
+    if not trace_id or not spans:
+        return
+    try:
+        resp = requests.post(f"{FOREST_CHAT_URL}/api/trace", json={"spans": spans}, timeout=5)
+        if resp.ok:
+            TRACER.mark_reported(spans)
+    except Exception as e:
+        print(f"[TRACE] Could not report spans: {e}")
+
 OUTBOX_DIR = os.path.expanduser("~/.openclaw/workspace/forest-outbox")
-OUTBOX_FILE = os.path.join(OUTBOX_DIR, "reply.json")
+REPLY_TIMEOUT = 60  # seconds to wait for a reply before re-sending /hooks/agent once
+OUTBOX_MAX_AGE = 86400  # reply files never picked up are removed after this many seconds
+
+OUTBOX_WATCHER = OutboxWatcher(OUTBOX_DIR)
 
 
-def _read_outbox():
+def outbox_name(message_id):
+    """Outbox file for the reply to one message."""
+    return f"reply-{message_id if message_id is not None else uuid.uuid4().hex}.json"
+
+
+def _read_outbox(path):
     try:
-        if not os.path.exists(OUTBOX_FILE):
+        if not os.path.exists(path):
             return None
-        with open(OUTBOX_FILE, "r", encoding="utf-8") as f:
+        with open(path, "r", encoding="utf-8") as f:
             return f.read()
     except Exception:
         return None
 
 
-def wake_openclaw(message_text, sender):
-    """Wake OpenClaw with the message.
+def sweep_outbox(max_age=OUTBOX_MAX_AGE):
+    """Remove reply files (and unfinished .tmp files) nobody picked up."""
+    cutoff = time.time() - max_age
+    for name in os.listdir(OUTBOX_DIR):
+        path = os.path.join(OUTBOX_DIR, name)
+        try:
+            if name.startswith("reply") and os.path.getmtime(path) < cutoff:
+                os.remove(path)
+        except OSError:
+            pass
+
+
+def run_agent_turn(prompt, reply_name, trace_ids, parse, label):
+    """Run one OpenClaw turn and return its replies.
 
     Option 2B (deterministic):
-    - Ask OpenClaw (via /hooks/agent) to write a reply payload to OUTBOX_FILE.
-    - Bridge then reads OUTBOX_FILE and POSTS the reply into Forest Chat.
+    - Ask OpenClaw (via /hooks/agent) to write a reply payload to the
+      outbox file `reply_name` (to <file>.tmp first, then renamed over
+      <file>).
+    - Wait for that file to appear (OUTBOX_WATCHER) and read it.
+      `parse(data)` turns its JSON into a list of replies, or returns None
+      while it is not a complete answer yet. A file already there (written
+      after an earlier attempt for the same messages gave up, or before a
+      crash) is the answer, and OpenClaw is not woken again.
+
+    Re-sends /hooks/agent once if nothing arrives within REPLY_TIMEOUT.
+    Returns None if OpenClaw could not be woken or never answered. The
+    /hooks/agent calls and the wait are recorded as spans in `trace_ids`.
 
     Env vars:
       - OPENCLAW_URL (default http://127.0.0.1:18789)
       - OPENCLAW_TOKEN (required)
     """
-    print(f"[WAKE] Message from {sender}: {message_text}")
-
     openclaw_url = os.environ.get("OPENCLAW_URL", "http://127.0.0.1:18789").rstrip("/")
     token = os.environ.get("OPENCLAW_TOKEN")
     if not token:
         print("[WAKE] Missing OPENCLAW_TOKEN; cannot wake OpenClaw")
-        return False
+        return None
 
-    os.makedirs(OUTBOX_DIR, exist_ok=True)
+    reply_file = OUTBOX_WATCHER.path(reply_name)
+    payload = {
+        "name": "Forest Chat",
+        "sessionKey": f"hook:forest-chat:{BOT_NAME}",
+        "wakeMode": "now",
+        "deliver": False,
+        "message": prompt,
+    }
 
-    # Snapshot current outbox content so we can detect updates.
-    before = _read_outbox()
+    def call_hook(attempt):
+        with TRACER.span(trace_ids, "bridge.hook", attempt=attempt) as span:
+            resp = requests.post(
+                f"{openclaw_url}/hooks/agent",
+                headers={"Authorization": f"Bearer {token}"},
+                json=payload,
+                timeout=10,
+            )
+            span["status"] = resp.status_code
+        print(f"[WAKE] {label} OpenClaw /hooks/agent{' (retry)' if attempt > 1 else ''} -> {resp.status_code}")
+        return resp.ok
+
+    def read_replies():
+        raw = _read_outbox(reply_file)
+        if raw:
+            try:
+                return parse(json.loads(raw))
+            except ValueError as e:
+                # Written in place and not finished yet; wait for the next write.
+                print(f"[POSTBACK] {label} outbox not valid JSON yet ({e}); waiting")
+        return None
+
+    try:
+        replies = read_replies()
+        if replies is not None:
+            print(f"[POSTBACK] {label} reply already in the outbox")
+            return replies
+        if not call_hook(1):
+            return None
+
+        # Wait for the reply file to appear (allow longer; hooks/agent is async).
+        # Retry once if we time out.
+        for attempt in (1, 2):
+            if attempt == 2:
+                print(f"[POSTBACK] {label} timeout waiting for outbox reply; retrying /hooks/agent once")
+                call_hook(2)
+            wait_started = time.time()
+            deadline = time.monotonic() + REPLY_TIMEOUT
+            while True:
+                # Snapshot before reading, so a write landing in between still wakes the wait.
+                snapshot = OUTBOX_WATCHER.snapshot(reply_name)
+                replies = read_replies()
+                if replies is not None:
+                    TRACER.record(trace_ids, "bridge.reply_wait", wait_started, time.time(), attempt=attempt)
+                    return replies
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                OUTBOX_WATCHER.wait(reply_name, snapshot, remaining)
+            TRACER.record(trace_ids, "bridge.reply_wait", wait_started, time.time(), attempt=attempt, timed_out=True)
+
+        print(f"[POSTBACK] {label} timeout waiting for outbox reply")
+        return None
+
+    except Exception as e:
+        print(f"[WAKE] Error calling OpenClaw: {e}")
+        return None
+
+def _valid_reply(reply):
+    return isinstance(reply, dict) and bool(reply.get("to")) and bool(reply.get("message"))
+
+def post_replies(replies, reply_name, trace_for, label, message_ids):
+    """Queue OpenClaw's replies to `message_ids`, then POST them into Forest Chat.
+
+    Storing the replies and retiring the messages is one transaction, and
+    the outbox file is only removed after it, so a crash neither loses the
+    turn nor repeats it. Replies the hub doesn't accept now are re-sent
+    by drain_queue().
+    """
+    rows = QUEUE.complete(message_ids, [{"to": r["to"], "message": r["message"], "trace_id": trace_for(r)}
+                                        for r in replies])
+    try:
+        os.remove(OUTBOX_WATCHER.path(reply_name))
+    except OSError:
+        pass
+    deliver_replies(rows, label)
+    return True
+
+def deliver_replies(rows, label=""):
+    """POST queued replies; each leaves the queue once the hub accepts it."""
+    for row in rows:
+        with TRACER.span(row["trace_id"], "bridge.postback", to=row["to"], attempt=row["attempts"] + 1) as span:
+            sent = span["ok"] = send_response(row["to"], row["message"], row["trace_id"])
+        print(f"[POSTBACK] {label or 'queued'} -> {row['to']} ok={sent}")
+        if sent:
+            QUEUE.reply_sent(row["seq"])
+        else:
+            QUEUE.reply_failed(row["seq"])
+
+def wake_openclaw(message_text, sender, trace_id=None, message_id=None):
+    """Wake OpenClaw with the message and post its reply.
+
+    The reply goes to this message's own outbox file,
+    reply-<message_id>.json, as {"from", "to", "message"}.
+    """
+    print(f"[WAKE] #{message_id} Message from {sender}: {message_text}")
+    reply_name = outbox_name(message_id)
+    reply_file = OUTBOX_WATCHER.path(reply_name)
 
     prompt = (
         f"You are {BOT_NAME}. A message arrived in Forest Chat.\n\n"
         f"From: {sender}\n"
         f"Message: {message_text}\n\n"
-        f"Write EXACTLY ONE JSON object to this file (overwrite):\n"
-        f"{OUTBOX_FILE}\n\n"
+        f"Write EXACTLY ONE JSON object to this file:\n"
+        f"{reply_file}.tmp\n"
+        f"then rename it to (replacing any existing file):\n"
+        f"{reply_file}\n\n"
         f"JSON schema:\n"
         f"{{\"from\":\"{BOT_NAME}\",\"to\":\"{sender}\",\"message\":\"<reply>\"}}\n\n"
         f"Rules:\n"
@@ -96,85 +297,280 @@ def wake_openclaw(message_text, sender):
         f"- do not include extra keys\n"
     )
 
-    payload = {
-        "name": "Forest Chat",
-        "sessionKey": f"hook:forest-chat:{BOT_NAME}",
-        "wakeMode": "now",
-        "deliver": False,
-        "message": prompt,
-    }
+    label = f"#{message_id}"
+    replies = run_agent_turn(prompt, reply_name, trace_id,
+                             lambda data: [data] if _valid_reply(data) else None, label)
+    if replies is None:
+        return False
+    return post_replies(replies, reply_name, lambda reply: trace_id, label, [message_id])
 
-    try:
-        resp = requests.post(
-            f"{openclaw_url}/hooks/agent",
-            headers={"Authorization": f"Bearer {token}"},
-            json=payload,
-            timeout=10,
-        )
-        print(f"[WAKE] OpenClaw /hooks/agent -> {resp.status_code}")
-        if not resp.ok:
-            return False
+def wake_openclaw_batch(msgs):
+    """Wake OpenClaw once for several messages and post each of its replies.
 
-        # Wait for OUTBOX_FILE to change (allow longer; hooks/agent is async).
-        # Retry once if we time out.
-        for attempt in (1, 2):
-            deadline = time.time() + 60
-            while time.time() < deadline:
-                after = _read_outbox()
-                if after and after != before:
-                    try:
-                        data = json.loads(after)
-                        to = data.get("to")
-                        msg = data.get("message")
-                        if to and msg:
-                            ok = send_response(to, msg)
-                            print(f"[POSTBACK] -> {to} ok={ok}")
-                            if ok:
-                                try:
-                                    os.remove(OUTBOX_FILE)
-                                except OSError:
-                                    pass
-                            return ok
-                    except Exception as e:
-                        print(f"[POSTBACK] bad outbox json: {e}")
-                        return False
-                time.sleep(0.5)
-
-            if attempt == 1:
-                print("[POSTBACK] timeout waiting for outbox reply; retrying /hooks/agent once")
-                before = _read_outbox()
-                resp = requests.post(
-                    f"{openclaw_url}/hooks/agent",
-                    headers={"Authorization": f"Bearer {token}"},
-                    json=payload,
-                    timeout=10,
-                )
-                print(f"[WAKE] OpenClaw /hooks/agent (retry) -> {resp.status_code}")
-
-        print("[POSTBACK] timeout waiting for outbox reply")
-        return False
+    The replies go to one outbox file, reply-<first id>-<last id>.json, as
+    {"replies": [{"id", "to", "message"}, ...]}. Each reply joins the trace
+    of the message it names (or the sender's latest message).
+    """
+    first, last = msgs[0].get('id'), msgs[-1].get('id')
+    label = f"#{first}..#{last}"
+    print(f"[WAKE] {label} {len(msgs)} messages from {', '.join(dict.fromkeys(m.get('from', 'unknown') for m in msgs))}")
+    reply_name = outbox_name(f"{first}-{last}")
+    reply_file = OUTBOX_WATCHER.path(reply_name)
 
-    except Exception as e:
-        print(f"[WAKE] Error calling OpenClaw: {e}")
+    prompt = (
+        f"You are {BOT_NAME}. {len(msgs)} messages arrived in Forest Chat.\n\n"
+        + "".join(f"[{m.get('id')}] From: {m.get('from', 'unknown')}\n"
+                  f"Message: {m.get('message', '')}\n\n" for m in msgs)
+        + f"Write EXACTLY ONE JSON object to this file:\n"
+        f"{reply_file}.tmp\n"
+        f"then rename it to (replacing any existing file):\n"
+        f"{reply_file}\n\n"
+        f"JSON schema:\n"
+        f"{{\"replies\":[{{\"id\":<message id>,\"to\":\"<sender>\",\"message\":\"<reply>\"}}]}}\n\n"
+        f"Rules:\n"
+        f"- one entry per reply; id is the [number] of the message it answers\n"
+        f"- several messages from one sender may get a single reply (use the latest id)\n"
+        f"- use an empty list if nothing needs a reply\n"
+        f"- message must be plain text (no markdown fences)\n"
+        f"- keep it short\n"
+        f"- do not include extra keys\n"
+    )
+
+    def parse(data):
+        replies = data.get("replies") if isinstance(data, dict) else None
+        if not isinstance(replies, list):
+            return None
+        return [r for r in replies if _valid_reply(r)]
+
+    by_id = {str(m.get('id')): m.get('trace_id') for m in msgs}
+    by_sender = {m.get('from'): m.get('trace_id') for m in msgs}
+
+    def trace_for(reply):
+        return by_id.get(str(reply.get("id"))) or by_sender.get(reply["to"])
+
+    replies = run_agent_turn(prompt, reply_name, [m.get('trace_id') for m in msgs], parse, label)
+    if replies is None:
         return False
+    return post_replies(replies, reply_name, trace_for, label, [m.get('id') for m in msgs])
 
-def main():
-    print(f"Forest Chat Bridge starting for '{BOT_NAME}'")
-    print(f"   Polling: {FOREST_CHAT_URL}")
-    print(f"   Interval: {POLL_INTERVAL}s")
-    
-    while True:
-        messages = check_messages()
-        
-        for msg in messages:
+def handle_messages(msgs):
+    """Hand Forest Chat messages to OpenClaw - several as one turn - then report their spans to the hub."""
+    try:
+        if len(msgs) == 1:
+            msg = msgs[0]
             sender = msg.get('from', 'unknown')
             content = msg.get('message', '')
-            print(f"\n[MSG] New message from {sender}: {content[:50]}...")
-            
+            print(f"\n[MSG] #{msg.get('id')} New message from {sender}: {content[:50]}...")
             # Wake OpenClaw with the message
-            wake_openclaw(content, sender)
-        
+            return wake_openclaw(content, sender, msg.get('trace_id'), msg.get('id'))
+        print(f"\n[MSG] Batch of {len(msgs)} messages #{msgs[0].get('id')}..#{msgs[-1].get('id')}")
+        return wake_openclaw_batch(msgs)
+    finally:
+        for msg in msgs:
+            report_trace(msg.get('trace_id'))
+
+class Pipeline:
+    """Handles messages on a pool of `workers` threads.
+
+    submit() blocks while every worker is busy, so a burst waits at the hub
+    (unacked, or unread) rather than piling up in the bridge. A message the
+    hub sends again while it is still being handled, or shortly after, is
+    not handled twice.
+    """
+
+    def __init__(self, workers):
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="bridge-worker")
+        self._slots = threading.BoundedSemaphore(workers)
+        self._lock = threading.Lock()
+        self._active = set()
+        self._done = deque(maxlen=1000)
+
+    def claim(self, msg):
+        """Mark `msg` as taken. Returns "new", or "active"/"done" for a
+        message already seen (callers may ack a "done" one again).
+        """
+        msg_id = msg.get('id')
+        with self._lock:
+            if msg_id is not None and msg_id in self._active:
+                return "active"
+            if msg_id is not None and msg_id in self._done:
+                return "done"
+            self._active.add(msg_id)
+        return "new"
+
+    def submit(self, msgs, on_done=None):
+        """Handle claimed `msgs` as one OpenClaw turn; `on_done(msg)` runs for each afterwards."""
+        self._slots.acquire()
+        self._pool.submit(self._run, msgs, on_done)
+
+    def _run(self, msgs, on_done):
+        retrying = set()
+        try:
+            if not handle_messages(msgs):
+                # No reply from OpenClaw: leave them queued for drain_queue() to try again later.
+                retrying = QUEUE.retry_messages([m['id'] for m in msgs if m.get('id') is not None])
+        except Exception as e:
+            print(f"[MSG] #{msgs[0].get('id')} failed: {e}")
+            retrying = QUEUE.retry_messages([m['id'] for m in msgs if m.get('id') is not None])
+        finally:
+            with self._lock:
+                for msg in msgs:
+                    self._active.discard(msg.get('id'))
+                    if msg.get('id') not in retrying:
+                        self._done.append(msg.get('id'))
+            self._slots.release()
+        # Ack once finished or given up: re-delivering a permanently failing
+        # message would loop forever.
+        if on_done:
+            for msg in msgs:
+                if msg.get('id') not in retrying:
+                    on_done(msg)
+
+class Batcher:
+    """Groups messages into one OpenClaw turn (FOREST_BATCH).
+
+    The first message of a group starts a `window`-second timer. When it
+    fires, or once the group holds `max_size` messages, the group goes to
+    the pipeline as one turn. Mode "sender" groups per sender; "window"
+    puts everything arriving within the window together.
+    """
+
+    def __init__(self, pipeline, mode, window, max_size):
+        self.pipeline = pipeline
+        self.mode = mode
+        self.window = window
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._groups = {}
+
+    def add(self, msg, on_done=None):
+        key = (msg.get('from') if self.mode == "sender" else None, on_done)
+        with self._lock:
+            group = self._groups.setdefault(key, [])
+            group.append(msg)
+            if len(group) == 1:
+                timer = threading.Timer(self.window, self._flush, (key, group))
+                timer.daemon = True
+                timer.start()
+            full = len(group) >= self.max_size
+            if full:
+                del self._groups[key]
+        if full:
+            self.pipeline.submit(group, on_done)
+
+    def _flush(self, key, group):
+        with self._lock:
+            if self._groups.get(key) is not group:
+                return  # already sent when it filled up
+            del self._groups[key]
+        self.pipeline.submit(group, key[1])
+
+PIPELINE = Pipeline(WORKERS)
+BATCHER = Batcher(PIPELINE, BATCH_MODE, BATCH_WINDOW, BATCH_MAX) if BATCH_MODE in ("sender", "window") else None
+
+def dispatch(msg, transport, on_done=None):
+    """Queue a received message for OpenClaw; returns Pipeline.claim()'s verdict."""
+    state = PIPELINE.claim(msg)
+    if state == "new":
+        if msg.get('id') is not None:
+            QUEUE.add_message(msg)
+        TRACER.record(msg.get('trace_id'), "bridge.receive", time.time(), message_id=msg.get('id'), transport=transport)
+        if BATCHER:
+            BATCHER.add(msg, on_done)
+        else:
+            PIPELINE.submit([msg], on_done)
+    return state
+
+# The current push connection, shared with the workers that ack on it
+_socket = None
+_socket_lock = threading.Lock()
+_pending_acks = set()  # handled while the socket was down; acked after reconnecting
+
+def ack(msg):
+    """Ack a handled message on the current socket, or once it reconnects."""
+    with _socket_lock:
+        try:
+            _socket.send(json.dumps({"type": "ack", "id": msg["id"]}))
+        except Exception:
+            _pending_acks.add(msg["id"])
+
+def poll_once():
+    """One long-poll round against /api/read (messages are marked read on fetch)."""
+    started = time.time()
+    messages = check_messages()
+    
+    for msg in messages:
+        dispatch(msg, "poll")
+    
+    # An empty answer well before POLL_WAIT means an error or a hub
+    # without long-poll support - back off instead of spinning.
+    if not messages and time.time() - started < POLL_WAIT / 2:
         time.sleep(POLL_INTERVAL)
 
+def run_websocket():
+    """Receive pushed messages and ack each one once OpenClaw has handled it."""
+    global _socket
+    ws_url = FOREST_CHAT_URL.replace("https://", "wss://", 1).replace("http://", "ws://", 1) + "/ws/bridge"
+    ws = WebSocketClient.connect(ws_url)
+    try:
+        ws.send(json.dumps({"type": "subscribe", "bot": BOT_NAME}))
+        print(f"[WS] Subscribed at {ws_url}")
+        with _socket_lock:
+            _socket = ws
+            if _pending_acks:
+                ws.send(json.dumps({"type": "ack", "ids": sorted(_pending_acks)}))
+                _pending_acks.clear()
+        while True:
+            frame = json.loads(ws.receive())
+            if frame.get("type") == "error":
+                print(f"[WS] Hub rejected a frame: {frame.get('error')}")
+            if frame.get("type") != "message":
+                continue
+            if dispatch(frame["message"], "ws", on_done=ack) == "done":
+                ack(frame["message"])
+    finally:
+        with _socket_lock:
+            _socket = None
+        ws.close()
+
+def drain_queue():
+    """Replay queued messages and re-send queued replies as they come due (runs forever).
+
+    On startup this picks up whatever a crash or reboot left behind.
+    """
+    on_done = ack if TRANSPORT == "ws" and WebSocketClient else None
+    while True:
+        try:
+            for msg in QUEUE.due_messages():
+                dispatch(msg, "replay", on_done)
+            deliver_replies(QUEUE.due_replies())
+        except Exception as e:
+            print(f"[QUEUE] Drain failed: {e}")
+        time.sleep(DRAIN_INTERVAL)
+
+def main():
+    print(f"Forest Chat Bridge starting for '{BOT_NAME}'")
+    print(f"   Hub: {FOREST_CHAT_URL}")
+    print(f"   Transport: {TRANSPORT}")
+    print(f"   Outbox: {OUTBOX_DIR} ({OUTBOX_WATCHER.mode})")
+    print(f"   Workers: {WORKERS}")
+    if BATCHER:
+        print(f"   Batching: by {BATCH_MODE}, {BATCH_WINDOW}s window, up to {BATCH_MAX} messages")
+    print(f"   Long-poll wait: {POLL_WAIT}s (retry interval {POLL_INTERVAL}s)")
+    pending = QUEUE.stats()
+    print(f"   Queue: {QUEUE_PATH} ({pending['messages']} messages, {pending['replies']} replies pending)")
+    sweep_outbox()
+    threading.Thread(target=drain_queue, name="queue-drain", daemon=True).start()
+    
+    while True:
+        if TRANSPORT == "ws" and WebSocketClient:
+            try:
+                run_websocket()
+            except Exception as e:
+                # Hub unreachable or without /ws/bridge: do one long-poll
+                # round (which also paces retries), then try the socket again.
+                print(f"[WS] Connection failed or dropped: {e}; long-polling once")
+        poll_once()
+
 if __name__ == "__main__":
     main()
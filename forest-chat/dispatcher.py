@@ -0,0 +1,182 @@
+#!/usr/bin/env python3
+"""
+🌲 Forest Chat Wake Dispatcher - Pooled, coalescing webhook delivery
+Wake-ups for a bot that arrive within a short window are merged into one
+webhook, sent from a bounded worker pool over keep-alive sessions, and
+retried with exponential backoff.
+"""
+
+import heapq
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+import requests
+
+
+class _TargetState:
+    def __init__(self):
+        self.previews = []       # message previews waiting to be sent
+        self.trace_ids = []      # trace ids of the waiting messages
+        self.first_queued = None # when the oldest waiting preview was queued
+        self.due = None          # when the next webhook for this target may fire
+        self.attempt = 0         # retries already spent on the waiting batch
+        self.in_flight = False
+        self.sent = 0
+        self.failed = 0
+        self.retries = 0
+        self.coalesced = 0
+        self.latency_total = 0.0
+        self.latency_last = None
+
+
+class WakeDispatcher:
+    """Delivers wake-up webhooks on a bounded worker pool.
+
+    `send(target, preview, session, trace_ids)` performs one webhook call
+    for the messages with those trace ids and returns True on success;
+    `url_for(target)` returns the target's webhook URL (or None if it
+    has none). At most one webhook per target is in flight; anything
+    submitted meanwhile is coalesced into the next one.
+    """
+
+    def __init__(self, send, url_for, workers=4, coalesce_window=0.5, max_retries=3, retry_backoff=1.0):
+        self.send = send
+        self.url_for = url_for
+        self.workers = workers
+        self.coalesce_window = coalesce_window
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="forest-wake")
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._targets = {}
+        self._schedule = []      # heap of (due, target)
+        self._sessions = {}      # webhook host -> keep-alive requests.Session
+        self._closed = False
+        self._scheduler = threading.Thread(target=self._run, name="forest-wake-scheduler", daemon=True)
+        self._scheduler.start()
+
+    def session_for(self, url):
+        """Keep-alive session shared by every webhook on the same host."""
+        host = urlsplit(url).netloc
+        with self._lock:
+            session = self._sessions.get(host)
+            if session is None:
+                session = self._sessions[host] = requests.Session()
+            return session
+
+    def submit(self, target, preview, trace_id=None):
+        """Queue a wake-up for `target`. Returns False if it has no webhook."""
+        if not self.url_for(target):
+            return False
+        with self._lock:
+            state = self._targets.setdefault(target, _TargetState())
+            if state.previews:
+                state.coalesced += 1
+            else:
+                state.first_queued = time.monotonic()
+                if not state.in_flight:
+                    self._arm(target, state, time.monotonic() + self.coalesce_window)
+            state.previews.append(preview)
+            if trace_id:
+                state.trace_ids.append(trace_id)
+        return True
+
+    def _arm(self, target, state, due):
+        """Schedule the target's next webhook; caller holds the lock."""
+        state.due = due
+        heapq.heappush(self._schedule, (due, target))
+        self._cond.notify()
+
+    def _run(self):
+        with self._lock:
+            while not self._closed:
+                now = time.monotonic()
+                if not self._schedule:
+                    self._cond.wait()
+                    continue
+                due, target = self._schedule[0]
+                if due > now:
+                    self._cond.wait(due - now)
+                    continue
+                heapq.heappop(self._schedule)
+                state = self._targets[target]
+                if state.due != due or state.in_flight or not state.previews:
+                    continue  # superseded entry
+                previews, state.previews = state.previews, []
+                trace_ids, state.trace_ids = state.trace_ids, []
+                state.in_flight = True
+                state.due = None
+                self._pool.submit(self._deliver, target, previews, trace_ids, state.first_queued)
+
+    @staticmethod
+    def _combine(previews):
+        if len(previews) == 1:
+            return previews[0]
+        return f"{len(previews)} new messages. Latest: {previews[-1]}"
+
+    def _deliver(self, target, previews, trace_ids, first_queued):
+        url = self.url_for(target)
+        started = time.monotonic()
+        try:
+            ok = bool(url) and self.send(target, self._combine(previews), self.session_for(url), trace_ids)
+        except Exception as e:
+            print(f"[WAKE] Dispatcher error for {target}: {e}", flush=True)
+            ok = False
+        finished = time.monotonic()
+
+        with self._lock:
+            state = self._targets[target]
+            state.in_flight = False
+            state.latency_last = finished - started
+            state.latency_total += state.latency_last
+            if ok:
+                state.sent += 1
+                state.attempt = 0
+            elif state.attempt < self.max_retries:
+                # Put the batch back in front of anything queued meanwhile and retry later.
+                state.retries += 1
+                state.previews[:0] = previews
+                state.trace_ids[:0] = trace_ids
+                state.first_queued = first_queued
+                self._arm(target, state, finished + self.retry_backoff * 2 ** state.attempt)
+                state.attempt += 1
+                return
+            else:
+                state.failed += 1
+                state.attempt = 0
+            if state.previews:
+                self._arm(target, state, max(finished, state.first_queued + self.coalesce_window))
+
+    def stats(self):
+        """Queue depth plus per-target delivery counters and webhook latency."""
+        with self._lock:
+            targets = {}
+            for name, st in self._targets.items():
+                calls = st.sent + st.failed + st.retries
+                targets[name] = {
+                    "queued": len(st.previews),
+                    "in_flight": st.in_flight,
+                    "sent": st.sent,
+                    "failed": st.failed,
+                    "retries": st.retries,
+                    "coalesced": st.coalesced,
+                    "avg_latency_ms": round(st.latency_total / calls * 1000, 1) if calls else None,
+                    "last_latency_ms": round(st.latency_last * 1000, 1) if st.latency_last is not None else None,
+                }
+            return {
+                "workers": self.workers,
+                "queue_depth": sum(len(st.previews) for st in self._targets.values()),
+                "in_flight": sum(1 for st in self._targets.values() if st.in_flight),
+                "targets": targets,
+            }
+
+    def shutdown(self):
+        """Stop scheduling and wait for in-flight webhooks."""
+        with self._lock:
+            self._closed = True
+            self._cond.notify_all()
+        self._pool.shutdown(wait=True)
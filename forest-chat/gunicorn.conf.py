@@ -0,0 +1,52 @@
+"""
+🌲 Forest Chat - gunicorn configuration (Linux / macOS)
+Runs the hub as several worker processes, each serving requests on a pool
+of threads (the gthread worker, which the WebSocket push channel supports).
+
+    FOREST_STORAGE=sqlite gunicorn -c gunicorn.conf.py app:app
+
+Only the SQLite store can be shared between processes. With the jsonl
+store the history lives in one process's memory, so the hub is held to a
+single worker. On a reload (HUP) gunicorn starts the new worker before
+the old one exits; the new worker waits for the old one to release the
+jsonl log (FOREST_LOCK_WAIT seconds, within `timeout`) before it loads.
+The old worker lets go of it once it stops serving (worker_exit below),
+at the latest after graceful_timeout.
+"""
+
+import os
+import sys
+
+bind = f"0.0.0.0:{os.environ.get('FOREST_PORT', '5001')}"
+
+worker_class = "gthread"
+# Each open long-poll, /api/stream or WebSocket connection holds a thread
+threads = int(os.environ.get("FOREST_THREADS", "32"))
+workers = int(os.environ.get("FOREST_WORKERS", "0")) or os.cpu_count() or 1
+
+if os.environ.get("FOREST_STORAGE", "jsonl") != "sqlite" and workers > 1:
+    print(f"[SERVE] jsonl storage is single-process; starting 1 worker instead of {workers} "
+          "(set FOREST_STORAGE=sqlite for more)", flush=True)
+    workers = 1
+
+# Import the app in each worker, not the master: store connections and the
+# background threads (write-behind, wake dispatch, retention) must not cross a fork.
+preload_app = False
+
+# Streams never finish on their own; don't hold a restart for them long
+graceful_timeout = 10
+# A booting worker that hasn't checked in by now is killed. Leaves room for
+# a jsonl worker to wait out the graceful_timeout of the one it replaces.
+timeout = 30
+
+
+def worker_exit(server, worker):
+    """Flush and close the store as soon as the worker stops serving.
+
+    Threads still holding a stream open keep the process alive after
+    this, but the worker replacing it is already waiting for the store.
+    """
+    app = sys.modules.get("app")
+    if app is not None and hasattr(app, "store"):
+        app.store.close()
+keepalive = 5
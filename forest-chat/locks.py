@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+🌲 Forest Chat Locks - Advisory file locks shared between hub processes
+When the hub runs as several worker processes (gunicorn), in-process
+threading locks no longer cover everything: only one process may own the
+JSON-lines message log, run the retention policy, or append to a given
+upload session. These locks are held on a small side file and released
+by the OS if the holder dies. Works on POSIX (flock) and Windows (msvcrt).
+"""
+
+import os
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# How often a blocking acquire retries where the OS can't block for us (Windows)
+RETRY_INTERVAL = 0.05
+
+
+class FileLock:
+    """Exclusive lock on `path` (created if missing), usable as a context manager.
+
+    Each FileLock opens its own handle, so two FileLocks on the same path
+    exclude each other even within one process. Not reentrant.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+
+    @property
+    def locked(self):
+        return self._fd is not None
+
+    def acquire(self, blocking=True, timeout=None):
+        """Take the lock; with blocking=False return False at once if it is held elsewhere.
+
+        With a `timeout` (seconds), keep retrying that long before returning False.
+        """
+        if self._fd is not None:
+            raise RuntimeError(f"{self.path} is already locked by this FileLock")
+        deadline = time.monotonic() + timeout if blocking and timeout is not None else None
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            while not self._try_lock(fd, blocking and deadline is None):
+                if not blocking or (deadline is not None and time.monotonic() >= deadline):
+                    os.close(fd)
+                    return False
+                time.sleep(RETRY_INTERVAL)
+        except BaseException:
+            os.close(fd)
+            raise
+        self._fd = fd
+        return True
+
+    @staticmethod
+    def _try_lock(fd, blocking):
+        if fcntl:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+                return True
+            except BlockingIOError:
+                return False
+        try:
+            msvcrt.locking(fd, msvcrt.LK_NBLCK, 1)
+            return True
+        except OSError:
+            return False
+
+    def release(self):
+        if self._fd is None:
+            return
+        fd, self._fd = self._fd, None
+        try:
+            if fcntl:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(fd, 0, os.SEEK_SET)
+                msvcrt.locking(fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(fd)
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+        return False
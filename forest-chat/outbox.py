@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+🌲 Forest Chat Outbox Watcher - Notices OpenClaw's reply the moment it is written
+OpenClaw answers a wake-up by writing a JSON file into the forest-outbox
+directory. Instead of re-reading that file every half second, the bridge
+waits for filesystem change notifications: inotify on Linux (through
+ctypes, no extra dependency), or a cheap stat() poll elsewhere.
+
+Write protocol: write the reply to "<name>.tmp" in the outbox directory,
+then rename it to "<name>". The rename is atomic, so a reader never sees
+half a reply. Writers that overwrite the file in place still work: the
+change is reported when the file is closed, and a reply that does not
+parse yet is just waited on again.
+"""
+
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+import time
+
+# stat() interval where inotify is unavailable (Windows, macOS)
+POLL_INTERVAL = float(os.environ.get("FOREST_OUTBOX_POLL", "0.1"))
+
+# Change counters kept before they are reset (resets only cause spurious wake-ups)
+MAX_TRACKED_NAMES = 1024
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+
+# struct inotify_event: int wd; uint32_t mask, cookie, len; char name[len]
+_EVENT = struct.Struct("iIII")
+
+
+def _signature(path):
+    """What identifies this version of the file; an atomic rename changes the inode."""
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_ino, st.st_mtime_ns, st.st_size
+
+
+def _inotify_watch(directory):
+    """File descriptor of an inotify instance watching `directory`, or None if unavailable."""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    except (OSError, AttributeError):
+        return None
+    if fd < 0:
+        return None
+    if libc.inotify_add_watch(fd, os.fsencode(directory), IN_CLOSE_WRITE | IN_MOVED_TO) < 0:
+        os.close(fd)
+        return None
+    return fd
+
+
+class OutboxWatcher:
+    """Waits for files in `directory` to be written.
+
+    Take a snapshot() of a name before reading the file; if what you read
+    is not the reply yet, wait() on that snapshot. A change made between
+    the snapshot and the wait is not missed. Safe to share between threads.
+    """
+
+    def __init__(self, directory, poll_interval=POLL_INTERVAL, use_inotify=True):
+        self.directory = directory
+        self.poll_interval = poll_interval
+        os.makedirs(directory, exist_ok=True)
+        self._cond = threading.Condition()
+        self._generations = {}  # name -> changes reported by inotify
+        self._epoch = 0         # bumped when per-name counts can't be trusted
+        self._fd = _inotify_watch(directory) if use_inotify else None
+        if self._fd is not None:
+            threading.Thread(target=self._read_events, name="outbox-watcher", daemon=True).start()
+
+    @property
+    def mode(self):
+        return "inotify" if self._fd is not None else "poll"
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def snapshot(self, name):
+        with self._cond:
+            return self._epoch, self._generations.get(name, 0), _signature(self.path(name))
+
+    def wait(self, name, snapshot, timeout):
+        """Block until `name` changes after `snapshot`, or `timeout` seconds pass.
+
+        Returns True if it (probably) changed; callers re-read the file
+        either way.
+        """
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while not self._changed(name, snapshot):
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining if self._fd is not None else min(remaining, self.poll_interval))
+            return True
+
+    def _changed(self, name, snapshot):
+        epoch, generation, signature = snapshot
+        if self._fd is not None:
+            return self._epoch != epoch or self._generations.get(name, 0) != generation
+        return _signature(self.path(name)) != signature
+
+    def _read_events(self):
+        fd = self._fd
+        while True:
+            try:
+                select.select([fd], [], [])
+                data = os.read(fd, 64 * 1024)
+            except BlockingIOError:
+                continue
+            except OSError:
+                data = None
+            with self._cond:
+                if not data:
+                    self._stop_watching()
+                    return
+                offset = 0
+                while offset + _EVENT.size <= len(data):
+                    _, mask, _, length = _EVENT.unpack_from(data, offset)
+                    name = data[offset + _EVENT.size:offset + _EVENT.size + length].rstrip(b"\0")
+                    offset += _EVENT.size + length
+                    if mask & IN_IGNORED:
+                        # The directory itself went away; carry on by polling.
+                        print(f"[OUTBOX] Lost the watch on {self.directory}; polling instead", flush=True)
+                        self._stop_watching()
+                        return
+                    if mask & IN_Q_OVERFLOW:
+                        self._epoch += 1
+                    elif name:
+                        name = os.fsdecode(name)
+                        if name not in self._generations and len(self._generations) >= MAX_TRACKED_NAMES:
+                            self._generations.clear()
+                            self._epoch += 1
+                        self._generations[name] = self._generations.get(name, 0) + 1
+                self._cond.notify_all()
+
+    def _stop_watching(self):
+        """Fall back to polling (called with the condition held)."""
+        try:
+            os.close(self._fd)
+        except OSError:
+            pass
+        self._fd = None
+        self._epoch += 1
+        self._cond.notify_all()
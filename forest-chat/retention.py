@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+🌲 Forest Chat Retention - Keeps the live message store small
+Periodically moves messages older than N days (or beyond the newest N)
+from the live store into the compressed archive, then deletes upload
+files that no message - live or archived - references any more.
+"""
+
+import os
+import threading
+import time
+from contextlib import nullcontext
+from datetime import datetime, timedelta
+
+from locks import FileLock
+from thumbnails import THUMB_EXT
+
+# Messages copied into the archive per store.page() call
+ARCHIVE_BATCH = 5000
+
+
+class RetentionPolicy:
+    """Archives old messages out of `store` and garbage-collects uploads.
+
+    `max_age_days` and `max_messages` (0 = no limit) select what leaves
+    the store. Archiving always happens before eviction, and archive
+    segments skip ids they already hold, so an interrupted run is simply
+    finished by the next one. Upload files younger than `upload_grace`
+    seconds are never collected, so a file uploaded for a message that
+    hasn't been sent yet survives.
+
+    With `lock_path`, runs are also serialized across hub processes, and
+    only the process holding `lock_path`.leader runs the schedule; the
+    others keep trying each interval and take over if it exits.
+    """
+
+    def __init__(self, store, archive, uploads_dir, thumbs_dir=None, max_age_days=0, max_messages=0,
+                 upload_grace=24 * 3600, interval=3600, lock_path=None):
+        self.store = store
+        self.archive = archive
+        self.uploads_dir = uploads_dir
+        self.thumbs_dir = thumbs_dir
+        self.max_age_days = max_age_days
+        self.max_messages = max_messages
+        self.upload_grace = upload_grace
+        self.interval = interval
+        self.last_run = None
+        self._lock = threading.Lock()     # one run at a time
+        self.lock_path = lock_path
+        self._leader = FileLock(lock_path + ".leader") if lock_path else None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def enabled(self):
+        return bool(self.max_age_days or self.max_messages)
+
+    def run_once(self):
+        """Apply the policy now; returns a summary of what was done."""
+        with self._lock, (FileLock(self.lock_path) if self.lock_path else nullcontext()):
+            started = time.monotonic()
+            archived, evicted = self._archive_old()
+            files, freed = self._collect_uploads()
+            self.last_run = {
+                "at": datetime.now().isoformat(),
+                "archived": archived,
+                "evicted": evicted,
+                "files_removed": files,
+                "bytes_freed": freed,
+                "duration_ms": round((time.monotonic() - started) * 1000, 1),
+            }
+            if archived or evicted or files:
+                print(f"[RETENTION] Archived {archived}, evicted {evicted} messages; "
+                      f"removed {files} unreferenced uploads ({freed} bytes)", flush=True)
+            return self.last_run
+
+    def _archive_old(self):
+        before = None
+        if self.max_age_days:
+            before = (datetime.now() - timedelta(days=self.max_age_days)).isoformat()
+        through = self.store.retention_cutoff(before=before, keep=self.max_messages or None)
+        if not through:
+            return 0, 0
+
+        archived = 0
+        after = self.archive.last_id()
+        while after < through:
+            batch, _ = self.store.page(after_id=after, before_id=through + 1, limit=ARCHIVE_BATCH)
+            if not batch:
+                break
+            archived += self.archive.append(batch)
+            after = batch[-1]['id']
+        return archived, self.store.evict_through(through)
+
+    def _collect_uploads(self):
+        # Archived history is still served (?archive=true), so its files stay
+        referenced = self.store.attachment_names() | self.archive.attachment_names()
+        cutoff = time.time() - self.upload_grace
+        removed = freed = 0
+        for entry in os.scandir(self.uploads_dir):
+            if entry.name.startswith('.') and entry.name.endswith('.gc') and entry.is_file():
+                os.remove(entry.path)  # left behind by an interrupted run
+                continue
+            if entry.name.startswith('.') or not entry.is_file() or entry.name in referenced:
+                continue
+            if entry.stat().st_mtime >= cutoff:
+                continue
+            # Move it aside before deciding: an upload of the same content can
+            # rename a fresh copy over it at any moment.
+            doomed = os.path.join(self.uploads_dir, f".{entry.name}.gc")
+            try:
+                os.replace(entry.path, doomed)
+            except FileNotFoundError:
+                continue
+            stat = os.stat(doomed)
+            if stat.st_mtime >= cutoff:
+                os.replace(doomed, entry.path)  # just uploaded again; same bytes, put it back
+                continue
+            os.remove(doomed)
+            removed += 1
+            freed += stat.st_size
+            if self.thumbs_dir:
+                thumb = os.path.join(self.thumbs_dir, os.path.splitext(entry.name)[0] + THUMB_EXT)
+                if os.path.exists(thumb):
+                    freed += os.path.getsize(thumb)
+                    os.remove(thumb)
+        return removed, freed
+
+    def _loop(self):
+        while True:
+            try:
+                if self.is_leader or self._leader.acquire(blocking=False):
+                    self.run_once()
+            except Exception as e:
+                print(f"[RETENTION] Run failed: {e}", flush=True)
+            if self._stop.wait(self.interval):
+                return
+
+    def start(self):
+        """Run the policy now and then every `interval` seconds on a background thread."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="forest-retention", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    @property
+    def is_leader(self):
+        """True if this process runs the schedule (always, without a lock_path)."""
+        return self._leader is None or self._leader.locked
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "max_age_days": self.max_age_days,
+            "max_messages": self.max_messages,
+            "interval": self.interval,
+            "upload_grace": self.upload_grace,
+            "leader": self.is_leader,
+            "live_messages": len(self.store),
+            "archive": self.archive.stats(),
+            "last_run": self.last_run,
+        }
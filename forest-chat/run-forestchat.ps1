@@ -1,2 +1,2 @@
 ﻿Set-Location "C:\Users\Matthew\forest-comms\forest-chat"
-& "C:\Users\Matthew\forest-comms\forest-chat\.venv\Scripts\python.exe" -X utf8 app.py
+& "C:\Users\Matthew\forest-comms\forest-chat\.venv\Scripts\python.exe" -X utf8 serve.py
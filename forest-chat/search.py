@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+🌲 Forest Chat Search - Incremental inverted index over message history
+Indexes each message's text, sender, recipient and attachment names, so a
+search touches only the postings of its query terms instead of scanning
+the history. Used by the in-memory store; the SQLite backend uses FTS5
+with the same tokenization and ranking window.
+"""
+
+import math
+import re
+import unicodedata
+from array import array
+from bisect import bisect_left, bisect_right
+
+# Only the newest this-many matches of a query are ranked, so a search for
+# a very common word costs the same on a huge history as on a small one.
+SEARCH_MAX_CANDIDATES = 5_000
+
+# BM25 term-frequency saturation
+BM25_K1 = 1.2
+
+# Letters and digits; underscores and punctuation separate tokens, as in FTS5
+_TOKEN_RE = re.compile(r"[^\W_]+")
+
+
+def tokenize(text):
+    """Lowercased word tokens with diacritics removed (like FTS5's unicode61)."""
+    if not text:
+        return []
+    text = str(text).lower()
+    if not text.isascii():
+        text = unicodedata.normalize('NFKD', text)
+        text = ''.join(c for c in text if not unicodedata.combining(c))
+    return _TOKEN_RE.findall(text)
+
+
+def attachment_names(msg):
+    """Space-separated original names of a message's attachments."""
+    names = []
+    for a in msg.get('attachments') or []:
+        if isinstance(a, dict):
+            names.append(a.get('original_name') or a.get('filename') or '')
+    return ' '.join(n for n in names if n)
+
+
+def searchable_fields(msg):
+    """(body, sender, recipient, attachments) - the text a message is found by."""
+    return (msg.get('message', ''), msg.get('from', ''), msg.get('to', ''), attachment_names(msg))
+
+
+def query_terms(query):
+    """Distinct terms of a search query, in order. Every term must match."""
+    return list(dict.fromkeys(tokenize(query)))
+
+
+class SearchIndex:
+    """Inverted index: term -> ascending message ids with per-message term counts.
+
+    Messages must be added in id order, which the stores guarantee, so
+    postings stay sorted and can be intersected by bisection. Not
+    thread-safe; the owning store serializes access.
+    """
+
+    def __init__(self):
+        self._postings = {}   # term -> (array of ids, array of term counts)
+        self._docs = array('q')  # every indexed id, ascending
+
+    @property
+    def size(self):
+        return len(self._docs)
+
+    def add(self, msg):
+        counts = {}
+        for field in searchable_fields(msg):
+            for term in tokenize(field):
+                counts[term] = counts.get(term, 0) + 1
+        msg_id = msg.get('id')
+        for term, tf in counts.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = (array('q'), array('H'))
+            postings[0].append(msg_id)
+            postings[1].append(min(tf, 0xFFFF))
+        self._docs.append(msg_id)
+
+    def remove_through(self, max_id):
+        """Drop every message with id <= max_id (the oldest ones) from the index."""
+        cut = bisect_right(self._docs, max_id)
+        if not cut:
+            return
+        del self._docs[:cut]
+        for term in list(self._postings):
+            ids, counts = self._postings[term]
+            k = bisect_right(ids, max_id)
+            if k == len(ids):
+                del self._postings[term]
+            elif k:
+                del ids[:k]
+                del counts[:k]
+
+    def search(self, terms, max_candidates=SEARCH_MAX_CANDIDATES):
+        """Ids matching every term, ranked best first, as [(id, score)].
+
+        Candidates are the newest `max_candidates` matches, found by
+        walking the rarest term's postings backwards and probing the
+        others by bisection. Each is scored with BM25 (no length
+        normalization); ties go to the newer message.
+        """
+        if not terms:
+            return []
+        postings = []
+        for term in terms:
+            p = self._postings.get(term)
+            if p is None:
+                return []
+            postings.append(p)
+        postings.sort(key=lambda p: len(p[0]))
+        idf = [math.log(1 + (self.size - len(ids) + 0.5) / (len(ids) + 0.5)) for ids, _ in postings]
+
+        rarest_ids, rarest_tfs = postings[0]
+        others = postings[1:]
+        hi = [len(ids) for ids, _ in others]
+        hits = []
+        for k in range(len(rarest_ids) - 1, -1, -1):
+            msg_id = rarest_ids[k]
+            tfs = [rarest_tfs[k]]
+            for j, (ids, counts) in enumerate(others):
+                # Walking backwards, so each probe only needs ids below the last one.
+                pos = bisect_left(ids, msg_id, 0, hi[j])
+                hi[j] = pos
+                if pos == len(ids) or ids[pos] != msg_id:
+                    break
+                tfs.append(counts[pos])
+            else:
+                score = sum(w * tf * (BM25_K1 + 1) / (tf + BM25_K1) for w, tf in zip(idf, tfs))
+                hits.append((msg_id, score))
+                if len(hits) >= max_candidates:
+                    break
+        hits.sort(key=lambda h: (-h[1], -h[0]))
+        return hits
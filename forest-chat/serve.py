@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+🌲 Forest Chat Server - Production entry point for the hub
+Serves app.py with waitress, a multi-threaded pure-Python WSGI server that
+runs the same on Windows and Linux, instead of Flask's development server
+(`python app.py`). Configuration is the same environment as app.py.
+
+For several worker processes on Linux, use gunicorn with gunicorn.conf.py
+instead (needs FOREST_STORAGE=sqlite).
+
+Usage:
+    python serve.py
+    python serve.py --port 5001 --threads 64
+"""
+
+import argparse
+import os
+
+from flask import jsonify, request
+
+try:
+    from waitress import serve
+except ImportError:  # falls back to the development server
+    serve = None
+
+# Request threads. Each open long-poll (/api/read?wait=N) or /api/stream
+# connection holds one for as long as it is open.
+THREADS = int(os.environ.get("FOREST_THREADS", "32"))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the Forest Chat hub with a production WSGI server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=None, help="listen port (default: FOREST_PORT or 5001)")
+    parser.add_argument("--threads", type=int, default=THREADS, help="request threads (default: FOREST_THREADS or 32)")
+    args = parser.parse_args()
+
+    from app import HUB_PORT, READ_MAX_WAIT, STORAGE_BACKEND, app
+    port = args.port or HUB_PORT
+
+    if serve is None:
+        print("[SERVE] waitress is not installed (pip install waitress); using the development server", flush=True)
+        app.run(host=args.host, port=port, debug=False, threaded=True)
+        return
+
+    print(f"🌲 Forest Chat serving on {args.host}:{port} (waitress, {args.threads} threads, {STORAGE_BACKEND} storage)",
+          flush=True)
+    print("   WebSocket push needs gunicorn or the development server; bridges long-poll under waitress", flush=True)
+
+    @app.before_request
+    def no_websockets():
+        # waitress can't hand the socket over, so refuse cleanly instead of a 500 per bridge retry
+        if request.headers.get('Upgrade', '').lower() == 'websocket':
+            return jsonify({"error": "WebSocket push is not available under waitress; use /api/read?wait=N"}), 501
+
+    serve(
+        app,
+        host=args.host,
+        port=port,
+        threads=args.threads,
+        connection_limit=max(100, args.threads * 4),
+        # Idle connections are dropped after this long; long-polls answer
+        # within READ_MAX_WAIT and streams send heartbeats well before it.
+        channel_timeout=READ_MAX_WAIT + 30,
+        ident="forest-chat",
+    )
+
+
+if __name__ == "__main__":
+    main()
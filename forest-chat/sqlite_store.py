@@ -0,0 +1,603 @@
+#!/usr/bin/env python3
+"""
+🌲 Forest Chat Storage - SQLite backend
+Messages live in a WAL-mode SQLite database with indexes on id, sender,
+recipient and timestamp; delivery state lives in its own table instead of
+the nested `delivered_to` dict. Full-text search uses an FTS5 table kept
+in step with `messages`. Same interface as storage.MessageStore.
+
+Usage (one-shot import of an existing history):
+    python sqlite_store.py import ~/.forest-chat/messages.json
+    python sqlite_store.py import ~/.forest-chat/messages.jsonl --db ~/.forest-chat/messages.db
+"""
+
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from search import SEARCH_MAX_CANDIDATES, query_terms, searchable_fields
+from storage import DURABILITY_POLICIES, STORAGE_LOAD_SECONDS, STORAGE_SAVE_SECONDS, MessageLog, attachment_files
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id        INTEGER PRIMARY KEY,
+    sender    TEXT NOT NULL,
+    recipient TEXT NOT NULL,
+    body      TEXT NOT NULL,
+    timestamp TEXT NOT NULL,
+    extra     TEXT                      -- JSON of any other keys (attachments, ...)
+);
+CREATE INDEX IF NOT EXISTS idx_messages_recipient ON messages(recipient, id);
+CREATE INDEX IF NOT EXISTS idx_messages_sender    ON messages(sender, id);
+CREATE INDEX IF NOT EXISTS idx_messages_timestamp ON messages(timestamp);
+
+CREATE TABLE IF NOT EXISTS deliveries (
+    message_id INTEGER NOT NULL,
+    reader     TEXT NOT NULL,
+    PRIMARY KEY (message_id, reader)
+) WITHOUT ROWID;
+
+-- Every message addressed to `reader` with id <= cursor has been delivered,
+-- so unread lookups only look at ids above the cursor.
+CREATE TABLE IF NOT EXISTS read_cursors (
+    reader TEXT PRIMARY KEY,
+    cursor INTEGER NOT NULL
+);
+
+-- Next message id to hand out ('messages'), and a counter bumped by every
+-- write ('changes'); neither goes backwards, even if rows are deleted.
+CREATE TABLE IF NOT EXISTS sequence (
+    name    TEXT PRIMARY KEY,
+    next_id INTEGER NOT NULL
+);
+"""
+
+# Full-text index over message text, sender, recipient and attachment
+# names; rowid is the message id. unicode61 matches search.tokenize().
+FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    body, sender, recipient, attachments,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+# The newest SEARCH_MAX_CANDIDATES matches, with their BM25 score (higher is better)
+SEARCH_CANDIDATES_SQL = """
+SELECT rowid AS id, -bm25(messages_fts) AS score FROM messages_fts
+WHERE messages_fts MATCH ? ORDER BY rowid DESC LIMIT ?
+"""
+
+# Durability policy -> PRAGMA synchronous. In WAL mode NORMAL only fsyncs
+# at checkpoints, which is the closest match to batched write-behind.
+SYNCHRONOUS = {"always": "FULL", "batch": "NORMAL", "none": "OFF"}
+
+CORE_KEYS = ("id", "from", "to", "message", "timestamp", "delivered_to")
+
+UNREAD_SQL = """
+SELECT * FROM messages m
+WHERE m.id > ? AND m.recipient IN (?, 'all') AND m.sender != ?
+  AND NOT EXISTS (SELECT 1 FROM deliveries d WHERE d.message_id = m.id AND d.reader = ?)
+ORDER BY m.id
+"""
+
+# Waiters re-check the database at least this often (seconds), so writes
+# made by other processes sharing the file are noticed too.
+WAIT_POLL_INTERVAL = 0.25
+
+
+class SQLiteMessageStore:
+    """Message store backed by SQLite in WAL mode.
+
+    Each thread gets its own connection; writes take the database's
+    reserved lock (BEGIN IMMEDIATE), so several processes can share one
+    database file safely. One-time startup work (legacy import, FTS
+    backfill) re-checks what is needed inside its write transaction, so
+    workers starting together don't repeat it.
+
+    Appends are group-committed: while one thread is committing, other
+    senders queue up behind it and the next thread through commits all of
+    them in a single transaction, allocating ids from the `sequence` table.
+    """
+
+    def __init__(self, path, durability="batch", legacy_paths=()):
+        if durability not in DURABILITY_POLICIES:
+            raise ValueError(f"Unknown durability policy {durability!r} (expected one of {DURABILITY_POLICIES})")
+        started = time.perf_counter()
+        self.path = path
+        self.durability = durability
+        self._local = threading.local()
+        self._commit_lock = threading.Lock()    # held by the thread committing a group
+        self._waiting_lock = threading.Lock()
+        self._waiting = []                      # _PendingAppend entries not yet committed
+        self._changed = threading.Condition()   # notified after every local commit
+        self._version = 0
+
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        try:
+            conn.executescript(FTS_SCHEMA)
+            self.fts = True
+        except sqlite3.OperationalError as e:
+            print(f"[STORAGE] FTS5 unavailable ({e}); search falls back to a table scan", flush=True)
+            self.fts = False
+        empty = conn.execute("SELECT 1 FROM messages LIMIT 1").fetchone() is None
+        if empty:
+            for legacy in legacy_paths:
+                if legacy and os.path.exists(legacy):
+                    with self._write() as conn:
+                        # Another worker may have imported it while we waited for the lock.
+                        if conn.execute("SELECT 1 FROM messages LIMIT 1").fetchone() is None:
+                            count = self._import(conn, self._load_file(legacy))
+                            print(f"[STORAGE] Imported {count} messages from {legacy}", flush=True)
+                    break
+        if self.fts:
+            self._backfill_fts()
+        STORAGE_LOAD_SECONDS.set(time.perf_counter() - started, backend="sqlite")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(f"PRAGMA synchronous={SYNCHRONOUS[self.durability]}")
+            self._local.conn = conn
+        return conn
+
+    def _write(self):
+        """Context manager for a write transaction holding the reserved lock."""
+        return _Transaction(self._conn())
+
+    # ---- row <-> message ----
+
+    @staticmethod
+    def _to_row(msg):
+        extra = {k: v for k, v in msg.items() if k not in CORE_KEYS}
+        return (msg.get('id'), msg.get('from', 'unknown'), msg.get('to', 'all'),
+                msg.get('message', ''), msg.get('timestamp', ''),
+                json.dumps(extra) if extra else None)
+
+    def _to_messages(self, conn, rows):
+        if not rows:
+            return []
+        delivered = {}
+        ids = [r['id'] for r in rows]
+        for start in range(0, len(ids), 500):
+            chunk = ids[start:start + 500]
+            marks = conn.execute(
+                f"SELECT message_id, reader FROM deliveries WHERE message_id IN ({','.join('?' * len(chunk))})",
+                chunk,
+            )
+            for message_id, reader in marks:
+                delivered.setdefault(message_id, {})[reader] = True
+        messages = []
+        for r in rows:
+            msg = {
+                "id": r['id'],
+                "from": r['sender'],
+                "to": r['recipient'],
+                "message": r['body'],
+                "timestamp": r['timestamp'],
+                "delivered_to": delivered.get(r['id'], {}),
+            }
+            if r['extra']:
+                msg.update(json.loads(r['extra']))
+            messages.append(msg)
+        return messages
+
+    # ---- reads ----
+
+    def __len__(self):
+        return self._conn().execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+
+    def all(self):
+        """Snapshot of every stored message, oldest first."""
+        conn = self._conn()
+        return self._to_messages(conn, conn.execute("SELECT * FROM messages ORDER BY id").fetchall())
+
+    def get(self, msg_id):
+        conn = self._conn()
+        found = self._to_messages(conn, conn.execute("SELECT * FROM messages WHERE id = ?", (msg_id,)).fetchall())
+        return found[0] if found else None
+
+    def last_id(self):
+        """Highest message id stored so far (0 if none)."""
+        return self._conn().execute("SELECT MAX(id) FROM messages").fetchone()[0] or 0
+
+    def retention_cutoff(self, before=None, keep=None):
+        """Highest id a retention policy would archive (0 if none); see MessageStore."""
+        conn = self._conn()
+        cutoff = 0
+        if before:
+            cutoff = conn.execute("SELECT MAX(id) FROM messages WHERE timestamp < ?", (before,)).fetchone()[0] or 0
+        if keep is not None:
+            row = conn.execute("SELECT id FROM messages ORDER BY id DESC LIMIT 1 OFFSET ?", (keep,)).fetchone()
+            if row:
+                cutoff = max(cutoff, row[0])
+        return cutoff
+
+    def attachment_names(self):
+        """Names of the upload files referenced by stored messages."""
+        names = set()
+        for (extra,) in self._conn().execute("SELECT extra FROM messages WHERE extra IS NOT NULL"):
+            names.update(attachment_files(json.loads(extra)))
+        return names
+
+    def version(self):
+        """Token that changes whenever any message or delivery mark changes."""
+        conn = self._conn()
+        row = conn.execute("SELECT next_id FROM sequence WHERE name = 'changes'").fetchone()
+        return f"{self.last_id()}.{row[0] if row else 0}"
+
+    @staticmethod
+    def _bump_changes(conn):
+        conn.execute("INSERT INTO sequence VALUES ('changes', 1) "
+                     "ON CONFLICT(name) DO UPDATE SET next_id = next_id + 1")
+
+    def query(self, since=None, limit=None):
+        """Messages with id > since (if given), trimmed to the last `limit`."""
+        conn = self._conn()
+        if limit:
+            rows = conn.execute(
+                "SELECT * FROM (SELECT * FROM messages WHERE id > ? ORDER BY id DESC LIMIT ?) ORDER BY id",
+                (since or 0, limit),
+            ).fetchall()
+        else:
+            rows = conn.execute("SELECT * FROM messages WHERE id > ? ORDER BY id", (since or 0,)).fetchall()
+        return self._to_messages(conn, rows)
+
+    def page(self, before_id=None, after_id=None, sender=None, recipient=None,
+             start=None, end=None, limit=100):
+        """One page of messages matching the filters, oldest first.
+
+        Keyset pagination over the primary key, with sender/recipient/
+        timestamp filters answered from their indexes. Returns
+        (messages, has_more); see MessageStore.page.
+        """
+        where, params = [], []
+        for clause, value in (("id < ?", before_id), ("id > ?", after_id), ("sender = ?", sender),
+                              ("recipient = ?", recipient), ("timestamp >= ?", start), ("timestamp < ?", end)):
+            if value is not None:
+                where.append(clause)
+                params.append(value)
+        order = "ASC" if after_id is not None else "DESC"
+        sql = (f"SELECT * FROM messages {'WHERE ' + ' AND '.join(where) if where else ''} "
+               f"ORDER BY id {order} LIMIT ?")
+        conn = self._conn()
+        rows = conn.execute(sql, params + [limit + 1]).fetchall()
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if after_id is None:
+            rows.reverse()
+        return self._to_messages(conn, rows), has_more
+
+    @staticmethod
+    def _cursor(conn, reader):
+        row = conn.execute("SELECT cursor FROM read_cursors WHERE reader = ?", (reader,)).fetchone()
+        return row[0] if row else 0
+
+    def unread(self, reader, mark_read=False):
+        """Messages not yet delivered to `reader`, oldest first.
+
+        Only ids above the reader's cursor are examined, via the
+        (recipient, id) index. With mark_read the messages are marked in
+        the same transaction.
+        """
+        if not mark_read:
+            conn = self._conn()
+            rows = conn.execute(UNREAD_SQL, (self._cursor(conn, reader), reader, reader, reader)).fetchall()
+            return self._to_messages(conn, rows)
+        with self._write() as conn:
+            rows = conn.execute(UNREAD_SQL, (self._cursor(conn, reader), reader, reader, reader)).fetchall()
+            if rows:
+                self._mark_delivered(conn, reader, [r['id'] for r in rows])
+            messages = self._to_messages(conn, rows)
+        if rows:
+            self._notify()
+        return messages
+
+    def unread_count(self, reader):
+        """Number of messages unread() would return for `reader`."""
+        conn = self._conn()
+        return conn.execute("SELECT COUNT(*) FROM (" + UNREAD_SQL + ")",
+                            (self._cursor(conn, reader), reader, reader, reader)).fetchone()[0]
+
+    def search(self, query, limit=20, offset=0):
+        """Full-text search: messages containing every term of `query`.
+
+        Returns ([(message, score), ...], total) - one page of hits, best
+        first, ranked by FTS5's BM25 among the newest SEARCH_MAX_CANDIDATES
+        matches; see MessageStore.search.
+        """
+        terms = query_terms(query)
+        if not terms:
+            return [], 0
+        conn = self._conn()
+        if self.fts:
+            match = ' '.join(f'"{t}"' for t in terms)
+            total = conn.execute("SELECT COUNT(*) FROM (SELECT rowid FROM messages_fts WHERE messages_fts MATCH ? "
+                                 "ORDER BY rowid DESC LIMIT ?)", (match, SEARCH_MAX_CANDIDATES)).fetchone()[0]
+            rows = conn.execute(
+                f"SELECT m.*, c.score FROM ({SEARCH_CANDIDATES_SQL}) c JOIN messages m ON m.id = c.id "
+                "ORDER BY c.score DESC, c.id DESC LIMIT ? OFFSET ?",
+                (match, SEARCH_MAX_CANDIDATES, limit, offset),
+            ).fetchall()
+        else:
+            where = ' AND '.join("(body || ' ' || sender || ' ' || recipient || ' ' || IFNULL(extra, '')) LIKE ?"
+                                 for _ in terms)
+            params = [f"%{t}%" for t in terms]
+            candidates = f"SELECT id FROM messages WHERE {where} ORDER BY id DESC LIMIT ?"
+            total = conn.execute(f"SELECT COUNT(*) FROM ({candidates})",
+                                 params + [SEARCH_MAX_CANDIDATES]).fetchone()[0]
+            rows = conn.execute(
+                f"SELECT m.*, 0.0 AS score FROM messages m WHERE m.id IN ({candidates}) "
+                "ORDER BY m.id DESC LIMIT ? OFFSET ?",
+                params + [SEARCH_MAX_CANDIDATES, limit, offset],
+            ).fetchall()
+        return list(zip(self._to_messages(conn, rows), (r['score'] for r in rows))), total
+
+    def wait_unread(self, reader, timeout):
+        """Block up to `timeout` seconds until `reader` has unread messages.
+
+        Returns True if there is something to read.
+        """
+        def ready():
+            conn = self._conn()
+            return conn.execute(UNREAD_SQL + " LIMIT 1",
+                                (self._cursor(conn, reader), reader, reader, reader)).fetchone() is not None
+        return self._wait(ready, timeout)
+
+    def wait_newer(self, after_id, timeout):
+        """Block up to `timeout` seconds until a message with id > after_id exists."""
+        return self._wait(lambda: self.last_id() > after_id, timeout)
+
+    def _wait(self, ready, timeout):
+        """Wait until ready() is true, waking on local commits and every WAIT_POLL_INTERVAL."""
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._changed:
+                version = self._version
+            if ready():
+                return True
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            with self._changed:
+                if self._version == version:
+                    self._changed.wait(min(remaining, WAIT_POLL_INTERVAL))
+
+    def _notify(self):
+        with self._changed:
+            self._version += 1
+            self._changed.notify_all()
+
+    # ---- writes ----
+
+    @staticmethod
+    def _fts_rows(messages):
+        return [(m['id'], *searchable_fields(m)) for m in messages]
+
+    def _index(self, conn, messages):
+        """Add stored messages to the full-text index; caller holds a write transaction."""
+        if self.fts:
+            conn.executemany("INSERT INTO messages_fts(rowid, body, sender, recipient, attachments) "
+                             "VALUES (?, ?, ?, ?, ?)", self._fts_rows(messages))
+
+    def _backfill_fts(self):
+        """Index messages stored before the FTS table existed (or by an older version)."""
+        missing_sql = "SELECT COUNT(*) FROM messages WHERE id > ?"
+        conn = self._conn()
+        indexed = conn.execute("SELECT IFNULL(MAX(rowid), 0) FROM messages_fts").fetchone()[0]
+        if not conn.execute(missing_sql, (indexed,)).fetchone()[0]:
+            return
+        with self._write() as conn:
+            indexed = conn.execute("SELECT IFNULL(MAX(rowid), 0) FROM messages_fts").fetchone()[0]
+            missing = conn.execute(missing_sql, (indexed,)).fetchone()[0]
+            if not missing:
+                return
+            cur = conn.execute("SELECT * FROM messages WHERE id > ? ORDER BY id", (indexed,))
+            while True:
+                rows = cur.fetchmany(5000)
+                if not rows:
+                    break
+                self._index(conn, [
+                    {"id": r['id'], "message": r['body'], "from": r['sender'], "to": r['recipient'],
+                     **(json.loads(r['extra']) if r['extra'] else {})}
+                    for r in rows
+                ])
+        print(f"[SEARCH] Indexed {missing} messages", flush=True)
+
+    @staticmethod
+    def _allocate_ids(conn, count):
+        """Reserve `count` consecutive ids; caller holds a write transaction."""
+        row = conn.execute("SELECT next_id FROM sequence WHERE name = 'messages'").fetchone()
+        max_id = conn.execute("SELECT MAX(id) FROM messages").fetchone()[0] or 0
+        first = max(row[0] if row else 1, max_id + 1)
+        conn.execute(
+            "INSERT INTO sequence VALUES ('messages', ?) ON CONFLICT(name) DO UPDATE SET next_id = excluded.next_id",
+            (first + count,),
+        )
+        return first
+
+    def append(self, *messages):
+        """Store new messages, assigning each the next id in sequence.
+
+        Returns the stored messages. Messages appended in one call get
+        consecutive ids.
+        """
+        entry = _PendingAppend(messages)
+        with self._waiting_lock:
+            self._waiting.append(entry)
+        with self._commit_lock:
+            if not entry.done:
+                with self._waiting_lock:
+                    group, self._waiting = self._waiting, []
+                self._commit_group(group)
+        if entry.error is not None:
+            raise entry.error
+        return entry.stored
+
+    def _commit_group(self, group):
+        try:
+            with self._write() as conn:
+                next_id = self._allocate_ids(conn, sum(len(e.messages) for e in group))
+                for e in group:
+                    for m in e.messages:
+                        m = {"id": next_id, **{k: v for k, v in m.items() if k != 'id'}}
+                        next_id += 1
+                        e.stored.append(m)
+                rows = [self._to_row(m) for e in group for m in e.stored]
+                conn.executemany("INSERT INTO messages VALUES (?, ?, ?, ?, ?, ?)", rows)
+                self._index(conn, [m for e in group for m in e.stored])
+                self._bump_changes(conn)
+        except Exception as exc:
+            for e in group:
+                e.error = exc
+        for e in group:
+            e.done = True
+        self._notify()
+
+    def evict_through(self, max_id):
+        """Delete every message with id <= max_id (after it has been archived).
+
+        Returns the number of messages removed. The id sequence is unaffected.
+        """
+        with self._write() as conn:
+            count = conn.execute("DELETE FROM messages WHERE id <= ?", (max_id,)).rowcount
+            conn.execute("DELETE FROM deliveries WHERE message_id <= ?", (max_id,))
+            if self.fts:
+                conn.execute("DELETE FROM messages_fts WHERE rowid <= ?", (max_id,))
+            self._bump_changes(conn)
+        self._notify()
+        return count
+
+    def mark_delivered(self, reader, ids):
+        """Record that `reader` has received the messages with these ids."""
+        ids = list(ids)
+        if not ids:
+            return
+        with self._write() as conn:
+            self._mark_delivered(conn, reader, ids)
+        self._notify()
+
+    def _mark_delivered(self, conn, reader, ids):
+        """Caller holds a write transaction and calls _notify() once it commits."""
+        conn.executemany("INSERT OR IGNORE INTO deliveries VALUES (?, ?)", [(i, reader) for i in ids])
+        self._bump_changes(conn)
+        # Advance the reader's cursor up to its oldest still-unread message.
+        cursor = self._cursor(conn, reader)
+        oldest = conn.execute(
+            "SELECT MIN(id) FROM (" + UNREAD_SQL + ")", (cursor, reader, reader, reader)
+        ).fetchone()[0]
+        if oldest is None:
+            oldest = (conn.execute("SELECT MAX(id) FROM messages").fetchone()[0] or 0) + 1
+        conn.execute(
+            "INSERT INTO read_cursors VALUES (?, ?) ON CONFLICT(reader) DO UPDATE SET cursor = excluded.cursor",
+            (reader, max(cursor, oldest - 1)),
+        )
+
+    # ---- import ----
+
+    def import_messages(self, messages):
+        """Import a list of message dicts, e.g. from the old messages.json.
+
+        The legacy global boolean `delivered_to` carries no per-bot state,
+        so - as /api/read always did - it is treated as "delivered to nobody".
+        Messages whose id is already taken are given a fresh id at the end.
+        """
+        with self._write() as conn:
+            return self._import(conn, messages)
+
+    def _import(self, conn, messages):
+        """import_messages() within the caller's write transaction."""
+        imported = 0
+        row = conn.execute("SELECT next_id FROM sequence WHERE name = 'messages'").fetchone()
+        next_id = max(row[0] if row else 1, (conn.execute("SELECT MAX(id) FROM messages").fetchone()[0] or 0) + 1)
+        for msg in messages:
+            row = list(self._to_row(msg))
+            if row[0] is None or conn.execute("SELECT 1 FROM messages WHERE id = ?", (row[0],)).fetchone():
+                print(f"[STORAGE] Duplicate or missing id {row[0]!r}; importing as {next_id}", flush=True)
+                row[0] = None
+            if row[0] is None:
+                row[0] = next_id
+            next_id = max(next_id, row[0] + 1)
+            conn.execute("INSERT INTO messages VALUES (?, ?, ?, ?, ?, ?)", row)
+            self._index(conn, [{**msg, "id": row[0]}])
+            delivered_to = msg.get('delivered_to')
+            if isinstance(delivered_to, dict):
+                conn.executemany(
+                    "INSERT OR IGNORE INTO deliveries VALUES (?, ?)",
+                    [(row[0], reader) for reader, done in delivered_to.items() if done],
+                )
+            imported += 1
+        conn.execute(
+            "INSERT INTO sequence VALUES ('messages', ?) ON CONFLICT(name) DO UPDATE SET next_id = excluded.next_id",
+            (next_id,),
+        )
+        self._bump_changes(conn)
+        return imported
+
+    def import_file(self, path):
+        """Import a messages.json array or a messages.jsonl log."""
+        return self.import_messages(self._load_file(path))
+
+    @staticmethod
+    def _load_file(path):
+        if path.endswith('.jsonl'):
+            return MessageLog(path).read()
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def flush(self):
+        """Writes are committed synchronously; nothing to flush."""
+
+    def close(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class _PendingAppend:
+    def __init__(self, messages):
+        self.messages = messages
+        self.stored = []
+        self.error = None
+        self.done = False
+
+
+class _Transaction:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.started = time.perf_counter()  # includes waiting for the lock, which writers feel too
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        if not exc_type:
+            STORAGE_SAVE_SECONDS.observe(time.perf_counter() - self.started, backend="sqlite", op="commit")
+        return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Forest Chat SQLite storage tools")
+    sub = parser.add_subparsers(dest="command", required=True)
+    imp = sub.add_parser("import", help="import messages.json / messages.jsonl into the database")
+    imp.add_argument("source")
+    imp.add_argument("--db", default=os.path.expanduser("~/.forest-chat/messages.db"))
+    args = parser.parse_args()
+
+    if args.command == "import":
+        store = SQLiteMessageStore(args.db)
+        count = store.import_file(os.path.expanduser(args.source))
+        print(f"Imported {count} messages into {args.db}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,631 @@
+#!/usr/bin/env python3
+"""
+🌲 Forest Chat Storage - In-memory message store over an append-only log
+Messages are loaded once at startup and served from memory. Changes are
+queued and written behind to a JSON-lines log by a background thread,
+so a send costs one appended line, not a rewrite of the whole history.
+"""
+
+import bisect
+import heapq
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from locks import FileLock
+from metrics import Gauge, Histogram
+from search import SearchIndex, query_terms
+
+# Compact once this many superseded records have piled up in the log
+# (and they outnumber the live messages), so replay stays cheap.
+COMPACT_MIN_RECORDS = 1000
+
+# Durability policies for the background writer:
+#   "always" - writes return only once their records are fsynced to disk
+#   "batch"  - records are flushed every flush interval, one fsync per batch
+#   "none"   - records are flushed every flush interval, fsync left to the OS
+DURABILITY_POLICIES = ("always", "batch", "none")
+
+# Seconds a hub process waits for another to let go of the jsonl log. A
+# gunicorn reload starts the new worker before the old one has exited.
+LOCK_WAIT = 20
+
+# Readers whose unread index is kept up to date in memory (least recently
+# read dropped first). Only readers with delivery marks get one.
+UNREAD_INDEX_LIMIT = 32
+
+# Storage backends selectable with open_store()
+BACKENDS = ("jsonl", "sqlite")
+
+STORAGE_LOAD_SECONDS = Gauge(
+    "forest_storage_load_seconds", "Time spent opening the message store at startup", ["backend"])
+STORAGE_SAVE_SECONDS = Histogram(
+    "forest_storage_save_duration_seconds", "Time to persist one batch of changes", ["backend", "op"])
+
+
+def _normalize_delivered(msg):
+    """Old format had a global boolean delivered_to - treat it as an empty dict."""
+    if not isinstance(msg.get('delivered_to'), dict):
+        msg['delivered_to'] = {}
+    return msg
+
+
+def attachment_files(msg):
+    """Upload file names a message's attachments point at."""
+    names = []
+    for a in msg.get('attachments') or []:
+        if isinstance(a, dict):
+            name = a.get('filename') or os.path.basename(a.get('url') or '')
+            if name:
+                names.append(name)
+    return names
+
+
+def _is_unread_for(msg, reader):
+    """True if `msg` is addressed to `reader` (or "all") and not yet delivered to it."""
+    # Skip messages FROM this reader (don't echo back your own)
+    if msg.get('from') == reader:
+        return False
+    if msg.get('to') != reader and msg.get('to') != 'all':
+        return False
+    return not msg['delivered_to'].get(reader)
+
+
+class MessageLog:
+    """Append-only JSON-lines log of message records.
+
+    Each line is one record:
+      {"op": "seq", "next_id": 285}                         - id sequence high-water mark
+      {"op": "msg", "msg": {...}}                           - a stored message
+      {"op": "deliver", "reader": "cypress", "ids": [1, 2]} - delivery marks
+      {"op": "evict", "through": 120}                       - messages up to this id were archived
+
+    Replaying the log in order rebuilds the message list. Compaction
+    rewrites it as a "seq" record followed by one "msg" record per message
+    (delivery state folded in) and swaps the new file in atomically.
+    After load(), `next_id` is the next unused message id - it never goes
+    backwards, even if old messages are dropped from the log.
+    """
+
+    def __init__(self, path, legacy_path=None, compact_min=COMPACT_MIN_RECORDS):
+        self.path = path
+        self.legacy_path = legacy_path
+        self.compact_min = compact_min
+        self.next_id = 1
+        self._lock = threading.Lock()
+
+    def _import_legacy(self):
+        """One-time import of the old whole-file messages.json array."""
+        if not self.legacy_path or not os.path.exists(self.legacy_path):
+            return
+        with open(self.legacy_path, 'r') as f:
+            messages = json.load(f)
+        messages = [_normalize_delivered(m) for m in messages]
+        self._rewrite(messages, max([m['id'] for m in messages if isinstance(m.get('id'), int)], default=0) + 1)
+        print(f"[STORAGE] Imported {len(messages)} messages from {self.legacy_path}", flush=True)
+
+    def _replay(self):
+        messages = []
+        by_id = {}
+        records = 0
+        next_id = 1
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for lineno, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    rec = json.loads(line)
+                except ValueError:
+                    # A crash mid-append can leave a torn last line; skip it.
+                    print(f"[STORAGE] Skipping corrupt record at {self.path}:{lineno}", flush=True)
+                    continue
+                records += 1
+                op = rec.get('op')
+                if op == 'msg':
+                    msg = _normalize_delivered(rec['msg'])
+                    messages.append(msg)
+                    by_id[msg.get('id')] = msg
+                    if isinstance(msg.get('id'), int):
+                        next_id = max(next_id, msg['id'] + 1)
+                elif op == 'seq':
+                    next_id = max(next_id, rec['next_id'])
+                elif op == 'deliver':
+                    reader = rec['reader']
+                    for msg_id in rec.get('ids', []):
+                        m = by_id.get(msg_id)
+                        if m is not None:
+                            m['delivered_to'][reader] = True
+                elif op == 'evict':
+                    through = rec['through']
+                    messages = [m for m in messages if not (isinstance(m.get('id'), int) and m['id'] <= through)]
+                    by_id = {m.get('id'): m for m in messages}
+        self.next_id = next_id
+        return messages, records
+
+    def load(self):
+        """Replay the log into a list of messages, compacting if it has grown stale."""
+        with self._lock:
+            if not os.path.exists(self.path):
+                self._import_legacy()
+            if not os.path.exists(self.path):
+                self.records = 0
+                return []
+            messages, self.records = self._replay()
+            if self.needs_compaction(len(messages)):
+                self._rewrite(messages, self.next_id)
+            return messages
+
+    def read(self):
+        """Replay the log without importing or compacting it - never writes."""
+        with self._lock:
+            if not os.path.exists(self.path):
+                return []
+            messages, self.records = self._replay()
+            return messages
+
+    def needs_compaction(self, live):
+        """True once superseded records dominate a log holding `live` messages."""
+        superseded = self.records - live
+        return superseded >= self.compact_min and superseded > live
+
+    def append_records(self, records, fsync=False):
+        """Append records in one write - O(1) in the size of the history."""
+        if not records:
+            return
+        data = ''.join(json.dumps(r, separators=(',', ':')) + '\n' for r in records)
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(data)
+                if fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            self.records += len(records)
+
+    def _rewrite(self, messages, next_id):
+        tmp = self.path + '.tmp'
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(json.dumps({"op": "seq", "next_id": next_id}) + '\n')
+            for m in messages:
+                f.write(json.dumps({"op": "msg", "msg": m}, separators=(',', ':')) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self.records = len(messages) + 1
+        self.next_id = next_id
+
+    def compact(self, messages, next_id):
+        """Rewrite the log as a snapshot of `messages` and the id sequence."""
+        with self._lock:
+            self._rewrite(messages, next_id)
+
+
+class MessageStore:
+    """Process-resident message store with write-behind persistence.
+
+    The full history is loaded from the log once; every read is served
+    from memory. Mutations update memory immediately and queue log records
+    for a background writer, which flushes them in batches according to
+    the durability policy.
+
+    Message ids come from a monotonic sequence allocated under the store
+    lock, so concurrent senders can neither collide nor lose messages, and
+    the sequence survives restarts via the log.
+
+    Each reader that has called unread() gets an index of the messages
+    still waiting for it, kept up to date on append and delivery, so
+    /api/read costs O(unread) rather than O(history).
+
+    A full-text SearchIndex is built from the loaded history on a
+    background thread at startup and then maintained on append.
+
+    Stored message dicts are shared with readers, so they are never
+    mutated in place once stored - delivery marks replace `delivered_to`
+    with an updated copy.
+
+    The history lives in this process's memory, so only one process may
+    have a given log open: a second one fails at startup instead of
+    silently forking the history. Multi-process hubs use the SQLite store.
+    """
+
+    def __init__(self, log, durability="batch", flush_interval=0.2, lock_wait=LOCK_WAIT):
+        if durability not in DURABILITY_POLICIES:
+            raise ValueError(f"Unknown durability policy {durability!r} (expected one of {DURABILITY_POLICIES})")
+        self.log = log
+        self.durability = durability
+        self.flush_interval = flush_interval
+        self._owner = FileLock(log.path + ".lock")
+        if not self._owner.acquire(blocking=False):
+            print(f"[STORAGE] {log.path} is in use by another hub process; waiting up to {lock_wait:g}s", flush=True)
+            if not self._owner.acquire(timeout=lock_wait):
+                raise RuntimeError(f"{log.path} is in use by another hub process; run a single "
+                                   "worker or switch to FOREST_STORAGE=sqlite")
+
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        started = time.perf_counter()
+        self._messages = log.load()
+        self._reindex()
+        STORAGE_LOAD_SECONDS.set(time.perf_counter() - started, backend="jsonl")
+        self._next_id = log.next_id
+        self._unread = OrderedDict()  # reader -> {id: message} awaiting delivery, oldest first
+        self._readers = {r for m in self._messages for r in m['delivered_to']}  # readers with marks
+        self._search = None  # SearchIndex, once the startup build has finished
+        self._evicted_through = 0  # highest id dropped by evict_through()
+        self._search_ready = threading.Event()
+
+        self._epoch = uuid.uuid4().hex[:8]  # distinguishes versions across restarts
+        self._pending = []   # log records not yet handed to the writer
+        self._queued = 0     # sequence number of the last queued record batch (= change count)
+        self._flushed = 0    # sequence number of the last batch on disk
+        self._closed = False
+        self._writer = threading.Thread(target=self._write_behind, name="forest-store-writer", daemon=True)
+        self._writer.start()
+        threading.Thread(target=self._build_search_index, name="forest-search-index", daemon=True).start()
+
+    def _reindex(self):
+        """Rebuild the lookup structures over _messages (at load and after eviction)."""
+        self._ids = [m.get('id', 0) for m in self._messages]
+        self._by_id = {m.get('id'): m for m in self._messages}
+        # Positions into _messages, for filtered pagination without a full scan.
+        # Timestamps are assigned in id order, so _timestamps is sorted too.
+        self._timestamps = [m.get('timestamp', '') for m in self._messages]
+        self._by_sender = {}
+        self._by_recipient = {}
+        for pos, m in enumerate(self._messages):
+            self._by_sender.setdefault(m.get('from'), []).append(pos)
+            self._by_recipient.setdefault(m.get('to'), []).append(pos)
+
+    # ---- reads ----
+
+    def __len__(self):
+        return len(self._messages)
+
+    def all(self):
+        """Snapshot of every stored message, oldest first."""
+        with self._lock:
+            return list(self._messages)
+
+    def get(self, msg_id):
+        return self._by_id.get(msg_id)
+
+    def last_id(self):
+        """Highest message id handed out so far (0 if none)."""
+        return self._next_id - 1
+
+    def retention_cutoff(self, before=None, keep=None):
+        """Highest id a retention policy would archive (0 if none).
+
+        That is every message with a timestamp before `before` (ISO), and
+        every message beyond the newest `keep`.
+        """
+        with self._lock:
+            count = 0
+            if before:
+                count = bisect.bisect_left(self._timestamps, before)
+            if keep is not None and len(self._ids) > keep:
+                count = max(count, len(self._ids) - keep)
+            return self._ids[count - 1] if count else 0
+
+    def attachment_names(self):
+        """Names of the upload files referenced by stored messages."""
+        with self._lock:
+            return {name for m in self._messages for name in attachment_files(m)}
+
+    def version(self):
+        """Token that changes whenever any message or delivery mark changes."""
+        with self._lock:
+            return f"{self._epoch}.{self._next_id - 1}.{self._queued}"
+
+    def query(self, since=None, limit=None):
+        """Messages with id > since (if given), trimmed to the last `limit`."""
+        with self._lock:
+            start = bisect.bisect_right(self._ids, since) if since else 0
+            if limit:
+                start = max(start, len(self._messages) - limit)
+            return self._messages[start:]
+
+    def page(self, before_id=None, after_id=None, sender=None, recipient=None,
+             start=None, end=None, limit=100):
+        """One page of messages matching the filters, oldest first.
+
+        Keyset pagination: with after_id the page holds the oldest matches
+        above it; otherwise the newest matches below before_id (or the
+        newest overall). start/end bound the ISO timestamp (start <= ts < end).
+        Candidates come from the sender/recipient index within id and time
+        bounds found by bisection, so only the page itself is examined.
+        Returns (messages, has_more).
+        """
+        with self._lock:
+            lo = bisect.bisect_right(self._ids, after_id) if after_id is not None else 0
+            hi = bisect.bisect_left(self._ids, before_id) if before_id is not None else len(self._ids)
+            if start:
+                lo = max(lo, bisect.bisect_left(self._timestamps, start))
+            if end:
+                hi = min(hi, bisect.bisect_left(self._timestamps, end))
+
+            if sender is not None:
+                positions = self._by_sender.get(sender, [])
+            elif recipient is not None:
+                positions = self._by_recipient.get(recipient, [])
+            else:
+                positions = None
+            if positions is not None:
+                first, last = bisect.bisect_left(positions, lo), bisect.bisect_left(positions, hi)
+            else:
+                first, last = lo, hi
+            order = range(first, last) if after_id is not None else range(last - 1, first - 1, -1)
+
+            found = []
+            for k in order:
+                m = self._messages[positions[k] if positions is not None else k]
+                if recipient is not None and m.get('to') != recipient:
+                    continue
+                found.append(m)
+                if len(found) > limit:
+                    break
+        has_more = len(found) > limit
+        found = found[:limit]
+        if after_id is None:
+            found.reverse()
+        return found, has_more
+
+    def unread(self, reader, mark_read=False):
+        """Messages not yet delivered to `reader`, oldest first.
+
+        The first call for a reader builds its index from the messages
+        addressed to it or "all"; after that this is O(unread). With mark_read the returned
+        messages are marked delivered in the same step, so two concurrent
+        reads for one bot never both receive a message.
+        """
+        seq = None
+        with self._lock:
+            unread = list(self._unread_index(reader).values())
+            if mark_read and unread:
+                seq = self._mark_delivered(reader, [m.get('id') for m in unread])
+        if seq is not None:
+            self._wait_durable(seq)
+        return unread
+
+    def unread_count(self, reader):
+        """Number of messages unread() would return for `reader`."""
+        with self._lock:
+            return len(self._unread_index(reader))
+
+    def _unread_index(self, reader):
+        """The reader's unread index; caller holds the lock.
+
+        Kept (up to UNREAD_INDEX_LIMIT) only for readers that have had
+        messages delivered, so a query for an arbitrary name costs one
+        build and leaves nothing behind.
+        """
+        index = self._unread.get(reader)
+        if index is not None:
+            self._unread.move_to_end(reader)
+            return index
+        positions = heapq.merge(self._by_recipient.get(reader, []), self._by_recipient.get('all', []))
+        index = {m.get('id'): m for m in (self._messages[pos] for pos in positions) if _is_unread_for(m, reader)}
+        if reader in self._readers:
+            self._unread[reader] = index
+            while len(self._unread) > UNREAD_INDEX_LIMIT:
+                self._unread.popitem(last=False)
+        return index
+
+    def search(self, query, limit=20, offset=0):
+        """Full-text search: messages containing every term of `query`.
+
+        Returns ([(message, score), ...], total) - one page of hits, best
+        first, and the number of ranked matches (see SEARCH_MAX_CANDIDATES).
+        Blocks until the startup index build has finished.
+        """
+        terms = query_terms(query)
+        self._search_ready.wait()
+        with self._lock:
+            hits = self._search.search(terms)
+            page = [(self._by_id[i], score) for i, score in hits[offset:offset + limit] if i in self._by_id]
+        return page, len(hits)
+
+    def _build_search_index(self):
+        """Index the history outside the lock, then catch up with appends made meanwhile."""
+        index = SearchIndex()
+        with self._lock:
+            snapshot = list(self._messages)
+        for m in snapshot:
+            index.add(m)
+        with self._lock:
+            last = snapshot[-1].get('id', 0) if snapshot else 0
+            for m in self._messages[bisect.bisect_right(self._ids, last):]:
+                index.add(m)
+            index.remove_through(self._evicted_through)
+            self._search = index
+        self._search_ready.set()
+        print(f"[SEARCH] Indexed {index.size} messages", flush=True)
+
+    def wait_unread(self, reader, timeout):
+        """Block up to `timeout` seconds until `reader` has unread messages.
+
+        Returns True if there is something to read.
+        """
+        with self._lock:
+            return self._wait(lambda: self._unread_index(reader), timeout)
+
+    def wait_newer(self, after_id, timeout):
+        """Block up to `timeout` seconds until a message with id > after_id exists."""
+        with self._lock:
+            return self._wait(lambda: self._next_id - 1 > after_id, timeout)
+
+    def _wait(self, ready, timeout):
+        """Wait on the store condition until ready() is truthy; caller holds the lock."""
+        deadline = time.monotonic() + timeout
+        while not ready():
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or self._closed:
+                return False
+            self._cond.wait(remaining)
+        return True
+
+    # ---- writes ----
+
+    def _queue(self, records):
+        """Queue records for the writer; caller holds the lock. Returns their sequence number."""
+        self._pending.extend(records)
+        self._queued += 1
+        self._cond.notify_all()
+        return self._queued
+
+    def _wait_durable(self, seq):
+        """Under the "always" policy, block until batch `seq` has been fsynced."""
+        if self.durability != "always":
+            return
+        with self._lock:
+            while self._flushed < seq and not self._closed:
+                self._cond.wait()
+
+    def append(self, *messages):
+        """Store new messages, assigning each the next id in sequence.
+
+        Returns the stored messages. Messages appended in one call get
+        consecutive ids and land in the log in a single write.
+        """
+        with self._lock:
+            stored = []
+            for m in messages:
+                m = {"id": self._next_id, **{k: v for k, v in m.items() if k != 'id'}}
+                self._next_id += 1
+                stored.append(m)
+                self._messages.append(m)
+                self._ids.append(m.get('id', 0))
+                self._timestamps.append(m.get('timestamp', ''))
+                self._by_sender.setdefault(m.get('from'), []).append(len(self._messages) - 1)
+                self._by_recipient.setdefault(m.get('to'), []).append(len(self._messages) - 1)
+                self._by_id[m.get('id')] = m
+                for reader, index in self._unread.items():
+                    if _is_unread_for(m, reader):
+                        index[m.get('id')] = m
+                if self._search is not None:
+                    self._search.add(m)
+            seq = self._queue([{"op": "msg", "msg": m} for m in stored])
+        self._wait_durable(seq)
+        return stored
+
+    def evict_through(self, max_id):
+        """Drop every message with id <= max_id (after it has been archived).
+
+        Returns the number of messages removed. The id sequence is
+        unaffected, so evicted ids are never handed out again.
+        """
+        with self._lock:
+            count = bisect.bisect_right(self._ids, max_id)
+            if not count:
+                return 0
+            evicted = self._messages[:count]
+            self._messages = self._messages[count:]
+            self._evicted_through = max(self._evicted_through, max_id)
+            self._reindex()
+            for index in self._unread.values():
+                for m in evicted:
+                    index.pop(m.get('id'), None)
+            if self._search is not None:
+                self._search.remove_through(max_id)
+            seq = self._queue([{"op": "evict", "through": max_id}])
+        self._wait_durable(seq)
+        return count
+
+    def mark_delivered(self, reader, ids):
+        """Record that `reader` has received the messages with these ids."""
+        ids = list(ids)
+        if not ids:
+            return
+        with self._lock:
+            seq = self._mark_delivered(reader, ids)
+        self._wait_durable(seq)
+
+    def _mark_delivered(self, reader, ids):
+        """Apply delivery marks and queue their record; caller holds the lock."""
+        self._readers.add(reader)
+        index = self._unread.get(reader, {})
+        for msg_id in ids:
+            m = self._by_id.get(msg_id)
+            if m is not None:
+                m['delivered_to'] = {**m['delivered_to'], reader: True}
+            index.pop(msg_id, None)
+        return self._queue([{"op": "deliver", "reader": reader, "ids": ids}])
+
+    # ---- background writer ----
+
+    def _write_behind(self):
+        while True:
+            with self._lock:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if self._closed and not self._pending:
+                    return
+            if self.durability != "always" and not self._closed:
+                # Let a batch accumulate; "always" writes straight away and
+                # naturally groups whatever queued up during the last fsync.
+                time.sleep(self.flush_interval)
+
+            with self._lock:
+                batch, self._pending = self._pending, []
+                seq = self._queued
+                snapshot = None
+                if self.log.needs_compaction(len(self._messages)):
+                    # The snapshot already reflects every queued record.
+                    snapshot = [dict(m) for m in self._messages]
+                    next_id = self._next_id
+            try:
+                started = time.perf_counter()
+                if snapshot is not None:
+                    self.log.compact(snapshot, next_id)
+                else:
+                    self.log.append_records(batch, fsync=self.durability != "none")
+                STORAGE_SAVE_SECONDS.observe(time.perf_counter() - started, backend="jsonl",
+                                             op="compact" if snapshot is not None else "append")
+            except Exception as e:
+                print(f"[STORAGE] Write-behind failed, will retry: {e}", flush=True)
+                with self._lock:
+                    # The old log is untouched either way, so re-queue the batch.
+                    self._pending[:0] = batch
+                time.sleep(1)
+                continue
+
+            with self._lock:
+                self._flushed = seq
+                self._cond.notify_all()
+
+    def flush(self):
+        """Block until everything queued so far is on disk."""
+        with self._lock:
+            seq = self._queued
+            while self._flushed < seq and self._writer.is_alive():
+                self._cond.wait(timeout=1)
+
+    def close(self):
+        """Flush outstanding writes and stop the writer."""
+        self.flush()
+        with self._lock:
+            self._closed = True
+            self._cond.notify_all()
+        self._writer.join(timeout=5)
+        self._owner.release()
+
+
+def open_store(backend, data_dir, durability="batch", flush_interval=0.2, lock_wait=LOCK_WAIT):
+    """Open the message store for `backend` under `data_dir`.
+
+    "jsonl"  - in-memory MessageStore over messages.jsonl (imports messages.json once);
+               waits up to `lock_wait` seconds for another process to release it
+    "sqlite" - SQLiteMessageStore in messages.db (imports messages.jsonl or messages.json once)
+    """
+    log_path = os.path.join(data_dir, "messages.jsonl")
+    legacy_path = os.path.join(data_dir, "messages.json")
+    if backend == "jsonl":
+        return MessageStore(MessageLog(log_path, legacy_path=legacy_path),
+                            durability=durability, flush_interval=flush_interval, lock_wait=lock_wait)
+    if backend == "sqlite":
+        from sqlite_store import SQLiteMessageStore
+        return SQLiteMessageStore(os.path.join(data_dir, "messages.db"), durability=durability,
+                                  legacy_paths=(log_path, legacy_path))
+    raise ValueError(f"Unknown storage backend {backend!r} (expected one of {BACKENDS})")
@@ -0,0 +1,46 @@
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from archive import Archive
+from retention import RetentionPolicy
+from storage import open_store
+
+
+@pytest.mark.parametrize("backend", ["jsonl", "sqlite"])
+def test_gc_keeps_uploads_of_archived_messages(tmp_path, backend):
+    uploads = tmp_path / "uploads"
+    thumbs = uploads / "thumbs"
+    thumbs.mkdir(parents=True)
+    kept, orphan = uploads / "kept.png", uploads / "orphan.png"
+    for f in (kept, orphan, thumbs / "kept.webp"):
+        f.write_bytes(b"x")
+        os.utime(f, (time.time() - 3600, time.time() - 3600))
+
+    store = open_store(backend, str(tmp_path))
+    try:
+        store.append(
+            {"from": "matthew", "to": "cypress", "message": "photo", "timestamp": "2020-01-01T00:00:00",
+             "attachments": [{"filename": "kept.png", "url": "/api/files/kept.png"}]},
+            {"from": "matthew", "to": "cypress", "message": "newest", "timestamp": "2020-01-02T00:00:00"},
+        )
+        archive = Archive(str(tmp_path / "archive"))
+        policy = RetentionPolicy(store, archive, str(uploads), thumbs_dir=str(thumbs),
+                                 max_messages=1, upload_grace=60)
+
+        first = policy.run_once()
+        assert first["evicted"] == 1
+        # The archived message's attachment is no longer in the live store
+        assert "kept.png" not in store.attachment_names()
+        policy.run_once()
+
+        assert kept.exists() and (thumbs / "kept.webp").exists()
+        assert not orphan.exists()
+        archived, _ = archive.page(after_id=0)
+        assert archived[0]["attachments"][0]["filename"] == "kept.png"
+    finally:
+        store.close()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+🌲 Forest Chat Thumbnails - Downsized previews for image attachments
+Image uploads are measured on the spot (only the header is read) and
+thumbnailed on a small worker pool, so the UI can show inline previews
+without pulling multi-MB originals. Needs Pillow; without it uploads
+simply carry no thumbnail.
+"""
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # thumbnails are optional; the UI falls back to the original
+    Image = None
+
+# Image types Pillow is asked to thumbnail
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".gif", ".webp", ".bmp")
+
+THUMB_FORMAT = "WEBP"
+THUMB_EXT = ".webp"
+THUMB_QUALITY = 80
+
+ORIENTATION_TAG = 0x0112  # EXIF orientation
+
+
+class Thumbnailer:
+    """Generates `max_size`-px thumbnails of files in `source_dir` into `thumb_dir`.
+
+    Thumbnails are named after their source's stem, and sources are
+    content-addressed, so each image is thumbnailed at most once no
+    matter how often it is uploaded.
+    """
+
+    def __init__(self, source_dir, thumb_dir, max_size=480, workers=2):
+        self.source_dir = source_dir
+        self.thumb_dir = thumb_dir
+        self.max_size = max_size
+        os.makedirs(thumb_dir, exist_ok=True)
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="forest-thumb")
+        self._lock = threading.Lock()
+        self._jobs = {}   # thumbnail name -> Future, while being generated
+
+    @property
+    def available(self):
+        return Image is not None
+
+    @staticmethod
+    def thumb_name(filename):
+        return os.path.splitext(filename)[0] + THUMB_EXT
+
+    def is_image(self, filename):
+        return self.available and os.path.splitext(filename)[1].lower() in IMAGE_EXTENSIONS
+
+    def probe(self, filename):
+        """(width, height) of an uploaded image from its header, or None if it isn't one."""
+        if not self.is_image(filename):
+            return None
+        try:
+            with Image.open(os.path.join(self.source_dir, filename)) as img:
+                width, height = img.size
+                if img.getexif().get(ORIENTATION_TAG) in (5, 6, 7, 8):  # shown rotated by 90°
+                    width, height = height, width
+                return width, height
+        except Exception as e:
+            print(f"[THUMB] Not an image: {filename}: {e}", flush=True)
+            return None
+
+    def submit(self, filename):
+        """Queue a thumbnail for `filename`; returns its Future (None if not an image)."""
+        if not self.is_image(filename):
+            return None
+        name = self.thumb_name(filename)
+        with self._lock:
+            job = self._jobs.get(name)
+            if job is None:
+                job = self._jobs[name] = self._pool.submit(self._generate, filename, name)
+            return job
+
+    def path_for(self, filename, timeout=10):
+        """Path of the thumbnail for `filename`, generating it if needed; None on failure."""
+        path = os.path.join(self.thumb_dir, self.thumb_name(filename))
+        if os.path.exists(path):
+            return path
+        job = self.submit(filename)
+        if job is None:
+            return None
+        try:
+            return job.result(timeout=timeout)
+        except Exception:
+            return None
+
+    def _generate(self, filename, name):
+        source = os.path.join(self.source_dir, filename)
+        path = os.path.join(self.thumb_dir, name)
+        try:
+            if os.path.exists(path):
+                return path
+            with Image.open(source) as img:
+                # JPEG can decode straight at a reduced scale, which is most of the win on a Pi
+                img.draft("RGB", (self.max_size, self.max_size))
+                img = ImageOps.exif_transpose(img)
+                img.thumbnail((self.max_size, self.max_size))
+                if img.mode not in ("RGB", "RGBA"):
+                    img = img.convert("RGBA" if "A" in img.getbands() or "transparency" in img.info else "RGB")
+                tmp = f"{path}.{os.getpid()}.tmp"  # hub workers may race on the same image
+                img.save(tmp, THUMB_FORMAT, quality=THUMB_QUALITY)
+            os.replace(tmp, path)
+            return path
+        except Exception as e:
+            print(f"[THUMB] Failed to thumbnail {filename}: {e}", flush=True)
+            return None
+        finally:
+            with self._lock:
+                self._jobs.pop(name, None)
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+"""
+🌲 Forest Chat Tracing - Timestamped spans for a message's trip
+Each message gets a trace id when it is sent. The hub, the wake
+dispatcher and the bridge record what they did with it as spans - name,
+start time, duration - to a local JSON-lines trace log, and the bridge
+reports its spans back to the hub, so /api/trace/<id> can show where the
+seconds went between a send and its reply. Shared by app.py and bridge.py.
+
+Span start times come from each machine's own clock; hops between
+machines are only as accurate as their clock sync (Tailscale hosts
+normally run NTP).
+"""
+
+import json
+import os
+import re
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+
+from locks import FileLock
+
+# The log is rotated to <path>.1 once it grows past this
+TRACE_LOG_MAX_BYTES = 16 * 1024 * 1024
+
+# Spans kept in memory for recent() (e.g. for the bridge to report them)
+RECENT_SPANS = 2000
+
+# Seconds spans are buffered before the background writer appends them
+FLUSH_INTERVAL = 0.2
+
+# Spans are written compactly, so a line's trace id can be found without parsing it
+_TRACE_ID_RE = re.compile(rb'"trace_id":"([^"]*)"')
+
+
+def new_trace_id():
+    return uuid.uuid4().hex[:16]
+
+
+class _FileIndex:
+    """Byte offsets of each trace's lines in one log file, read incrementally."""
+
+    def __init__(self, identity):
+        self.identity = identity  # (inode, first line): inodes alone get reused
+        self.pos = 0
+        self.offsets = {}  # trace id -> [offset, ...]
+
+    def extend(self, f):
+        """Index lines appended to the open file `f` since the last call."""
+        f.seek(self.pos)
+        for line in f:
+            if not line.endswith(b'\n'):
+                break  # a write still in progress; picked up next time
+            match = _TRACE_ID_RE.search(line)
+            if match:
+                self.offsets.setdefault(match.group(1).decode(), []).append(self.pos)
+            self.pos += len(line)
+
+
+class TraceLog:
+    """Append-only span log at `path`, written by `service` (e.g. "hub", "bridge:cypress").
+
+    Spans are buffered and appended by a background thread, one write per
+    batch, so recording never touches the disk on the caller's thread.
+    Several processes may append to the same log; rotation happens under
+    a lock file, so only one of them rotates it at a time.
+    """
+
+    def __init__(self, path, service, max_bytes=TRACE_LOG_MAX_BYTES, flush_interval=FLUSH_INTERVAL):
+        self.path = path
+        self.service = service
+        self.max_bytes = max_bytes
+        self.flush_interval = flush_interval
+        self._lock = threading.Lock()
+        self._cond = threading.Condition(self._lock)
+        self._recent = deque(maxlen=RECENT_SPANS)
+        self._reported = set()  # span ids already sent on by mark_reported()
+        self._pending = []      # spans not yet handed to the writer
+        self._queued = 0        # batches queued / written, for flush()
+        self._written = 0
+        self._closed = False
+        self._index_lock = threading.Lock()
+        self._indexes = {}      # path -> _FileIndex, built by spans()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._writer = threading.Thread(target=self._write_behind, name="forest-trace-writer", daemon=True)
+        self._writer.start()
+
+    def record(self, trace_ids, name, start, end=None, **attrs):
+        """Log a span that ran from `start` to `end` (epoch seconds) for each trace id.
+
+        `trace_ids` may be one id or several (a coalesced wake-up serves
+        many messages); empty ids are skipped. Returns the spans written.
+        """
+        if isinstance(trace_ids, str) or trace_ids is None:
+            trace_ids = [trace_ids]
+        end = start if end is None else end
+        spans = [{"trace_id": tid, "span_id": new_trace_id(), "service": self.service, "name": name,
+                  "start": round(start, 6), "duration_ms": round((end - start) * 1000, 3), **attrs}
+                 for tid in dict.fromkeys(trace_ids) if tid]
+        self.add(spans)
+        return spans
+
+    @contextmanager
+    def span(self, trace_ids, name, **attrs):
+        """Time the enclosed block as a span; add attributes to the yielded dict."""
+        start = time.time()
+        extra = dict(attrs)
+        try:
+            yield extra
+        except BaseException as e:
+            extra.setdefault("error", f"{type(e).__name__}: {e}")
+            raise
+        finally:
+            self.record(trace_ids, name, start, time.time(), **extra)
+
+    def add(self, spans):
+        """Queue already-built spans (e.g. reported by a bridge) for the log."""
+        if not spans:
+            return
+        with self._lock:
+            self._recent.extend(spans)
+            self._pending.extend(spans)
+            self._queued += 1
+            self._cond.notify_all()
+
+    def _write_behind(self):
+        while True:
+            with self._lock:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if self._closed and not self._pending:
+                    return
+            if not self._closed:
+                time.sleep(self.flush_interval)  # let a batch accumulate
+            with self._lock:
+                batch, self._pending = self._pending, []
+                seq = self._queued
+            self._write(batch)
+            with self._lock:
+                self._written = seq
+                self._cond.notify_all()
+
+    def _write(self, spans):
+        data = ''.join(json.dumps(s, separators=(',', ':')) + '\n' for s in spans)
+        try:
+            with FileLock(self.path + ".lock"):
+                if os.path.exists(self.path) and os.path.getsize(self.path) > self.max_bytes:
+                    os.replace(self.path, self.path + ".1")
+                with open(self.path, 'a', encoding='utf-8') as f:
+                    f.write(data)
+        except OSError as e:
+            print(f"[TRACE] Could not write {self.path}: {e}", flush=True)
+
+    def flush(self):
+        """Block until every span queued so far has been written."""
+        with self._lock:
+            seq = self._queued
+            while self._written < seq and self._writer.is_alive():
+                self._cond.wait(timeout=1)
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._closed = True
+            self._cond.notify_all()
+        self._writer.join(timeout=5)
+
+    def recent(self, trace_id):
+        """Spans for `trace_id` written by this process lately (from memory)."""
+        with self._lock:
+            return [s for s in self._recent if s.get("trace_id") == trace_id]
+
+    def unreported(self, trace_id):
+        """recent() spans for `trace_id` not yet passed to mark_reported()."""
+        with self._lock:
+            return [s for s in self._recent
+                    if s.get("trace_id") == trace_id and s.get("span_id") not in self._reported]
+
+    def mark_reported(self, spans):
+        with self._lock:
+            self._reported.update(s.get("span_id") for s in spans)
+            if len(self._reported) > 2 * RECENT_SPANS:
+                # Forget ids whose spans have left recent() anyway
+                self._reported &= {s.get("span_id") for s in self._recent}
+
+    def spans(self, trace_id):
+        """Every logged span for `trace_id` (current and rotated log), oldest first.
+
+        Lines are found through an offset index per file, which only reads
+        what was appended (by any process) since the last call.
+        """
+        self.flush()
+        found = []
+        with self._index_lock:
+            for path in (self.path + ".1", self.path):
+                try:
+                    with open(path, 'rb') as f:
+                        index = self._file_index(path, f)
+                        for offset in index.offsets.get(trace_id, ()):
+                            f.seek(offset)
+                            try:
+                                span = json.loads(f.readline())
+                            except ValueError:
+                                continue
+                            if span.get("trace_id") == trace_id:
+                                found.append(span)
+                except FileNotFoundError:
+                    self._indexes.pop(path, None)
+        found.sort(key=lambda s: s.get("start", 0))
+        return found
+
+    def _file_index(self, path, f):
+        """Up-to-date index of `path`, open as `f`; caller holds _index_lock.
+
+        A rotation renames the current file to .1, so an index follows its
+        file (not its name) and is only rebuilt for a file it hasn't seen.
+        """
+        identity = (os.fstat(f.fileno()).st_ino, f.readline())
+        index = self._indexes.get(path)
+        if index is None or index.identity != identity:
+            index = next((i for i in self._indexes.values() if i.identity == identity), None) or _FileIndex(identity)
+            self._indexes[path] = index
+        index.extend(f)
+        return index
+
+
+def breakdown(trace_id, spans):
+    """End-to-end view of a trace: total time and each hop with the wait before it.
+
+    `offset_ms` is when the span started relative to the first span;
+    `wait_ms` is the idle time between the previous span's end and this
+    one's start (queueing, coalescing, network, clock skew).
+    """
+    if not spans:
+        return {"trace_id": trace_id, "spans": 0, "total_ms": None, "hops": []}
+    first = spans[0]["start"]
+    last_end = first
+    end = max(s["start"] + s.get("duration_ms", 0) / 1000 for s in spans)
+    hops = []
+    for s in spans:
+        hop_end = s["start"] + s.get("duration_ms", 0) / 1000
+        hops.append({
+            **{k: v for k, v in s.items() if k not in ("trace_id", "span_id", "start", "duration_ms")},
+            "offset_ms": round((s["start"] - first) * 1000, 1),
+            "wait_ms": round(max(0.0, s["start"] - last_end) * 1000, 1),
+            "duration_ms": s.get("duration_ms", 0),
+        })
+        last_end = max(last_end, hop_end)
+    return {
+        "trace_id": trace_id,
+        "started": first,
+        "spans": len(spans),
+        "total_ms": round((end - first) * 1000, 1),
+        "hops": hops,
+    }
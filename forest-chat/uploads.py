@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+🌲 Forest Chat Uploads - Content-addressed blob store for attachments
+Uploads are streamed to disk in fixed-size chunks while their SHA-256 is
+computed, then moved into place under a name derived from the hash, so
+the same file uploaded twice is stored once and its URL never changes.
+Large files can also be sent in resumable chunks through an upload session.
+"""
+
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+
+from locks import FileLock
+
+# Bytes read from the request per write
+CHUNK_SIZE = 64 * 1024
+
+# Unfinished upload sessions are discarded after this many seconds
+SESSION_TTL = 24 * 3600
+
+_EXT_RE = re.compile(r"^\.[a-z0-9]{1,10}$")
+_SESSION_RE = re.compile(r"^[0-9a-f]{32}$")
+
+
+class UploadError(ValueError):
+    """An upload the client has to fix; `status` is the HTTP status to answer with."""
+
+    def __init__(self, message, status=400, **details):
+        super().__init__(message)
+        self.status = status
+        self.details = details
+
+
+def blob_name(sha256, filename):
+    """Stored name for content with this hash: 32 hex digits plus the original extension."""
+    ext = os.path.splitext(filename or '')[1].lower()
+    return sha256[:32] + (ext if _EXT_RE.match(ext) else '')
+
+
+class BlobStore:
+    """Content-addressed files under `root`, plus resumable upload sessions.
+
+    Blobs are written to `root/.tmp` and renamed into `root` once their
+    hash is known, replacing any blob with that name (same content, so
+    the rename is idempotent and renews its mtime for upload GC). Sessions keep their partial data and metadata in
+    `root/.sessions`, so an interrupted upload can resume from the last
+    byte the hub received - even after a restart. Chunk writes hold a lock
+    file next to the session, so hub worker processes sharing `root`
+    never interleave them.
+    """
+
+    def __init__(self, root, max_size):
+        self.root = root
+        self.max_size = max_size
+        self.tmp_dir = os.path.join(root, ".tmp")
+        self.session_dir = os.path.join(root, ".sessions")
+        os.makedirs(self.tmp_dir, exist_ok=True)
+        os.makedirs(self.session_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._hashers = {}   # upload id -> (bytes hashed, running sha256) for sessions fed by this process
+        self._session_locks = {}
+
+    def _too_large(self):
+        return UploadError(f"File too large (max {self.max_size // 1024 // 1024}MB)", status=413)
+
+    def _store(self, tmp_path, sha256, size, filename):
+        """Move a fully written temp file into place; returns the upload record."""
+        name = blob_name(sha256, filename)
+        path = os.path.join(self.root, name)
+        deduplicated = os.path.exists(path)
+        # Always rename, even over an existing copy: upload GC may be removing
+        # that one right now, and the new mtime restarts its grace period.
+        os.replace(tmp_path, path)
+        return {
+            "filename": name,
+            "original_name": filename,
+            "size": size,
+            "sha256": sha256,
+            "deduplicated": deduplicated,
+        }
+
+    @staticmethod
+    def _verify(sha256, expected):
+        if expected and expected.lower() != sha256:
+            raise UploadError("Content hash does not match sha256", status=422, sha256=sha256)
+
+    def save_stream(self, stream, filename, expected_sha256=None):
+        """Stream `stream` to disk, hashing as it goes, and store it by content hash.
+
+        Raises UploadError (413) as soon as more than max_size bytes have
+        been read, and (422) if `expected_sha256` is given and doesn't match.
+        """
+        hasher = hashlib.sha256()
+        size = 0
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > self.max_size:
+                        raise self._too_large()
+                    hasher.update(chunk)
+                    f.write(chunk)
+            sha256 = hasher.hexdigest()
+            self._verify(sha256, expected_sha256)
+            return self._store(tmp_path, sha256, size, filename)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    # ---- resumable sessions ----
+
+    def _paths(self, upload_id):
+        if not _SESSION_RE.match(upload_id or ''):
+            raise UploadError("Unknown upload session", status=404)
+        base = os.path.join(self.session_dir, upload_id)
+        return base + ".json", base + ".part"
+
+    def _session_lock(self, upload_id):
+        with self._lock:
+            return self._session_locks.setdefault(upload_id, threading.Lock())
+
+    def create_session(self, filename, size, sha256=None):
+        """Start a resumable upload of `size` bytes; returns the session status."""
+        if not isinstance(size, int) or size < 0:
+            raise UploadError("'size' must be a non-negative integer")
+        if size > self.max_size:
+            raise self._too_large()
+        self.expire_sessions()
+        upload_id = uuid.uuid4().hex
+        meta_path, part_path = self._paths(upload_id)
+        meta = {"filename": filename, "size": size, "sha256": sha256, "created": time.time()}
+        open(part_path, 'wb').close()
+        with open(meta_path, 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        return {"upload_id": upload_id, "offset": 0, "size": size}
+
+    def _meta(self, upload_id):
+        meta_path, part_path = self._paths(upload_id)
+        try:
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                return json.load(f), meta_path, part_path
+        except FileNotFoundError:
+            raise UploadError("Unknown upload session", status=404)
+
+    def session_status(self, upload_id):
+        meta, _, part_path = self._meta(upload_id)
+        return {"upload_id": upload_id, "offset": os.path.getsize(part_path), "size": meta['size']}
+
+    def append_chunk(self, upload_id, offset, stream, length=None):
+        """Write the next chunk of a session, which must start at byte `offset`.
+
+        Returns the session status, with the stored upload record under
+        "upload" once the last byte has arrived. A chunk at the wrong
+        offset is rejected (409) with the offset to resume from; one whose
+        `length` (if known up front) overruns the declared size, before
+        any of it is read (413).
+        """
+        meta_path = self._meta(upload_id)[1]
+        lock_path = meta_path[:-len('.json')] + '.lock'
+        try:
+            with self._session_lock(upload_id), FileLock(lock_path):
+                return self._append_chunk(upload_id, offset, stream, length)
+        finally:
+            if not os.path.exists(meta_path):  # session finished; the lock is no longer needed
+                try:
+                    os.remove(lock_path)
+                except FileNotFoundError:
+                    pass
+
+    def _append_chunk(self, upload_id, offset, stream, length):
+        meta, meta_path, part_path = self._meta(upload_id)
+        current = os.path.getsize(part_path)
+        if offset != current:
+            raise UploadError("Chunk does not start at the current offset", status=409, offset=current)
+        if length is not None and current + length > meta['size']:
+            raise UploadError("Chunk runs past the declared size", status=413, offset=current)
+
+        hashed, hasher = self._hashers.get(upload_id, (None, None))
+        if hashed != current:
+            # First chunk this process has seen (or after a restart): catch up from disk.
+            hasher = hashlib.sha256()
+            with open(part_path, 'rb') as f:
+                for block in iter(lambda: f.read(CHUNK_SIZE), b''):
+                    hasher.update(block)
+
+        with open(part_path, 'ab') as f:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                if current + len(chunk) > meta['size']:
+                    raise UploadError("Chunk runs past the declared size", status=413, offset=current)
+                f.write(chunk)
+                hasher.update(chunk)
+                current += len(chunk)
+        self._hashers[upload_id] = (current, hasher)
+
+        status = {"upload_id": upload_id, "offset": current, "size": meta['size']}
+        if current < meta['size']:
+            return status
+
+        self._hashers.pop(upload_id, None)
+        self._session_locks.pop(upload_id, None)
+        sha256 = hasher.hexdigest()
+        try:
+            self._verify(sha256, meta.get('sha256'))
+            status["upload"] = self._store(part_path, sha256, current, meta['filename'])
+        finally:
+            for path in (meta_path, part_path):
+                if os.path.exists(path):
+                    os.remove(path)
+        return status
+
+    def expire_sessions(self, ttl=SESSION_TTL):
+        """Remove sessions started more than `ttl` seconds ago."""
+        cutoff = time.time() - ttl
+        for entry in os.scandir(self.session_dir):
+            if entry.name.endswith('.json') and entry.stat().st_mtime < cutoff:
+                base = entry.path[:-len('.json')]
+                for path in (entry.path, base + '.part', base + '.lock'):
+                    if os.path.exists(path):
+                        os.remove(path)
+                self._hashers.pop(os.path.basename(base), None)
+
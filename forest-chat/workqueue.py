@@ -0,0 +1,191 @@
+#!/usr/bin/env python3
+"""
+🌲 Forest Chat Work Queue - Crash-safe bridge work on local disk
+The bridge journals every message it takes from the hub, and every reply
+it still has to post back, in a small SQLite database. A message leaves
+the queue in the same transaction that stores its replies; a reply
+leaves it once the hub has accepted it. After a crash or reboot whatever
+is left is replayed, and failures are retried with exponential backoff,
+so nothing is re-sent by hand.
+
+Delivery is at-least-once: a reply whose POST succeeded just before a
+crash is sent again on restart.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS inbound (
+    id           INTEGER PRIMARY KEY,   -- hub message id
+    message      TEXT NOT NULL,         -- the message as received (JSON)
+    received     REAL NOT NULL,
+    attempts     INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_inbound_due ON inbound(next_attempt);
+
+CREATE TABLE IF NOT EXISTS outbound (
+    seq          INTEGER PRIMARY KEY AUTOINCREMENT,
+    recipient    TEXT NOT NULL,
+    message      TEXT NOT NULL,
+    trace_id     TEXT,
+    created      REAL NOT NULL,
+    attempts     INTEGER NOT NULL DEFAULT 0,
+    next_attempt REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_outbound_due ON outbound(next_attempt);
+"""
+
+# First retry delay in seconds; doubles per attempt up to BACKOFF_MAX
+BACKOFF = float(os.environ.get("FOREST_QUEUE_BACKOFF", "2"))
+BACKOFF_MAX = float(os.environ.get("FOREST_QUEUE_BACKOFF_MAX", "300"))
+
+# Handling attempts per message before it is given up (OpenClaw down or never answering)
+MAX_ATTEMPTS = int(os.environ.get("FOREST_QUEUE_MAX_ATTEMPTS", "5"))
+
+# Replies the hub hasn't accepted after this many seconds are dropped
+REPLY_TTL = float(os.environ.get("FOREST_QUEUE_REPLY_TTL", str(7 * 86400)))
+
+# Seconds a newly queued reply is left to the caller's immediate send
+# before the drain may pick it up (longer than one POST can take)
+SEND_RESERVATION = 30
+
+
+class WorkQueue:
+    """Inbound messages and outbound replies of one bridge, at `path`.
+
+    One connection shared by the bridge's threads under a lock; commits
+    are fsynced (synchronous=FULL) so a power cut keeps them.
+    """
+
+    def __init__(self, path, backoff=BACKOFF, backoff_max=BACKOFF_MAX,
+                 max_attempts=MAX_ATTEMPTS, reply_ttl=REPLY_TTL):
+        self.path = path
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.max_attempts = max_attempts
+        self.reply_ttl = reply_ttl
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=FULL")
+        self._db.executescript(SCHEMA)
+
+    def _delay(self, attempts):
+        return min(self.backoff_max, self.backoff * 2 ** max(0, attempts - 1))
+
+    def _transaction(self, fn):
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self._db)
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+            self._db.execute("COMMIT")
+            return result
+
+    # Inbound messages
+
+    def add_message(self, msg):
+        """Journal a message taken from the hub (ignored if already queued)."""
+        now = time.time()
+        self._transaction(lambda db: db.execute(
+            "INSERT OR IGNORE INTO inbound (id, message, received, next_attempt) VALUES (?, ?, ?, ?)",
+            (msg["id"], json.dumps(msg), now, now)))
+
+    def due_messages(self, limit=100):
+        """Queued messages whose next attempt is due, oldest first."""
+        with self._lock:
+            rows = self._db.execute("SELECT message FROM inbound WHERE next_attempt <= ? ORDER BY id LIMIT ?",
+                                    (time.time(), limit)).fetchall()
+        return [json.loads(r["message"]) for r in rows]
+
+    def retry_messages(self, ids):
+        """Schedule another attempt for messages that failed. Returns the ids
+        still queued; the rest used up MAX_ATTEMPTS and were dropped.
+        """
+        def retry(db):
+            kept = set()
+            for msg_id in ids:
+                row = db.execute("SELECT attempts FROM inbound WHERE id = ?", (msg_id,)).fetchone()
+                if row is None:
+                    continue
+                attempts = row["attempts"] + 1
+                if attempts >= self.max_attempts:
+                    db.execute("DELETE FROM inbound WHERE id = ?", (msg_id,))
+                    print(f"[QUEUE] Giving up on message #{msg_id} after {attempts} attempts", flush=True)
+                    continue
+                db.execute("UPDATE inbound SET attempts = ?, next_attempt = ? WHERE id = ?",
+                           (attempts, time.time() + self._delay(attempts), msg_id))
+                kept.add(msg_id)
+            return kept
+        return self._transaction(retry)
+
+    def complete(self, ids, replies):
+        """Retire handled messages and queue their replies, atomically.
+
+        `replies` are {"to", "message", "trace_id"} dicts. Returns them as
+        queued rows, reserved for one immediate send by the caller: the
+        drain only picks them up after SEND_RESERVATION seconds.
+        """
+        now = time.time()
+
+        def complete(db):
+            db.executemany("DELETE FROM inbound WHERE id = ?", [(i,) for i in ids if i is not None])
+            rows = []
+            for reply in replies:
+                cur = db.execute(
+                    "INSERT INTO outbound (recipient, message, trace_id, created, next_attempt) VALUES (?, ?, ?, ?, ?)",
+                    (reply["to"], reply["message"], reply.get("trace_id"), now, now + SEND_RESERVATION))
+                rows.append({"seq": cur.lastrowid, "to": reply["to"], "message": reply["message"],
+                             "trace_id": reply.get("trace_id"), "attempts": 0})
+            return rows
+        return self._transaction(complete)
+
+    # Outbound replies
+
+    def due_replies(self, limit=100):
+        """Queued replies whose next send attempt is due, oldest first."""
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT seq, recipient, message, trace_id, attempts FROM outbound "
+                "WHERE next_attempt <= ? ORDER BY seq LIMIT ?", (time.time(), limit)).fetchall()
+        return [{"seq": r["seq"], "to": r["recipient"], "message": r["message"],
+                 "trace_id": r["trace_id"], "attempts": r["attempts"]} for r in rows]
+
+    def reply_sent(self, seq):
+        self._transaction(lambda db: db.execute("DELETE FROM outbound WHERE seq = ?", (seq,)))
+
+    def reply_failed(self, seq):
+        """Back off before the next attempt. Returns False if the reply expired and was dropped."""
+        def failed(db):
+            row = db.execute("SELECT created, attempts FROM outbound WHERE seq = ?", (seq,)).fetchone()
+            if row is None:
+                return False
+            if time.time() - row["created"] > self.reply_ttl:
+                db.execute("DELETE FROM outbound WHERE seq = ?", (seq,))
+                print(f"[QUEUE] Dropping reply {seq}: not accepted for {self.reply_ttl:.0f}s", flush=True)
+                return False
+            attempts = row["attempts"] + 1
+            db.execute("UPDATE outbound SET attempts = ?, next_attempt = ? WHERE seq = ?",
+                       (attempts, time.time() + self._delay(attempts), seq))
+            return True
+        return self._transaction(failed)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "messages": self._db.execute("SELECT COUNT(*) FROM inbound").fetchone()[0],
+                "replies": self._db.execute("SELECT COUNT(*) FROM outbound").fetchone()[0],
+            }
+
+    def close(self):
+        with self._lock:
+            self._db.close()